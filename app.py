@@ -1,10 +1,11 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, g, has_request_context, has_app_context, Response, send_from_directory, abort, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from datetime import datetime, timedelta
 import os
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta, timezone, date
 import random
 from groq import Groq
 import google.generativeai as genai
@@ -16,7 +17,56 @@ from PIL import Image
 import io
 import cv2
 import numpy as np
-from sqlalchemy import text
+from sqlalchemy import text, select, delete, func, event, and_, or_, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+import sqlite3
+import threading
+import time
+import queue
+import sys
+import mimetypes
+import uuid
+import atexit
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from types import SimpleNamespace
+from collections import deque
+
+import math
+import gzip
+import zlib
+import zipfile
+import signal
+import hmac
+import marshal
+import cProfile
+import pstats
+import gc
+import resource
+import tracemalloc
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Load environment variables
 load_dotenv()
@@ -95,11 +145,39 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_size': 5,
     'max_overflow': 2,
     'pool_timeout': 30,
-    'connect_args': {
+}
+
+# libpq-only connect args; sqlite3.connect() rejects them
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = {
         'connect_timeout': 10,
         'application_name': 'homie_ai',
     }
-}
+
+# Read replicas: comma-separated URLs, each registered as its own bind with
+# its own pool; see READ REPLICAS for how requests are routed to them
+def get_replica_urls():
+    urls = []
+    for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(','):
+        url = url.strip()
+        if url.startswith('postgres://'):
+            url = url.replace('postgres://', 'postgresql://', 1)
+        if url:
+            urls.append(url)
+    return urls
+
+REPLICA_BINDS = []
+replica_binds = {}
+for index, replica_url in enumerate(get_replica_urls()):
+    options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], url=replica_url,
+                   pool_size=int(os.environ.get('REPLICA_POOL_SIZE', 5)), max_overflow=2)
+    if not replica_url.startswith('postgresql'):
+        options.pop('connect_args', None)
+    replica_binds[f'replica{index}'] = options
+    REPLICA_BINDS.append(f'replica{index}')
+if replica_binds:
+    app.config['SQLALCHEMY_BINDS'] = replica_binds
+    print(f"📚 Read replicas configured: {len(replica_binds)}")
 
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -109,7 +187,36 @@ os.makedirs('instance', exist_ok=True)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # ===== CRITICAL FIX: INITIALIZE DATABASE =====
-db = SQLAlchemy(app)
+class RoutingSession(FlaskSQLAlchemySession):
+    """Sends a request's queries to the replica it was routed to; flushes always go to the primary"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('db_replica')
+            if replica is not None:
+                return db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+# Under gunicorn's gevent worker psycopg2 must yield to the event loop while
+# it waits on the server, or one slow query stalls every connection
+try:
+    from gevent import monkey as gevent_monkey
+    if gevent_monkey.is_module_patched('socket'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+        print("🟢 psycopg2 patched for gevent")
+except ImportError:
+    pass
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 # ===== INITIALIZE AI CLIENTS =====
 groq_api_key = os.environ.get('GROQ_API_KEY')
@@ -117,8 +224,15 @@ if not groq_api_key:
     print("⚠️ WARNING: GROQ_API_KEY not found in environment variables")
 groq_client = Groq(api_key=groq_api_key) if groq_api_key else None
 
+# GROQ_BASE_URL is read by the Groq SDK itself; GOOGLE_API_ENDPOINT points
+# Gemini at a local stand-in (see fake_providers.py) for benchmarking
 google_api_key = os.environ.get('GOOGLE_API_KEY')
-if google_api_key:
+google_api_endpoint = os.environ.get('GOOGLE_API_ENDPOINT')
+if google_api_key and google_api_endpoint:
+    genai.configure(api_key=google_api_key, transport='rest',
+                    client_options={'api_endpoint': google_api_endpoint})
+    print(f"✅ Google Gemini configured (endpoint: {google_api_endpoint})")
+elif google_api_key:
     genai.configure(api_key=google_api_key)
     print("✅ Google Gemini configured")
 else:
@@ -127,7 +241,722 @@ else:
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 ALLOWED_VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'webm'}
 
+# ===== STRUCTURED LOGGING =====
+# Request paths log through log_event(), which only enqueues; a background
+# thread serializes and writes JSON lines, so a slow stdout never blocks a
+# request. Noisy events can be sampled or rate limited below.
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+LOG_LEVEL = LOG_LEVELS.get(os.environ.get('LOG_LEVEL', 'info').lower(), 20)
+LOG_MAX_FIELD_CHARS = int(os.environ.get('LOG_MAX_FIELD_CHARS', 500))
+LOG_QUEUE_SIZE = 10000
+
+# event -> probability of keeping the event
+LOG_SAMPLING = {
+    'history.loaded': float(os.environ.get('LOG_SAMPLE_HISTORY', 0.1)),
+    'request.completed': float(os.environ.get('LOG_SAMPLE_REQUESTS', 1.0)),
+}
+
+# event -> (max events, per window in seconds)
+LOG_RATE_LIMITS = {
+    'memory.json_parse_failed': (5, 60),
+    'summary.json_parse_failed': (5, 60),
+    'db.connection_error': (10, 60),
+    'admission.backend_error': (5, 60),
+}
+
+class StructuredLogger:
+    """Non-blocking JSON-lines logger backed by a bounded queue and a writer thread"""
+    
+    def __init__(self, stream=None):
+        self.stream = stream
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._suppressed = {}
+        self._dropped = 0
+        self._pid = None
+    
+    def _ensure_writer(self):
+        # Started lazily and per process so forked gunicorn workers each get one
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+            threading.Thread(target=self._drain, name='log-writer', daemon=True).start()
+            self._pid = os.getpid()
+    
+    def _allowed(self, event):
+        rate = LOG_SAMPLING.get(event)
+        if rate is not None and random.random() >= rate:
+            return False
+        
+        limit = LOG_RATE_LIMITS.get(event)
+        if limit is None:
+            return True
+        max_events, window = limit
+        now = time.monotonic()
+        with self._lock:
+            start, count = self._windows.get(event, (now, 0))
+            if now - start >= window:
+                suppressed = self._suppressed.pop(event, 0)
+                if suppressed:
+                    self._put({'event': 'log.suppressed', 'level': 'warning', 'suppressed_event': event, 'count': suppressed})
+                start, count = now, 0
+            if count >= max_events:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return False
+            self._windows[event] = (start, count + 1)
+        return True
+    
+    @staticmethod
+    def _truncate(value):
+        if isinstance(value, str) and len(value) > LOG_MAX_FIELD_CHARS:
+            return value[:LOG_MAX_FIELD_CHARS] + f"...(+{len(value) - LOG_MAX_FIELD_CHARS} chars)"
+        if isinstance(value, BaseException):
+            return StructuredLogger._truncate(f"{type(value).__name__}: {value}")
+        return value
+    
+    def _put(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
+    
+    def log(self, event, level='info', **fields):
+        if LOG_LEVELS.get(level, 20) < LOG_LEVEL or not self._allowed(event):
+            return
+        self._ensure_writer()
+        
+        record = {
+            'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'level': level,
+            'event': event,
+            'pid': os.getpid(),
+        }
+        if has_request_context() and 'request_id' in g:
+            record['request_id'] = g.request_id
+        for key, value in fields.items():
+            record[key] = self._truncate(value)
+        self._put(record)
+    
+    def _drain(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            taken = len(batch)
+            if self._dropped:
+                dropped, self._dropped = self._dropped, 0
+                batch.append({'event': 'log.dropped', 'level': 'warning', 'count': dropped})
+            
+            stream = self.stream or sys.stdout
+            try:
+                stream.write("".join(json.dumps(r, default=str, ensure_ascii=False) + "\n" for r in batch))
+                stream.flush()
+            except Exception:
+                pass
+            for _ in range(taken):
+                self._queue.task_done()
+    
+    def flush(self, timeout=2.0):
+        """Best-effort wait for queued records to be written (used at exit)"""
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+structured_logger = StructuredLogger()
+log_event = structured_logger.log
+atexit.register(structured_logger.flush)
+
+# ===== INSTRUMENTATION =====
+# Metrics live in-process, so each gunicorn worker exposes its own series;
+# Prometheus tells them apart by the scraped instance.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class MetricsRegistry:
+    """Minimal thread-safe Prometheus registry (counters and histograms)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+    
+    def describe(self, name, kind, help_text):
+        self.help[name] = (kind, help_text)
+    
+    def inc(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    hist['buckets'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+    
+    def render(self, extra_gauges=None):
+        """Render all series in the Prometheus text exposition format"""
+        def fmt_labels(labels):
+            if not labels:
+                return ''
+            parts = []
+            for k, v in labels:
+                escaped = str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                parts.append(f'{k}="{escaped}"')
+            return '{' + ','.join(parts) + '}'
+        
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: {'buckets': list(v['buckets']), 'sum': v['sum'], 'count': v['count']}
+                          for k, v in self.histograms.items()}
+        
+        lines = []
+        emitted = set()
+        
+        def header(name):
+            if name not in emitted and name in self.help:
+                kind, help_text = self.help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            emitted.add(name)
+        
+        for (name, labels), value in sorted(counters.items()):
+            header(name)
+            lines.append(f"{name}{fmt_labels(labels)} {value}")
+        
+        for (name, labels), hist in sorted(histograms.items()):
+            header(name)
+            for bound, count in zip(LATENCY_BUCKETS, hist['buckets']):
+                lines.append(f"{name}_bucket{fmt_labels(labels + (('le', repr(bound)),))} {count}")
+            lines.append(f"{name}_bucket{fmt_labels(labels + (('le', '+Inf'),))} {hist['count']}")
+            lines.append(f"{name}_sum{fmt_labels(labels)} {hist['sum']:.6f}")
+            lines.append(f"{name}_count{fmt_labels(labels)} {hist['count']}")
+        
+        for name, labels, value in (extra_gauges or []):
+            header(name)
+            lines.append(f"{name}{fmt_labels(tuple(sorted(labels.items())))} {value}")
+        
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+metrics.describe('homie_requests_total', 'counter', 'HTTP requests by endpoint, method and status')
+metrics.describe('homie_request_duration_seconds', 'histogram', 'HTTP request latency by endpoint')
+metrics.describe('homie_phase_duration_seconds', 'histogram', 'Time spent in named phases of a request')
+metrics.describe('homie_llm_tokens_total', 'counter', 'LLM tokens used, by model, purpose and kind')
+metrics.describe('homie_llm_requests_total', 'counter', 'LLM provider calls by provider, model and purpose')
+metrics.describe('homie_db_pool_connections', 'gauge', 'SQLAlchemy pool connections by role and state')
+metrics.describe('homie_db_replica_lag_seconds', 'gauge', 'Last measured replication lag per replica (-1 = unavailable)')
+metrics.describe('homie_db_reads_total', 'counter', 'Routed read requests by database role and reason')
+metrics.describe('homie_idempotent_replays_total', 'counter', 'Duplicate submissions answered from an idempotency record')
+metrics.describe('homie_admission_rejected_total', 'counter', 'Requests shed by admission control, by endpoint and reason')
+metrics.describe('homie_media_screen_total', 'counter', 'Uploads by pre-screening verdict (ok, blank, dark, blurry, duplicate)')
+metrics.describe('homie_prewarm_total', 'counter', 'Context prewarm requests by outcome')
+metrics.describe('homie_prewarm_lookups_total', 'counter', 'Chat turns by whether a prewarmed context was used (hit, miss, stale)')
+metrics.describe('homie_safe_space_seconds', 'histogram', 'Safe-space turn latency from request start, by kind (reply, first_token)')
+metrics.describe('homie_safe_space_turns_total', 'counter', 'Safe-space turns by whether they met SAFE_SPACE_SLO_SECONDS')
+metrics.describe('homie_profiles_captured_total', 'counter', 'Requests captured with cProfile, by endpoint and trigger')
+metrics.describe('homie_process_memory_bytes', 'gauge', 'Worker memory by kind (rss, pss, uss, shared)')
+
+def current_endpoint():
+    """Route template for the active request (keeps label cardinality bounded)"""
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.rule
+    return 'background' if not has_request_context() else 'unmatched'
+
+@contextmanager
+def timed_phase(name):
+    """Time a named phase; feeds the Server-Timing header and the phase histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe('homie_phase_duration_seconds', elapsed, {'endpoint': current_endpoint(), 'phase': name})
+        if has_request_context():
+            timings = g.setdefault('phase_timings', {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def record_llm_usage(completion, purpose, model):
+    """Count provider calls and token usage from a Groq completion"""
+    metrics.inc('homie_llm_requests_total', {'provider': 'groq', 'model': model, 'purpose': purpose})
+    usage = getattr(completion, 'usage', None)
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        count = getattr(usage, kind, None)
+        if count:
+            metrics.inc('homie_llm_tokens_total', {'model': model, 'purpose': purpose, 'kind': kind[:-7]}, count)
+
+def db_pool_gauges():
+    gauges = []
+    for role in [None] + REPLICA_BINDS:
+        pool = db.engines[role].pool
+        for state, getter in (('size', 'size'), ('checked_out', 'checkedout'), ('checked_in', 'checkedin'), ('overflow', 'overflow')):
+            if hasattr(pool, getter):
+                try:
+                    gauges.append(('homie_db_pool_connections', {'role': role or 'primary', 'state': state}, getattr(pool, getter)()))
+                except Exception:
+                    pass
+    for bind, lag in _replica_lag.items():
+        gauges.append(('homie_db_replica_lag_seconds', {'replica': bind}, lag[0] if lag[0] != float('inf') else -1))
+    return gauges
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.phase_timings = {}
+    g.request_id = request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex[:16]
+
+@app.after_request
+def add_server_timing(response):
+    start = g.get('request_start')
+    if start is None:
+        return response
+    
+    total = time.perf_counter() - start
+    endpoint = current_endpoint()
+    metrics.observe('homie_request_duration_seconds', total, {'endpoint': endpoint, 'method': request.method})
+    metrics.inc('homie_requests_total', {'endpoint': endpoint, 'method': request.method, 'status': response.status_code})
+    
+    phases = g.get('phase_timings', {})
+    timings = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in phases.items()]
+    timings.append(f"total;dur={total * 1000:.1f}")
+    response.headers['Server-Timing'] = ", ".join(timings)
+    response.headers['X-Request-ID'] = g.request_id
+    
+    log_event('request.completed', endpoint=endpoint, method=request.method, status=response.status_code,
+              duration_ms=round(total * 1000, 1),
+              phases_ms={name: round(elapsed * 1000, 1) for name, elapsed in phases.items()})
+    return response
+
+# ===== PROFILING =====
+# Opt-in, per worker. A request is captured with cProfile when it carries
+# X-Profile-Token matching PROFILING_TOKEN or falls in PROFILE_SAMPLE_RATE;
+# STACK_SAMPLER=1 keeps a statistical sampler running that aggregates
+# collapsed stacks. Both are read back from the /api/admin/profile endpoints
+# (which also need the token). With everything off the only cost is one
+# flag check per request.
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_ENDPOINTS = {name for name in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if name}
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))
+STACK_SAMPLER_ENABLED = os.environ.get('STACK_SAMPLER', '0') == '1'
+STACK_SAMPLER_INTERVAL = float(os.environ.get('STACK_SAMPLER_INTERVAL', 0.01))
+STACK_SAMPLER_MAX_STACKS = int(os.environ.get('STACK_SAMPLER_MAX_STACKS', 10000))
+STACK_SAMPLER_MAX_DEPTH = 64
+REQUEST_PROFILING_ENABLED = bool(PROFILING_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+profile_captures = deque(maxlen=PROFILE_KEEP)
+# cProfile hooks the whole thread, and under gevent every greenlet shares
+# it, so only one request per worker is captured at a time
+_profile_capture_lock = threading.Lock()
+
+def profiling_token_valid(token):
+    return bool(PROFILING_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), PROFILING_TOKEN.encode())
+
+class StackSampler:
+    """
+    Statistical profiler aggregating collapsed stacks ("root;outer;inner count"),
+    each rooted at the endpoint being served (or the thread name).
+    Under gevent every greenlet runs on the main thread, so SIGPROF fires every
+    interval of CPU time and records whichever frame it interrupted. Otherwise
+    a thread samples every other thread's stack in wall-clock time.
+    """
+    
+    def __init__(self, interval, max_stacks, max_depth):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.counts = {}
+        self.samples = 0
+        self.endpoints = {}  # thread ident -> endpoint it is serving (thread mode)
+        self.mode = None
+        self._pid = None
+        self._handler_pid = None
+        self._stop = None
+        self._lock = threading.Lock()
+    
+    @property
+    def running(self):
+        return self._pid == os.getpid()
+    
+    def start(self):
+        if self.running:
+            return
+        with self._lock:
+            if self.running:
+                return
+            if greenlet_worker() and self._install_handler():
+                signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+                self.mode = 'signal'
+            else:
+                self._stop = threading.Event()
+                threading.Thread(target=self._run, args=(self._stop,), name='stack-sampler', daemon=True).start()
+                self.mode = 'thread'
+            self._pid = os.getpid()
+    
+    def stop(self):
+        with self._lock:
+            if not self.running:
+                return
+            if self.mode == 'signal':
+                signal.setitimer(signal.ITIMER_PROF, 0)
+            else:
+                self._stop.set()
+            self._pid = None
+    
+    def reset(self):
+        self.counts = {}
+        self.samples = 0
+    
+    def snapshot(self):
+        # dict() of a dict copies in C, so the signal handler can't interleave
+        return dict(self.counts)
+    
+    def _install_handler(self):
+        if self._handler_pid == os.getpid():
+            return True
+        try:
+            signal.signal(signal.SIGPROF, self._on_signal)
+        except (AttributeError, ValueError):
+            return False  # no SIGPROF on this platform
+        self._handler_pid = os.getpid()
+        return True
+    
+    def _on_signal(self, signum, frame):
+        if frame is not None:
+            self._record(frame, (request.endpoint or 'unmatched') if has_request_context() else 'no_request')
+    
+    def _run(self, stop):
+        me = threading.get_ident()
+        while not stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self._record(frame, self.endpoints.get(ident) or names.get(ident, 'thread'))
+    
+    def _record(self, frame, root):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+            frame = frame.f_back
+        stack.append(root)
+        key = ';'.join(reversed(stack))
+        if key not in self.counts and len(self.counts) >= self.max_stacks:
+            key = f"{root};[other]"
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+stack_sampler = StackSampler(STACK_SAMPLER_INTERVAL, STACK_SAMPLER_MAX_STACKS, STACK_SAMPLER_MAX_DEPTH)
+
+def greenlet_worker():
+    try:
+        from gevent import monkey as gevent_monkey
+    except ImportError:
+        return False
+    return gevent_monkey.is_module_patched('threading')
+
+def collapsed_stacks(counts):
+    """Brendan Gregg's folded format, ready for flamegraph.pl or speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+@app.before_request
+def start_request_profile():
+    if STACK_SAMPLER_ENABLED:
+        stack_sampler.start()
+    if stack_sampler.mode == 'thread' and stack_sampler.running:
+        stack_sampler.endpoints[threading.get_ident()] = request.endpoint or 'unmatched'
+    if not REQUEST_PROFILING_ENABLED or (request.endpoint or '').startswith('profile_'):
+        return
+    if PROFILE_ENDPOINTS and request.endpoint not in PROFILE_ENDPOINTS:
+        return
+    if profiling_token_valid(request.headers.get('X-Profile-Token')):
+        trigger = 'header'
+    elif random.random() < PROFILE_SAMPLE_RATE:
+        trigger = 'sampled'
+    else:
+        return
+    if not _profile_capture_lock.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    g.profile = {'id': uuid.uuid4().hex[:12], 'trigger': trigger, 'profiler': profiler, 'start': time.perf_counter()}
+    profiler.enable()
+
+@app.after_request
+def finish_request_profile(response):
+    capture = g.pop('profile', None)
+    if capture is None:
+        return response
+    capture.update(request_id=g.get('request_id'), endpoint=request.endpoint or 'unmatched',
+                   method=request.method, path=request.path, status=response.status_code)
+    response.headers['X-Profile-Id'] = capture['id']
+    
+    def finish():
+        # Runs once the body is sent so streamed responses are covered too
+        capture['profiler'].disable()
+        _profile_capture_lock.release()
+        capture['duration_ms'] = round((time.perf_counter() - capture.pop('start')) * 1000, 1)
+        capture['captured_at'] = datetime.now(timezone.utc).isoformat()
+        profile_captures.append(capture)
+        metrics.inc('homie_profiles_captured_total', {'endpoint': capture['endpoint'], 'trigger': capture['trigger']})
+        log_event('profile.captured', profile_id=capture['id'], endpoint=capture['endpoint'],
+                  trigger=capture['trigger'], duration_ms=capture['duration_ms'])
+    response.call_on_close(finish)
+    return response
+
+@app.teardown_request
+def clear_sampler_endpoint(exc):
+    if stack_sampler.endpoints:
+        stack_sampler.endpoints.pop(threading.get_ident(), None)
+
+def require_profiling_token(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not PROFILING_TOKEN:
+            abort(404)
+        if not profiling_token_valid(request.headers.get('X-Profile-Token')):
+            return jsonify({'error': 'Invalid profiling token'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+# ===== PRELOAD & MEMORY TELEMETRY =====
+# With gunicorn's preload_app (see gunicorn.conf.py) this module is imported
+# once in the master and workers share its pages copy-on-write. Connections
+# opened during import must not be shared, so every forked child drops its
+# inherited pools and reconnects on first use. TRACEMALLOC=<frames> traces
+# allocations from import onwards for /api/admin/memory (costs memory and CPU).
+TRACEMALLOC_FRAMES = int(os.environ.get('TRACEMALLOC', 0))
+if TRACEMALLOC_FRAMES and not tracemalloc.is_tracing():
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+
+_loaded_pid = os.getpid()
+
+def _reset_db_after_fork():
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_reset_db_after_fork)
+
+def process_memory():
+    """RSS, PSS, USS and shared bytes for this process (Linux /proc, else peak RSS only)"""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                parts = value.split()
+                if len(parts) == 2 and parts[1] == 'kB':
+                    fields[name] = int(parts[0]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    if not fields:
+        return {'peak_rss': peak}
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'shared': fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+        'swap': fields.get('Swap', 0),
+        'peak_rss': peak,
+    }
+
+def memory_gauges():
+    return [('homie_process_memory_bytes', {'kind': kind}, value)
+            for kind, value in process_memory().items() if kind in ('rss', 'pss', 'uss', 'shared')]
+
+def tracemalloc_top(limit, key_type='lineno'):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    stats = snapshot.statistics(key_type)
+    return [{
+        'site': ' <- '.join(f"{frame.filename}:{frame.lineno}" for frame in reversed(stat.traceback)) if key_type == 'traceback'
+                else str(stat.traceback[0]) if key_type == 'lineno' else stat.traceback[0].filename,
+        'size_bytes': stat.size,
+        'count': stat.count,
+    } for stat in stats[:limit]]
+
+# ===== RESPONSE COMPRESSION =====
+# Compresses JSON, HTML and event-stream bodies with brotli or gzip per
+# Accept-Encoding. Buffered bodies under COMPRESS_MIN_BYTES are left alone;
+# large ones drop to the fastest levels. At most COMPRESS_CONCURRENCY bodies
+# are compressed at once per worker: when all slots are busy the response goes
+# out uncompressed rather than waiting. Streamed bodies are compressed chunk by
+# chunk with a sync flush so every event still reaches the client immediately.
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LARGE_BYTES = 1024 * 1024
+COMPRESS_CONCURRENCY = int(os.environ.get('COMPRESS_CONCURRENCY', 2))
+COMPRESS_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+COMPRESS_STREAM_MIMETYPES = {'text/event-stream', 'application/x-ndjson'}
+# (normal, large body) levels
+GZIP_LEVELS = (6, 1)
+BROTLI_QUALITIES = (5, 1)
+
+compression_slots = threading.BoundedSemaphore(COMPRESS_CONCURRENCY)
+metrics.describe('homie_compression_bytes_total', 'counter', 'Response bytes before (in) and after (out) compression')
+metrics.describe('homie_compression_skipped_total', 'counter', 'Compressible responses sent uncompressed, by reason')
+
+def choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_body(data, encoding):
+    large = len(data) >= COMPRESS_LARGE_BYTES
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITIES[large], mode=brotli.MODE_TEXT)
+    return gzip.compress(data, compresslevel=GZIP_LEVELS[large], mtime=0)
+
+def compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITIES[0], mode=brotli.MODE_TEXT)
+        feed, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVELS[0], zlib.DEFLATED, 31)  # wbits=31: gzip container
+        feed, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    try:
+        for chunk in chunks:
+            yield feed(chunk.encode('utf-8') if isinstance(chunk, str) else chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304) or request.method == 'HEAD'):
+        return response
+    
+    streamed = response.is_streamed
+    if response.mimetype not in (COMPRESS_STREAM_MIMETYPES if streamed else COMPRESS_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+    
+    if streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers['Content-Encoding'] = encoding
+        return response
+    
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    if not compression_slots.acquire(blocking=False):
+        metrics.inc('homie_compression_skipped_total', {'reason': 'busy'})
+        return response
+    try:
+        with timed_phase('compress'):
+            compressed = compress_body(data, encoding)
+    finally:
+        compression_slots.release()
+    
+    metrics.inc('homie_compression_bytes_total', {'encoding': encoding, 'direction': 'in'}, len(data))
+    metrics.inc('homie_compression_bytes_total', {'encoding': encoding, 'direction': 'out'}, len(compressed))
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+# ===== STATIC ASSETS =====
+# build_assets.py writes content-hashed files to static/dist/ plus a manifest.
+# Without a build (local dev) asset_url() falls back to the plain files.
+ASSET_DIST_DIR = os.path.join(app.static_folder, 'dist')
+ASSET_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def load_asset_manifest():
+    try:
+        with open(os.path.join(ASSET_DIST_DIR, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+asset_manifest = load_asset_manifest()
+if asset_manifest:
+    print(f"🎨 Loaded asset manifest ({len(asset_manifest)} assets)")
+
+def asset_url(filename):
+    """URL for a static asset, using its fingerprinted build when available"""
+    entry = asset_manifest.get(filename)
+    if entry:
+        return url_for('static_dist', filename=entry['file'])
+    return url_for('static', filename=filename)
+
+def background_style(filename):
+    """Inline background-image declarations, preferring WebP/AVIF variants"""
+    style = f"background-image: url('{asset_url(filename)}')"
+    variants = asset_manifest.get(filename, {}).get('variants')
+    if variants:
+        variant_types = {'avif': 'image/avif', 'webp': 'image/webp'}
+        options = [f"url('{url_for('static_dist', filename=path)}') type('{variant_types[ext]}')"
+                   for ext, path in sorted(variants.items())]
+        options.append(f"url('{asset_url(filename)}') type('image/jpeg')")
+        style += f"; background-image: image-set({', '.join(options)})"
+    return style
+
+app.jinja_env.globals.update(asset_url=asset_url, background_style=background_style)
+
+@app.route('/static/dist/<path:filename>')
+def static_dist(filename):
+    """Serve fingerprinted assets, using precompressed siblings when accepted"""
+    if filename.endswith(('.gz', '.br')) or filename == 'manifest.json':
+        abort(404)
+    
+    accepted = request.accept_encodings
+    served_name, encoding = filename, None
+    for suffix, name in (('.br', 'br'), ('.gz', 'gzip')):
+        if accepted[name] and os.path.isfile(os.path.join(ASSET_DIST_DIR, filename + suffix)):
+            served_name, encoding = filename + suffix, name
+            break
+    
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = send_from_directory(ASSET_DIST_DIR, served_name, mimetype=mimetype, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+    return response
+
 # ===== UTILITY FUNCTIONS =====
+def _select_backend(env_var, classes, default='memory'):
+    """
+    Instantiate the backend named by env_var from classes ({'redis': ..., 'database': ..., 'memory': ...}).
+    Unset, it is 'redis' when REDIS_URL is set and default otherwise; the redis class gets REDIS_URL.
+    """
+    redis_url = os.environ.get('REDIS_URL')
+    kind = os.environ.get(env_var, 'redis' if redis_url else default).lower()
+    if kind == 'redis' and (redis is None or not redis_url):
+        log_event('backend.redis_unavailable', level='warning', setting=env_var, fallback=default)
+        kind = default
+    elif kind not in classes:
+        log_event('backend.unknown', level='warning', setting=env_var, kind=kind, fallback=default)
+        kind = default
+    backend = classes[kind](redis_url) if kind == 'redis' else classes[kind]()
+    log_event('backend.selected', setting=env_var, backend=type(backend).__name__)
+    return backend
+
 def check_database_connection():
     """Check if database connection is working with proper error handling"""
     try:
@@ -135,7 +964,7 @@ def check_database_connection():
         db.session.commit()
         return True
     except Exception as e:
-        print(f"❌ Database connection error: {e}")
+        log_event('db.connection_error', level='error', error=e)
         try:
             db.session.rollback()
         except:
@@ -154,24 +983,15 @@ def encode_image_to_base64(image_path):
     with open(image_path, 'rb') as img_file:
         return base64.b64encode(img_file.read()).decode('utf-8')
 
-def extract_video_frame(video_path, frame_position=0.3):
-    """Extract a frame from video at given position (0-1)"""
+def read_video_frame(video_path, frame_position=0.3):
+    """Decode the frame at a given position (0-1) as an RGB array, or None"""
     cap = cv2.VideoCapture(video_path)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     frame_number = int(total_frames * frame_position)
     cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
     ret, frame = cap.read()
     cap.release()
-    
-    if ret:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(frame)
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr.seek(0)
-        return base64.b64encode(img_byte_arr.read()).decode('utf-8')
-    
-    return None
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if ret else None
 
 def analyze_image_with_gemini(image_path, user_message=""):
     """Analyze image using Google Gemini - FREE and very accurate!"""
@@ -180,8 +1000,14 @@ def analyze_image_with_gemini(image_path, user_message=""):
         img = PILImage.open(image_path)
         model = genai.GenerativeModel('models/gemini-2.0-flash')
         prompt = user_message if user_message else "Analyze this image in detail. Describe what you see, including any people, objects, activities, setting, colors, mood, text, and any other relevant details. Be specific and accurate."
-        response = model.generate_content([img, prompt])
+        with timed_phase('gemini'):
+            response = model.generate_content([img, prompt])
         img.close()
+        metrics.inc('homie_llm_requests_total', {'provider': 'gemini', 'model': 'gemini-2.0-flash', 'purpose': 'media'})
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            metrics.inc('homie_llm_tokens_total', {'model': 'gemini-2.0-flash', 'purpose': 'media', 'kind': 'prompt'}, usage.prompt_token_count or 0)
+            metrics.inc('homie_llm_tokens_total', {'model': 'gemini-2.0-flash', 'purpose': 'media', 'kind': 'completion'}, usage.candidates_token_count or 0)
         
         if response and hasattr(response, 'text') and response.text:
             return response.text
@@ -200,9 +1026,11 @@ class User(db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
     avatar = db.Column(db.String(10), default='girl')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    conversations = db.relationship('Conversation', backref='user', lazy=True, cascade='all, delete-orphan')
-    journal_entries = db.relationship('JournalEntry', backref='user', lazy=True, cascade='all, delete-orphan')
-    reminders = db.relationship('Reminder', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Child rows are removed by ON DELETE CASCADE in the database; passive_deletes
+    # stops the ORM from loading every child row before deleting a user
+    conversations = db.relationship('Conversation', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    journal_entries = db.relationship('JournalEntry', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    reminders = db.relationship('Reminder', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -212,7 +1040,7 @@ class User(db.Model):
 
 class Conversation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     role = db.Column(db.String(20), nullable=False)
     content = db.Column(db.Text, nullable=False)
     detected_mood = db.Column(db.String(20))
@@ -232,7 +1060,7 @@ class Conversation(db.Model):
 
 class JournalEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200))
     content = db.Column(db.Text, nullable=False)
     mood = db.Column(db.String(20))
@@ -249,7 +1077,7 @@ class JournalEntry(db.Model):
 
 class Reminder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     date = db.Column(db.String(10), nullable=False)
     time = db.Column(db.String(10), nullable=False)
@@ -269,7 +1097,7 @@ class Reminder(db.Model):
 
 class UserMemory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     memory_type = db.Column(db.String(50), nullable=False)
     content = db.Column(db.Text, nullable=False)
     importance_score = db.Column(db.Integer, default=1)
@@ -288,13 +1116,152 @@ class UserMemory(db.Model):
 
 class ConversationSummary(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     summary = db.Column(db.Text, nullable=False)
     key_topics = db.Column(db.Text)
     emotional_tone = db.Column(db.String(20))
     date_range = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class CollectionVersion(db.Model):
+    """Per-user change counter for a collection, used to build ETags"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    collection = db.Column(db.String(30), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class PurgeJob(db.Model):
+    """
+    Queued bulk deletion. Rows are hidden as soon as the job exists and are
+    deleted later in bounded batches by the background purger.
+    kind='conversations' hides a user's conversations with id <= max_id;
+    kind='account' removes all of the user's data and then the user row.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)  # no FK: outlives the user row
+    kind = db.Column(db.String(20), nullable=False)
+    max_id = db.Column(db.Integer)
+    deleted_rows = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class ConversationArchive(db.Model):
+    """Cold tier: one compressed block of JSON-lines conversation rows per user and month"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    month = db.Column(db.String(7), nullable=False)
+    codec = db.Column(db.String(10), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    min_id = db.Column(db.Integer, nullable=False)
+    max_id = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MoodDaily(db.Model):
+    """Per-user daily mood counts, kept up to date by every write that records a mood"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    source = db.Column(db.String(10), primary_key=True)  # 'chat' or 'journal'
+    mood = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class MoodRollupState(db.Model):
+    """Marks a user whose MoodDaily rows are complete (backfilled or created after rollups shipped)"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    backfilled_rows = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserStats(db.Model):
+    """Per-user counters kept in step with each write, so nothing rescans rows to count them"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    user_messages = db.Column(db.Integer, nullable=False, default=0)
+    assistant_messages = db.Column(db.Integer, nullable=False, default=0)
+    first_message_at = db.Column(db.DateTime)
+    last_message_at = db.Column(db.DateTime)
+    first_session = db.Column(db.Text, nullable=False, default='[]')  # JSON: the first FIRST_SESSION_ROWS messages
+    memory_count = db.Column(db.Integer, nullable=False, default=0)
+    journal_count = db.Column(db.Integer, nullable=False, default=0)
+    reconciled_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    @property
+    def message_count(self):
+        return self.user_messages + self.assistant_messages
+
+class MemoryConsolidationState(db.Model):
+    """Last consolidation pass per user and the 'memories' version it left behind"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    memory_version = db.Column(db.Integer, nullable=False, default=0)
+    consolidated_at = db.Column(db.DateTime, nullable=False)
+
+class RateLimitBucket(db.Model):
+    """Token bucket state for the database limiter backend (times are epoch seconds)"""
+    key = db.Column(db.String(120), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)
+
+class ProviderLease(db.Model):
+    """One in-flight provider call; expired leases are ignored and swept on acquire"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(30), nullable=False, index=True)
+    token = db.Column(db.String(32), nullable=False, unique=True)
+    expires_at = db.Column(db.Float, nullable=False)
+
+class IdempotencyRecord(db.Model):
+    """Outcome of a request submitted with an Idempotency-Key, kept for IDEMPOTENCY_TTL_SECONDS"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    endpoint = db.Column(db.String(50), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='in_flight')  # 'in_flight' or 'done'
+    status_code = db.Column(db.Integer)
+    mimetype = db.Column(db.String(50))
+    body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class PrewarmedContext(db.Model):
+    """Chat context assembled by /api/chat/prewarm, valid while its collection versions match"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    versions = db.Column(db.String(100), nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.Float, nullable=False, index=True)
+
+class MediaFingerprint(db.Model):
+    """Perceptual hash of an analyzed upload, so a re-sent image can reuse its analysis"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    phash = db.Column(db.BigInteger, nullable=False)  # 64-bit DCT hash stored as a signed integer
+    prompt_key = db.Column(db.String(16), nullable=False)
+    media_type = db.Column(db.String(20), nullable=False)
+    analysis = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ServerEvent(db.Model):
+    """Outbox for the database event backend; pollers in every worker fan rows out to their streams"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+def visible_conversations(user_id):
+    """Filter criteria for a user's conversations, minus rows queued for purge"""
+    floor = select(func.coalesce(func.max(PurgeJob.max_id), 0)).where(
+        PurgeJob.user_id == user_id,
+        PurgeJob.kind == 'conversations',
+        PurgeJob.finished_at.is_(None)
+    ).scalar_subquery()
+    return (Conversation.user_id == user_id, Conversation.id > floor)
+
+def visible_archive_blocks(user_id):
+    """Same as visible_conversations() for the archive tier"""
+    floor = select(func.coalesce(func.max(PurgeJob.max_id), 0)).where(
+        PurgeJob.user_id == user_id,
+        PurgeJob.kind == 'conversations',
+        PurgeJob.finished_at.is_(None)
+    ).scalar_subquery()
+    return (ConversationArchive.user_id == user_id, ConversationArchive.max_id > floor)
+
 # ===== CONVERSATION & MOOD FUNCTIONS =====
 def detect_mood(message):
     """Analyzes user message to detect emotional state"""
@@ -472,35 +1439,31 @@ NOT: "I see a book" (if the analysis doesn't mention a book)
     
     return base_prompt
 
-def get_conversation_summary(user_id, limit=None):
+def get_conversation_summary(user_id):
     """Get a summary of conversations without exposing raw message content"""
     try:
-        query = Conversation.query.filter_by(user_id=user_id).order_by(Conversation.timestamp.asc())
-        
-        if limit:
-            conversations = query.limit(limit).all()
-        else:
-            conversations = query.all()
+        stats = get_user_stats(user_id)
+        conversations = json.loads(stats.first_session or '[]')
         
         if not conversations:
             return "No previous conversations found."
         
         first_messages = conversations[:6]
         summary_parts = []
-        summary_parts.append(f"We've had {len(conversations)} messages exchanged total.")
+        summary_parts.append(f"We've had {stats.message_count} messages exchanged total.")
         
-        user_messages = [c for c in first_messages if c.role == 'user']
+        user_messages = [c for c in first_messages if c['role'] == 'user']
         if user_messages:
             first_user_msg = user_messages[0]
             summary_parts.append(f"Our first conversation started with you saying hello and we began getting to know each other.")
             
-            if 'adnan' in first_user_msg.content.lower() or any('adnan' in c.content.lower() for c in conversations[:10] if c.role == 'user'):
+            if 'adnan' in first_user_msg['content'].lower() or any('adnan' in c['content'].lower() for c in conversations if c['role'] == 'user'):
                 summary_parts.append("You introduced yourself as Adnan early in our conversations.")
         
         return " ".join(summary_parts)
         
     except Exception as e:
-        print(f"Error getting conversation summary: {e}")
+        log_event('conversation_summary.failed', level='error', user_id=user_id, error=e)
         return "I remember we've been chatting, but I'm having trouble accessing the specific details right now."
 
 def generate_user_summary(conversations):
@@ -528,101 +1491,113 @@ def generate_user_summary(conversations):
     return " ".join(summary_parts)
 
 # ===== MEMORY FUNCTIONS =====
+def find_memories(user_message, user_id, current_mood):
+    """Ask the model which parts of a message are worth remembering; no database writes"""
+    if not user_message or len(user_message.strip()) < 10:
+        return None
+        
+    memory_prompt = f"""
+    Analyze this user message and identify any important, personal, or recurring information that should be remembered long-term.
+    
+    User Message: {user_message}
+    Current Mood: {current_mood}
+    
+    Look for:
+    - Personal preferences (likes/dislikes)
+    - Important relationships (family, friends, partners)
+    - Goals, dreams, or aspirations
+    - Fears, worries, or challenges
+    - Achievements or milestones
+    - Recurring topics or patterns
+    - Significant life events
+    
+    Return ONLY valid JSON with this exact structure:
+    {{
+        "memories": [
+            {{
+                "type": "personal|preference|relationship|goal|fear|achievement",
+                "content": "Clear description of what to remember",
+                "importance": 1-10
+            }}
+        ]
+    }}
+    
+    If no significant memories are found, return:
+    {{
+        "memories": []
+    }}
+    
+    Only extract memories that are truly significant for building a long-term understanding.
+    Keep content concise but meaningful.
+    """
+    
+    response = groq_client.chat.completions.create(
+        messages=[{"role": "user", "content": memory_prompt}],
+        model="llama-3.1-8b-instant",
+        temperature=0.3,
+        max_tokens=1024
+    )
+    record_llm_usage(response, 'memory', "llama-3.1-8b-instant")
+    
+    response_text = response.choices[0].message.content.strip()
+    
+    if response_text.startswith('```json'):
+        response_text = response_text[7:]
+    if response_text.endswith('```'):
+        response_text = response_text[:-3]
+    response_text = response_text.strip()
+    
+    try:
+        memory_data = json.loads(response_text)
+    except json.JSONDecodeError:
+        log_event('memory.json_parse_failed', level='warning', user_id=user_id, response=response_text)
+        memory_data = {"memories": []}
+    
+    return [memory for memory in memory_data.get("memories", [])
+            if all(key in memory for key in ['type', 'content', 'importance']) and len(memory['content'].strip()) >= 5]
+
+def save_memories(user_id, memories):
+    """Add new memories and refresh ones already known; caller commits. Returns the number added"""
+    memory_count = 0
+    for memory in memories:
+        existing_memory = UserMemory.query.filter_by(
+            user_id=user_id,
+            memory_type=memory["type"]
+        ).filter(UserMemory.content.like(f"%{memory['content'][:50]}%")).first()
+        
+        if not existing_memory:
+            new_memory = UserMemory(
+                user_id=user_id,
+                memory_type=memory["type"],
+                content=memory["content"][:500],
+                importance_score=min(10, max(1, memory["importance"]))
+            )
+            db.session.add(new_memory)
+            memory_count += 1
+        else:
+            existing_memory.importance_score = max(existing_memory.importance_score, memory["importance"])
+            existing_memory.last_referenced = datetime.now(timezone.utc)
+    
+    if memories:
+        bump_collection_version(user_id, 'memories')
+        bump_user_stats(user_id, memory_count=memory_count)
+    return memory_count
+
 def extract_memories_from_conversation(user_message, ai_response, user_id, current_mood):
     """Extract potential memories from conversations using AI"""
     try:
-        if not user_message or len(user_message.strip()) < 10:
+        memories = find_memories(user_message, user_id, current_mood)
+        if memories is None:
             return False
-            
-        memory_prompt = f"""
-        Analyze this user message and identify any important, personal, or recurring information that should be remembered long-term.
-        
-        User Message: {user_message}
-        Current Mood: {current_mood}
-        
-        Look for:
-        - Personal preferences (likes/dislikes)
-        - Important relationships (family, friends, partners)
-        - Goals, dreams, or aspirations
-        - Fears, worries, or challenges
-        - Achievements or milestones
-        - Recurring topics or patterns
-        - Significant life events
-        
-        Return ONLY valid JSON with this exact structure:
-        {{
-            "memories": [
-                {{
-                    "type": "personal|preference|relationship|goal|fear|achievement",
-                    "content": "Clear description of what to remember",
-                    "importance": 1-10
-                }}
-            ]
-        }}
-        
-        If no significant memories are found, return:
-        {{
-            "memories": []
-        }}
-        
-        Only extract memories that are truly significant for building a long-term understanding.
-        Keep content concise but meaningful.
-        """
-        
-        response = groq_client.chat.completions.create(
-            messages=[{"role": "user", "content": memory_prompt}],
-            model="llama-3.1-8b-instant",
-            temperature=0.3,
-            max_tokens=1024
-        )
-        
-        response_text = response.choices[0].message.content.strip()
-        
-        if response_text.startswith('```json'):
-            response_text = response_text[7:]
-        if response_text.endswith('```'):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        try:
-            memory_data = json.loads(response_text)
-        except json.JSONDecodeError:
-            print(f"JSON parse failed. Response was: {response_text}")
-            memory_data = {"memories": []}
-        
-        memory_count = 0
-        for memory in memory_data.get("memories", []):
-            if not all(key in memory for key in ['type', 'content', 'importance']):
-                continue
-                
-            if len(memory['content'].strip()) < 5:
-                continue
-                
-            existing_memory = UserMemory.query.filter_by(
-                user_id=user_id,
-                memory_type=memory["type"]
-            ).filter(UserMemory.content.like(f"%{memory['content'][:50]}%")).first()
-            
-            if not existing_memory:
-                new_memory = UserMemory(
-                    user_id=user_id,
-                    memory_type=memory["type"],
-                    content=memory["content"][:500],
-                    importance_score=min(10, max(1, memory["importance"]))
-                )
-                db.session.add(new_memory)
-                memory_count += 1
-            else:
-                existing_memory.importance_score = max(existing_memory.importance_score, memory["importance"])
-                existing_memory.last_referenced = datetime.now(timezone.utc)
-        
+        memory_count = save_memories(user_id, memories)
         db.session.commit()
         if memory_count > 0:
-            print(f"Extracted {memory_count} new memories")
+            log_event('memory.extracted', user_id=user_id, count=memory_count)
         return True
         
     except Exception as e:
-        print(f"Memory extraction error: {e}")
+        db.session.rollback()
+        log_event('memory.extraction_failed', level='error', user_id=user_id, error=e)
         return False
 
 def generate_comprehensive_user_profile(user_id):
@@ -632,13 +1607,11 @@ def generate_comprehensive_user_profile(user_id):
         UserMemory.last_referenced.desc()
     ).limit(50).all()
     
-    recent_convos = Conversation.query.filter_by(user_id=user_id).order_by(
-        Conversation.timestamp.desc()
-    ).limit(100).all()
+    conversation_count = get_user_stats(user_id).message_count
     
-    journal_entries = JournalEntry.query.filter_by(user_id=user_id).order_by(
-        JournalEntry.timestamp.desc()
-    ).limit(20).all()
+    mood_since = date.today() - timedelta(days=30)
+    chat_moods = mood_counts(user_id, mood_since, source='chat')
+    journal_moods = mood_counts(user_id, mood_since, source='journal')
     
     profile_parts = []
     
@@ -656,18 +1629,13 @@ def generate_comprehensive_user_profile(user_id):
             for memory in mem_list[:5]:
                 profile_parts.append(f"- {memory.content} (importance: {memory.importance_score}/10)")
     
-    if len(recent_convos) > 10:
-        moods = [c.detected_mood for c in recent_convos if c.detected_mood]
-        if moods:
-            common_mood = max(set(moods), key=moods.count)
-            profile_parts.append(f"\n💫 RECENT MOOD PATTERNS: You've often been feeling {common_mood}")
+    if conversation_count > 10 and chat_moods:
+        common_mood = max(chat_moods, key=chat_moods.get)
+        profile_parts.append(f"\n💫 RECENT MOOD PATTERNS: You've often been feeling {common_mood}")
     
-    if journal_entries:
-        recent_moods = [j.mood for j in journal_entries if j.mood]
-        if recent_moods:
-            profile_parts.append(f"\n📔 JOURNAL INSIGHTS: Your recent writings show {', '.join(set(recent_moods))} emotions")
+    if journal_moods:
+        profile_parts.append(f"\n📔 JOURNAL INSIGHTS: Your recent writings show {', '.join(journal_moods)} emotions")
     
-    conversation_count = len(recent_convos)
     if conversation_count > 50:
         profile_parts.append(f"\n🤝 OUR JOURNEY: We've had {conversation_count} conversations together! I've really enjoyed getting to know you.")
     elif conversation_count > 20:
@@ -680,7 +1648,7 @@ def update_conversation_summary(user_id):
     try:
         one_week_ago = datetime.now(timezone.utc) - timedelta(days=7)
         recent_convos = Conversation.query.filter(
-            Conversation.user_id == user_id,
+            *visible_conversations(user_id),
             Conversation.timestamp >= one_week_ago
         ).order_by(Conversation.timestamp).all()
         
@@ -715,6 +1683,7 @@ def update_conversation_summary(user_id):
             temperature=0.4,
             max_tokens=512
         )
+        record_llm_usage(response, 'summary', "llama-3.1-8b-instant")
         
         response_text = response.choices[0].message.content.strip()
         
@@ -727,11 +1696,11 @@ def update_conversation_summary(user_id):
         try:
             summary_data = json.loads(response_text)
         except json.JSONDecodeError:
-            print(f"Summary JSON parse failed. Response: {response_text}")
+            log_event('summary.json_parse_failed', level='warning', user_id=user_id, response=response_text)
             return
         
         if not all(key in summary_data for key in ['summary', 'key_topics', 'emotional_tone']):
-            print("Summary missing required fields")
+            log_event('summary.missing_fields', level='warning', user_id=user_id, fields=list(summary_data))
             return
             
         date_range = f"{one_week_ago.date()}_to_{datetime.now(timezone.utc).date()}"
@@ -745,10 +1714,10 @@ def update_conversation_summary(user_id):
         db.session.add(new_summary)
         db.session.commit()
         
-        print(f"Created weekly summary for user {user_id}")
+        log_event('summary.created', user_id=user_id)
         
     except Exception as e:
-        print(f"Summary generation error: {e}")
+        log_event('summary.failed', level='error', user_id=user_id, error=e)
 
 def safe_json_parse(json_string, default=None):
     """Safely parse JSON with comprehensive error handling"""
@@ -766,40 +1735,2091 @@ def safe_json_parse(json_string, default=None):
     except:
         return default
 
-# ===== API ROUTES =====
+# ===== FAST JSON =====
+# Read endpoints select plain column tuples (no ORM objects, no identity map)
+# and serialize straight to bytes with orjson, which handles datetimes
+# natively. The stdlib fallback produces the same output, just slower.
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
-@app.route('/api/debug')
-def debug_info():
-    """Debug endpoint to check all configurations"""
-    info = {
-        'database_url': app.config['SQLALCHEMY_DATABASE_URI'][:100] + '...' if app.config['SQLALCHEMY_DATABASE_URI'] else 'None',
-        'database_connected': check_database_connection(),
-        'environment_vars': {
-            'DATABASE_URL_set': bool(os.environ.get('DATABASE_URL')),
-            'PGHOST_set': bool(os.environ.get('PGHOST')),
-            'PGUSER_set': bool(os.environ.get('PGUSER')),
-            'PGPASSWORD_set': bool(os.environ.get('PGPASSWORD')),
-        },
-        'tables': {
-            'users': User.query.count(),
-            'conversations': Conversation.query.count(),
-        }
-    }
-    return jsonify(info)
+def dumps_json(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default)
+    return json.dumps(payload, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
 
-@app.route('/api/database-health')
-def database_health():
-    """Check database health and connection"""
+def json_response(payload, status=200):
+    return Response(dumps_json(payload), status=status, mimetype='application/json')
+
+def select_dicts(columns, *criteria, order_by=(), limit=None):
+    """Run a Core SELECT and return rows as dicts keyed by column name"""
+    keys = [column.key for column in columns]
+    query = select(*columns).where(*criteria).order_by(*order_by)
+    if limit is not None:
+        query = query.limit(limit)
+    return [dict(zip(keys, row)) for row in db.session.execute(query)]
+
+# ===== CONDITIONAL RESPONSES =====
+# Read-mostly collections carry a per-user version counter that every write
+# path bumps in the same transaction. GETs turn it into an ETag and answer
+# 304 from the counter alone, without querying the collection table.
+# Bump ETAG_FORMAT whenever a payload's shape changes.
+ETAG_FORMAT = 'v1'
+
+def bump_collection_version(user_id, *collections):
+    """Increment version counters; caller commits with its own writes"""
+    # Announced to the user's event streams once the transaction commits
+    db.session.info.setdefault('changed_collections', set()).update((user_id, c) for c in collections)
+    for collection in collections:
+        updated = CollectionVersion.query.filter_by(user_id=user_id, collection=collection).update(
+            {CollectionVersion.version: CollectionVersion.version + 1}, synchronize_session=False)
+        if not updated:
+            db.session.add(CollectionVersion(user_id=user_id, collection=collection, version=1))
+
+def collection_etag(user_id, collection):
+    row = db.session.query(CollectionVersion.version).filter_by(user_id=user_id, collection=collection).first()
+    return f"{collection}-{user_id}-{row[0] if row else 0}-{ETAG_FORMAT}"
+
+def conditional_json(etag, loader):
+    """304 if the client's validator matches, else the loader's JSON with an ETag"""
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = json_response(loader())
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# ===== READ REPLICAS =====
+# Read-only endpoints decorated with @replica_reads run their queries on a
+# replica from DATABASE_REPLICA_URLS. A browser session that wrote recently
+# keeps reading from the primary until a replica has caught up: each replica's
+# lag is measured (cached for REPLICA_LAG_CHECK_SECONDS) and it is only used
+# when the lag is smaller than the time since the session's last commit.
+# Replicas without a lag query (e.g. a second SQLite file for local testing)
+# are assumed to be REPLICA_ASSUMED_LAG_SECONDS behind.
+REPLICA_LAG_CHECK_SECONDS = 5
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 30))
+REPLICA_ASSUMED_LAG_SECONDS = float(os.environ.get('REPLICA_ASSUMED_LAG_SECONDS', 1.0))
+# A streamed write (chat/stream) commits after the headers went out, so the
+# session is treated as writing for this long from the start of the stream
+REPLICA_STREAM_WRITE_SECONDS = 30
+POSTGRES_LAG_SQL = text("""
+    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END
+""")
+
+_replica_lag = {}  # bind -> (lag seconds, measured at)
+_replica_lag_lock = threading.Lock()
+
+def replica_lag(bind):
+    with _replica_lag_lock:
+        cached = _replica_lag.get(bind)
+    if cached and time.monotonic() - cached[1] < REPLICA_LAG_CHECK_SECONDS:
+        return cached[0]
+    
+    engine = db.engines[bind]
+    try:
+        if engine.dialect.name == 'postgresql':
+            with engine.connect() as conn:
+                lag = float(conn.execute(POSTGRES_LAG_SQL).scalar() or 0)
+        else:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+            lag = REPLICA_ASSUMED_LAG_SECONDS
+    except Exception as e:
+        log_event('db.replica_unavailable', level='warning', replica=bind, error=e)
+        lag = float('inf')
+    with _replica_lag_lock:
+        _replica_lag[bind] = (lag, time.monotonic())
+    return lag
+
+def choose_replica():
+    """A replica fresh enough for this session, or None for the primary"""
+    if not REPLICA_BINDS:
+        return None, 'no_replicas'
+    last_write = session.get('db_write_at')
+    allowed = REPLICA_MAX_LAG_SECONDS
+    if last_write is not None:
+        allowed = min(allowed, time.time() - last_write)
+        if allowed <= 0:
+            return None, 'recent_write'
+    fresh = [bind for bind in REPLICA_BINDS if replica_lag(bind) < allowed]
+    if not fresh:
+        return None, 'recent_write' if last_write is not None and allowed < REPLICA_MAX_LAG_SECONDS else 'replica_lag'
+    return random.choice(fresh), 'fresh'
+
+def replica_reads(view):
+    """Route the GET handling of a view to a read replica when one is fresh enough"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if request.method in ('GET', 'HEAD') and REPLICA_BINDS:
+            replica, reason = choose_replica()
+            g.db_replica = replica
+            metrics.inc('homie_db_reads_total', {'role': 'replica' if replica else 'primary', 'reason': reason})
+        return view(*args, **kwargs)
+    return wrapped
+
+@event.listens_for(db.session, 'after_flush')
+def note_session_write(session_, flush_context):
+    session_.info['wrote'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def remember_write_time(session_):
+    if session_.info.pop('wrote', False) and has_request_context():
+        g.db_wrote_at = time.time()
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_write(session_):
+    session_.info.pop('wrote', None)
+
+@app.after_request
+def record_session_write(response):
+    if not REPLICA_BINDS or 'user_id' not in session:
+        return response
+    if response.is_streamed and request.method not in ('GET', 'HEAD'):
+        session['db_write_at'] = time.time() + REPLICA_STREAM_WRITE_SECONDS
+    elif g.get('db_wrote_at') and g.db_wrote_at > session.get('db_write_at', 0):
+        session['db_write_at'] = g.db_wrote_at
+    return response
+
+# ===== PAGE DATA LOADERS =====
+# Shared by the individual GET endpoints and /api/bootstrap
+MUSIC_LIST = [
+    {'id': 1, 'name': 'Lofi Beats 1', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_1_x131mw.mp3'},
+    {'id': 2, 'name': 'Lofi Beats 2', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_2_ta1t9m.mp3'},
+    {'id': 3, 'name': 'Lofi Beats 3', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_3_lsq9ek.mp3'},
+    {'id': 4, 'name': 'Lofi Beats 4', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_4_qejsjt.mp3'},
+    {'id': 5, 'name': 'Lofi Beats 5', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_5_lmbywm.mp3'}
+]
+
+# Threads used by /api/bootstrap to run its DB reads side by side (0 = sequential)
+BOOTSTRAP_READ_WORKERS = int(os.environ.get('BOOTSTRAP_READ_WORKERS', 3))
+bootstrap_executor = ThreadPoolExecutor(max_workers=BOOTSTRAP_READ_WORKERS, thread_name_prefix='bootstrap') if BOOTSTRAP_READ_WORKERS else None
+
+def _reset_bootstrap_executor():
+    # A forked child inherits the executor but none of its threads
+    global bootstrap_executor
+    if bootstrap_executor is not None:
+        bootstrap_executor = ThreadPoolExecutor(max_workers=BOOTSTRAP_READ_WORKERS, thread_name_prefix='bootstrap')
+
+os.register_at_fork(after_in_child=_reset_bootstrap_executor)
+
+# Column lists mirror the models' to_dict() output
+HISTORY_COLUMNS = (Conversation.role, Conversation.content, Conversation.detected_mood,
+                   Conversation.media_type, Conversation.media_analysis, Conversation.timestamp)
+JOURNAL_COLUMNS = (JournalEntry.id, JournalEntry.title, JournalEntry.content, JournalEntry.mood, JournalEntry.timestamp)
+REMINDER_COLUMNS = (Reminder.id, Reminder.title, Reminder.date, Reminder.time, Reminder.repeat, Reminder.is_active)
+MEMORY_COLUMNS = (UserMemory.id, UserMemory.memory_type, UserMemory.content, UserMemory.importance_score,
+                  UserMemory.last_referenced, UserMemory.created_at)
+
+def load_history(user_id):
+    history = load_conversation_rows(user_id)
+    log_event('history.loaded', user_id=user_id, count=len(history))
+    return history
+
+def load_journal_entries(user_id):
+    return select_dicts(JOURNAL_COLUMNS, JournalEntry.user_id == user_id,
+                        order_by=(JournalEntry.timestamp.desc(),))
+
+def load_active_reminders(user_id):
+    return select_dicts(REMINDER_COLUMNS, Reminder.user_id == user_id, Reminder.is_active == True,
+                        order_by=(Reminder.date, Reminder.time))
+
+def load_memories(user_id):
+    return select_dicts(MEMORY_COLUMNS, UserMemory.user_id == user_id,
+                        order_by=(UserMemory.importance_score.desc(), UserMemory.last_referenced.desc()))
+
+def build_greeting(username, avatar):
+    hour = datetime.now().hour
+    
+    if avatar == 'girl':
+        if 5 <= hour < 12:
+            greeting = f"Good morning, {username}! 🌸"
+            message = "Hope you slept well, sweetie! Ready to tackle the day?"
+        elif 12 <= hour < 17:
+            greeting = f"Hey {username}! 💖"
+            message = "How's your day going so far, love?"
+        elif 17 <= hour < 21:
+            greeting = f"Good evening, {username}! 🌙"
+            message = "Winding down or still grinding, girl?"
+        else:
+            greeting = f"Hey night owl {username}! ✨"
+            message = "Still up? I'm here if you need to chat, sweetie."
+    else:
+        if 5 <= hour < 12:
+            greeting = f"Good morning, {username}! 💪"
+            message = "Hope you slept well, bro! Ready to tackle the day?"
+        elif 12 <= hour < 17:
+            greeting = f"Hey {username}! 🔥"
+            message = "How's your day going so far, man?"
+        elif 17 <= hour < 21:
+            greeting = f"Good evening, {username}! 🌆"
+            message = "Winding down or still grinding, dude?"
+        else:
+            greeting = f"Hey night owl {username}! 🦉"
+            message = "Still up? I'm here if you need to chat, bro."
+    
+    return {
+        'greeting': greeting,
+        'message': message,
+        'hour': hour
+    }
+
+def music_preferences():
+    return {
+        'music_enabled': session.get('music_enabled', True),
+        'current_track': session.get('current_track', 2),
+        'volume': session.get('music_volume', 0.5)
+    }
+
+def run_reads(loaders):
+    """
+    Run independent read functions, concurrently when a pool is configured.
+    Each worker gets its own app context and therefore its own DB session.
+    """
+    if bootstrap_executor is None:
+        return {name: fn() for name, fn in loaders.items()}
+    
+    replica = g.get('db_replica')
+    
+    def run_in_context(fn):
+        with app.app_context():
+            g.db_replica = replica
+            try:
+                return fn()
+            finally:
+                db.session.remove()
+    
+    futures = {name: bootstrap_executor.submit(run_in_context, fn) for name, fn in loaders.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+# ===== BACKGROUND JOBS =====
+# Periodic maintenance runs on daemon threads inside each worker process.
+# Threads start on the first request handled by a process (so they survive
+# gunicorn's fork) and every job must be safe to run in several workers at once.
+BACKGROUND_JOBS_ENABLED = os.environ.get('BACKGROUND_JOBS', '1') != '0'
+background_jobs = []
+_background_jobs_pid = None
+_background_jobs_lock = threading.Lock()
+
+def background_job(interval_seconds):
+    """Register a function to run every interval_seconds inside an app context"""
+    def register(fn):
+        background_jobs.append((fn, interval_seconds))
+        return fn
+    return register
+
+def _run_background_job(fn, interval_seconds):
+    # Stagger start-up so workers don't all hit the database at once
+    time.sleep(random.uniform(0, min(interval_seconds, 30)))
+    while True:
+        with app.app_context():
+            try:
+                with timed_phase(f"job_{fn.__name__}"):
+                    fn()
+            except Exception as e:
+                db.session.rollback()
+                log_event('job.failed', level='error', job=fn.__name__, error=e)
+            finally:
+                db.session.remove()
+        time.sleep(interval_seconds)
+
+def start_background_jobs():
+    global _background_jobs_pid
+    if not BACKGROUND_JOBS_ENABLED or _background_jobs_pid == os.getpid():
+        return
+    with _background_jobs_lock:
+        if _background_jobs_pid == os.getpid():
+            return
+        for fn, interval_seconds in background_jobs:
+            threading.Thread(target=_run_background_job, args=(fn, interval_seconds),
+                             name=f"job-{fn.__name__}", daemon=True).start()
+        _background_jobs_pid = os.getpid()
+
+@app.before_request
+def ensure_background_jobs():
+    start_background_jobs()
+
+# ===== DATA PURGE =====
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 1000))
+PURGE_BATCH_PAUSE = float(os.environ.get('PURGE_BATCH_PAUSE', 0.05))
+PURGE_MAX_BATCHES_PER_RUN = 200
+
+# Everything an account purge deletes before the user row: every table with a
+# user_id column except PurgeJob, which outlives the user. Derived from the
+# models so new per-user tables are covered without being listed here.
+USER_DATA_MODELS = sorted(
+    (mapper.class_ for mapper in db.Model.registry.mappers
+     if 'user_id' in mapper.local_table.c and mapper.class_ is not PurgeJob),
+    key=lambda model: model.__tablename__)
+
+def _delete_batch(model, *criteria):
+    """Delete at most PURGE_BATCH_SIZE matching rows in a short transaction"""
+    columns = model.__table__.primary_key.columns.values()
+    key = columns[0] if len(columns) == 1 else tuple_(*columns)
+    ids = select(*columns).where(*criteria).limit(PURGE_BATCH_SIZE)
+    result = db.session.execute(delete(model).where(key.in_(ids)).execution_options(synchronize_session=False))
+    db.session.commit()
+    return result.rowcount or 0
+
+def _purge_in_batches(job, model, *criteria):
+    """Delete rows batch by batch; returns True once none are left"""
+    for _ in range(PURGE_MAX_BATCHES_PER_RUN):
+        deleted = _delete_batch(model, *criteria)
+        if deleted:
+            PurgeJob.query.filter_by(id=job.id).update(
+                {PurgeJob.deleted_rows: PurgeJob.deleted_rows + deleted}, synchronize_session=False)
+            db.session.commit()
+        if deleted < PURGE_BATCH_SIZE:
+            return True
+        time.sleep(PURGE_BATCH_PAUSE)
+    return False
+
+def process_purge_job(job):
+    """Advance one purge job; returns True when it has finished"""
+    if job.kind == 'conversations':
+        done = (_purge_in_batches(job, Conversation, Conversation.user_id == job.user_id, Conversation.id <= job.max_id)
+                and _purge_in_batches(job, ConversationArchive, ConversationArchive.user_id == job.user_id,
+                                      ConversationArchive.max_id <= job.max_id))
+    elif job.kind == 'account':
+        done = True
+        for model in USER_DATA_MODELS:
+            if not _purge_in_batches(job, model, model.user_id == job.user_id):
+                done = False
+                break
+        if done:
+            # Every user-owned table is empty for this user now, so the cascade has nothing left to do
+            User.query.filter_by(id=job.user_id).delete(synchronize_session=False)
+    else:
+        done = True
+    
+    if done:
+        PurgeJob.query.filter_by(id=job.id).update({PurgeJob.finished_at: datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        log_event('purge.finished', job_id=job.id, kind=job.kind, user_id=job.user_id)
+    return done
+
+@background_job(interval_seconds=30)
+def run_purge_jobs():
+    pending = PurgeJob.query.filter(PurgeJob.finished_at.is_(None)).order_by(PurgeJob.id).limit(10).all()
+    for job in pending:
+        process_purge_job(job)
+
+# ===== CONVERSATION ARCHIVE =====
+# Conversations older than CONVERSATION_ARCHIVE_DAYS move out of the hot
+# table into per-user, per-month compressed blocks. Each user's newest
+# ARCHIVE_KEEP_HOT_ROWS rows stay hot whatever their age, so chat context,
+# the profile and summaries (which only read the hot table) still see recent
+# history after a long break. The conversation table and its indexes stay
+# small; full history reads go through load_conversation_rows(), which
+# merges both tiers.
+CONVERSATION_ARCHIVE_DAYS = int(os.environ.get('CONVERSATION_ARCHIVE_DAYS', 90))
+ARCHIVE_KEEP_HOT_ROWS = max(1, int(os.environ.get('ARCHIVE_KEEP_HOT_ROWS', 100)))
+ARCHIVE_BATCH_ROWS = int(os.environ.get('ARCHIVE_BATCH_ROWS', 2000))
+ARCHIVE_USERS_PER_RUN = 50
+ARCHIVE_CODEC = 'zstd' if zstandard is not None else 'zlib'
+
+def pack_archive_rows(rows):
+    payload = b"\n".join(dumps_json(row) for row in rows)
+    if ARCHIVE_CODEC == 'zstd':
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(payload)
+    return 'zlib', zlib.compress(payload, 6)
+
+def unpack_archive_block(codec, data):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd archive blocks")
+        payload = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        payload = zlib.decompress(data)
+    return [json.loads(line) for line in payload.split(b"\n") if line]
+
+def load_archived_rows(user_id, limit=None):
+    """Archived conversation dicts, oldest first (same shape as HISTORY_COLUMNS)"""
+    blocks = db.session.execute(
+        select(ConversationArchive.codec, ConversationArchive.data)
+        .where(*visible_archive_blocks(user_id))
+        .order_by(ConversationArchive.first_timestamp, ConversationArchive.min_id)
+    )
+    rows = []
+    for codec, data in blocks:
+        for row in unpack_archive_block(codec, data):
+            row.pop('id', None)
+            rows.append(row)
+            if limit is not None and len(rows) >= limit:
+                return rows
+    return rows
+
+def load_conversation_rows(user_id, limit=None):
+    """A user's visible conversation history across the archive and hot tiers, oldest first"""
+    rows = load_archived_rows(user_id, limit=limit)
+    remaining = None if limit is None else limit - len(rows)
+    if remaining is None or remaining > 0:
+        rows.extend(select_dicts(HISTORY_COLUMNS, *visible_conversations(user_id),
+                                 order_by=(Conversation.timestamp.asc(),), limit=remaining))
+    return rows
+
+def archive_user_conversations(user_id, cutoff):
+    """Move one user's conversations older than cutoff, except the newest ARCHIVE_KEEP_HOT_ROWS, into archive blocks"""
+    # Rows sharing the boundary's timestamp stay hot too, so at least that many remain
+    keep_from = db.session.query(Conversation.timestamp).filter(*visible_conversations(user_id)).order_by(
+        Conversation.timestamp.desc(), Conversation.id.desc()).offset(ARCHIVE_KEEP_HOT_ROWS - 1).limit(1).scalar()
+    if keep_from is None:
+        return 0
+    cutoff = min(cutoff, keep_from)
+    
+    archived = 0
+    while True:
+        rows = select_dicts((Conversation.id,) + HISTORY_COLUMNS, *visible_conversations(user_id),
+                            Conversation.timestamp < cutoff, order_by=(Conversation.id,), limit=ARCHIVE_BATCH_ROWS)
+        if not rows:
+            return archived
+        
+        months = {}
+        for row in rows:
+            months.setdefault(row['timestamp'].strftime('%Y-%m'), []).append(row)
+        
+        for month, month_rows in months.items():
+            month_rows.sort(key=lambda r: (r['timestamp'], r['id']))
+            codec, data = pack_archive_rows(month_rows)
+            db.session.add(ConversationArchive(
+                user_id=user_id,
+                month=month,
+                codec=codec,
+                row_count=len(month_rows),
+                min_id=min(r['id'] for r in month_rows),
+                max_id=max(r['id'] for r in month_rows),
+                first_timestamp=month_rows[0]['timestamp'],
+                last_timestamp=month_rows[-1]['timestamp'],
+                data=data
+            ))
+        
+        ids = [row['id'] for row in rows]
+        deleted = db.session.execute(
+            delete(Conversation).where(Conversation.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        if deleted != len(ids):
+            # Another worker archived (or purged) some of these rows first
+            db.session.rollback()
+            return archived
+        db.session.commit()
+        archived += len(ids)
+        time.sleep(PURGE_BATCH_PAUSE)
+
+@background_job(interval_seconds=3600)
+def archive_old_conversations():
+    cutoff = datetime.utcnow() - timedelta(days=CONVERSATION_ARCHIVE_DAYS)
+    # With more than ARCHIVE_KEEP_HOT_ROWS rows the oldest is never kept hot
+    user_ids = [row[0] for row in db.session.query(Conversation.user_id).group_by(Conversation.user_id)
+                .having(func.min(Conversation.timestamp) < cutoff, func.count() > ARCHIVE_KEEP_HOT_ROWS)
+                .limit(ARCHIVE_USERS_PER_RUN)]
+    for user_id in user_ids:
+        archived = archive_user_conversations(user_id, cutoff)
+        if archived:
+            log_event('archive.conversations', user_id=user_id, rows=archived, codec=ARCHIVE_CODEC)
+
+# ===== MOOD ROLLUPS =====
+# Daily per-user mood counts for chat messages and journal entries. Write
+# paths call record_mood() in the same transaction as the row they add, so
+# analytics and the user profile read a handful of rollup rows instead of
+# recounting raw conversations. Users that predate the rollups are filled in
+# once by backfill_mood_rollups(); until then record_mood() skips them so
+# nothing is counted twice.
+MOOD_BACKFILL_USERS_PER_RUN = 20
+MOOD_ANALYTICS_MAX_DAYS = 3660
+
+def mood_rollups_ready(user_id):
+    return db.session.query(MoodRollupState.user_id).filter_by(user_id=user_id).first() is not None
+
+def _add_mood_count(user_id, day, source, mood, delta):
+    updated = MoodDaily.query.filter_by(user_id=user_id, day=day, source=source, mood=mood).update(
+        {MoodDaily.count: MoodDaily.count + delta}, synchronize_session=False)
+    if not updated and delta > 0:
+        db.session.add(MoodDaily(user_id=user_id, day=day, source=source, mood=mood, count=delta))
+
+def record_mood(user_id, source, mood, when=None, delta=1):
+    """Adjust the rollup for one mood observation; caller commits with its own writes"""
+    if not mood or not mood_rollups_ready(user_id):
+        return
+    _add_mood_count(user_id, (when or datetime.utcnow()).date(), source, mood, delta)
+    bump_collection_version(user_id, 'moods')
+
+def mood_counts(user_id, start, end=None, source=None):
+    """Total count per mood between two dates (inclusive), most frequent first"""
+    query = db.session.query(MoodDaily.mood, func.sum(MoodDaily.count)).filter(
+        MoodDaily.user_id == user_id, MoodDaily.day >= start, MoodDaily.count > 0)
+    if end is not None:
+        query = query.filter(MoodDaily.day <= end)
+    if source is not None:
+        query = query.filter(MoodDaily.source == source)
+    rows = query.group_by(MoodDaily.mood).order_by(func.sum(MoodDaily.count).desc()).all()
+    return {mood: int(total) for mood, total in rows}
+
+def _period_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def load_mood_trends(user_id, start, end, bucket='day', source=None):
+    criteria = [MoodDaily.user_id == user_id, MoodDaily.day >= start, MoodDaily.day <= end, MoodDaily.count > 0]
+    if source is not None:
+        criteria.append(MoodDaily.source == source)
+    rows = select_dicts((MoodDaily.day, MoodDaily.mood, MoodDaily.count), *criteria, order_by=(MoodDaily.day,))
+    
+    periods = {}
+    totals = {}
+    for row in rows:
+        period = periods.setdefault(_period_start(row['day'], bucket), {})
+        period[row['mood']] = period.get(row['mood'], 0) + row['count']
+        totals[row['mood']] = totals.get(row['mood'], 0) + row['count']
+    
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'bucket': bucket,
+        'source': source or 'all',
+        'series': [{'period': day.isoformat(), 'moods': moods, 'total': sum(moods.values())}
+                   for day, moods in sorted(periods.items())],
+        'totals': totals,
+        'dominant_mood': max(totals, key=totals.get) if totals else None,
+        'complete': mood_rollups_ready(user_id)
+    }
+
+def _as_date(value):
+    # func.date() returns a string on SQLite and a date on PostgreSQL
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+def backfill_user_moods(user_id):
+    """Count a user's existing moods into MoodDaily; returns the number of rows counted"""
+    # Claiming the state row first makes a second worker fail on the primary key
+    db.session.add(MoodRollupState(user_id=user_id))
+    db.session.flush()
+    
+    counts = {}
+    def add(day, source, mood, n):
+        key = (_as_date(day), source, mood)
+        counts[key] = counts.get(key, 0) + n
+    
+    chat_day = func.date(Conversation.timestamp)
+    for day, mood, n in db.session.query(chat_day, Conversation.detected_mood, func.count()).filter(
+            *visible_conversations(user_id), Conversation.detected_mood.isnot(None)).group_by(chat_day, Conversation.detected_mood):
+        add(day, 'chat', mood, n)
+    
+    blocks = db.session.execute(select(ConversationArchive.codec, ConversationArchive.data)
+                                .where(*visible_archive_blocks(user_id)))
+    for codec, data in blocks:
+        for row in unpack_archive_block(codec, data):
+            if row.get('detected_mood'):
+                add(row['timestamp'], 'chat', row['detected_mood'], 1)
+    
+    journal_day = func.date(JournalEntry.timestamp)
+    for day, mood, n in db.session.query(journal_day, JournalEntry.mood, func.count()).filter(
+            JournalEntry.user_id == user_id, JournalEntry.mood.isnot(None)).group_by(journal_day, JournalEntry.mood):
+        add(day, 'journal', mood, n)
+    
+    for (day, source, mood), n in counts.items():
+        _add_mood_count(user_id, day, source, mood, n)
+    total = sum(counts.values())
+    MoodRollupState.query.filter_by(user_id=user_id).update({MoodRollupState.backfilled_rows: total}, synchronize_session=False)
+    bump_collection_version(user_id, 'moods')
+    db.session.commit()
+    return total
+
+@background_job(interval_seconds=300)
+def backfill_mood_rollups():
+    pending = [row[0] for row in db.session.query(User.id).outerjoin(
+        MoodRollupState, MoodRollupState.user_id == User.id
+    ).filter(MoodRollupState.user_id.is_(None)).order_by(User.id).limit(MOOD_BACKFILL_USERS_PER_RUN)]
+    for user_id in pending:
+        try:
+            counted = backfill_user_moods(user_id)
+            log_event('moods.backfilled', user_id=user_id, rows=counted)
+        except Exception as e:
+            db.session.rollback()
+            log_event('moods.backfill_failed', level='warning', user_id=user_id, error=e)
+
+# ===== USER STATS =====
+# One UserStats row per user with message counts, first/last message times,
+# a snapshot of the first few messages and memory/journal counts. Write paths
+# adjust it in the same transaction as the rows they add or remove; the
+# reconcile job recomputes rows from the source tables (including archive
+# blocks) to create them for older users and correct any drift. Users
+# without a row yet get their stats computed on the fly.
+FIRST_SESSION_ROWS = 10
+FIRST_SESSION_CONTENT_CHARS = 300
+USER_STATS_RECONCILE_DAYS = 1
+USER_STATS_RECONCILE_USERS_PER_RUN = 100
+
+def bump_user_stats(user_id, **deltas):
+    """Add deltas to a user's counters; caller commits with its own writes"""
+    values = {name: getattr(UserStats, name) + delta for name, delta in deltas.items() if delta}
+    if values:
+        db.session.execute(db.update(UserStats).where(UserStats.user_id == user_id).values(**values))
+
+def record_message_stats(conv):
+    """Count one newly added Conversation; caller commits with its own writes"""
+    db.session.flush()  # assigns the row's timestamp
+    user_id, role, content, when = conv.user_id, conv.role, conv.content, conv.timestamp
+    counter = 'user_messages' if role == 'user' else 'assistant_messages'
+    row = db.session.execute(
+        db.update(UserStats).where(UserStats.user_id == user_id).values(**{
+            counter: getattr(UserStats, counter) + 1,
+            'first_message_at': func.coalesce(UserStats.first_message_at, when),
+            'last_message_at': when,
+        }).returning(UserStats.user_messages, UserStats.assistant_messages, UserStats.first_session)
+    ).first()
+    if row is None or row.user_messages + row.assistant_messages > FIRST_SESSION_ROWS:
+        return
+    snapshot = json.loads(row.first_session or '[]')
+    snapshot.append({'role': role, 'content': (content or '')[:FIRST_SESSION_CONTENT_CHARS], 'timestamp': when.isoformat()})
+    db.session.execute(db.update(UserStats).where(UserStats.user_id == user_id)
+                       .values(first_session=json.dumps(snapshot)))
+
+def reset_message_stats(user_id):
+    """Forget all messages (clear-history); caller commits"""
+    db.session.execute(db.update(UserStats).where(UserStats.user_id == user_id).values(
+        user_messages=0, assistant_messages=0, first_message_at=None, last_message_at=None, first_session='[]'))
+
+def compute_user_stats(user_id):
+    """Recount a user's stats from the source tables (an unsaved UserStats)"""
+    stats = UserStats(user_id=user_id, user_messages=0, assistant_messages=0, memory_count=0, journal_count=0)
+    
+    for role, count, first, last in db.session.query(
+            Conversation.role, func.count(), func.min(Conversation.timestamp), func.max(Conversation.timestamp)
+    ).filter(*visible_conversations(user_id)).group_by(Conversation.role):
+        if role == 'user':
+            stats.user_messages += count
+        else:
+            stats.assistant_messages += count
+        stats.first_message_at = min(filter(None, (stats.first_message_at, first)), default=None)
+        stats.last_message_at = max(filter(None, (stats.last_message_at, last)), default=None)
+    
+    blocks = db.session.execute(select(ConversationArchive.codec, ConversationArchive.data,
+                                       ConversationArchive.first_timestamp, ConversationArchive.last_timestamp)
+                                .where(*visible_archive_blocks(user_id)))
+    for codec, data, first, last in blocks:
+        for row in unpack_archive_block(codec, data):
+            if row['role'] == 'user':
+                stats.user_messages += 1
+            else:
+                stats.assistant_messages += 1
+        stats.first_message_at = min(filter(None, (stats.first_message_at, first)), default=None)
+        stats.last_message_at = max(filter(None, (stats.last_message_at, last)), default=None)
+    
+    stats.first_session = json.dumps([
+        {'role': row['role'], 'content': (row['content'] or '')[:FIRST_SESSION_CONTENT_CHARS],
+         'timestamp': row['timestamp'] if isinstance(row['timestamp'], str) else row['timestamp'].isoformat()}
+        for row in load_conversation_rows(user_id, limit=FIRST_SESSION_ROWS)
+    ])
+    stats.memory_count = db.session.query(func.count(UserMemory.id)).filter(UserMemory.user_id == user_id).scalar()
+    stats.journal_count = db.session.query(func.count(JournalEntry.id)).filter(JournalEntry.user_id == user_id).scalar()
+    return stats
+
+USER_STATS_FIELDS = ('user_messages', 'assistant_messages', 'first_message_at', 'last_message_at',
+                     'first_session', 'memory_count', 'journal_count')
+
+def get_user_stats(user_id):
+    """The user's stats row; users the reconcile job hasn't reached yet are counted and saved on first use"""
+    stats = db.session.get(UserStats, user_id)
+    if stats is not None:
+        return stats
+    stats = compute_user_stats(user_id)
+    stats.reconciled_at = datetime.utcnow()
+    # Its own transaction, so whatever the caller has pending isn't committed with it
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(UserStats).values(
+                user_id=user_id, reconciled_at=stats.reconciled_at,
+                **{name: getattr(stats, name) for name in USER_STATS_FIELDS}))
+    except IntegrityError:
+        pass  # another request saved it first
+    return stats
+
+def user_stats_totals():
+    """Site-wide totals for the health endpoints; message, memory and journal totals are summed from the stats rows"""
+    stats_rows, messages, memories, journal_entries = db.session.query(
+        func.count(),
+        func.coalesce(func.sum(UserStats.user_messages + UserStats.assistant_messages), 0),
+        func.coalesce(func.sum(UserStats.memory_count), 0),
+        func.coalesce(func.sum(UserStats.journal_count), 0),
+    ).one()
+    return {'users': User.query.count(), 'users_with_stats': stats_rows, 'conversations': int(messages),
+            'memories': int(memories), 'journal_entries': int(journal_entries)}
+
+def refresh_user_stats(user_id):
+    """Recount a user's stats row (creating it if needed); returns {field: (stored, actual)} for drifted counters"""
+    fresh = compute_user_stats(user_id)
+    fresh.reconciled_at = datetime.utcnow()
+    current = db.session.get(UserStats, user_id)
+    if current is None:
+        db.session.add(fresh)
+        return {}
+    drift = {name: (getattr(current, name), getattr(fresh, name)) for name in USER_STATS_FIELDS
+             if name != 'first_session' and getattr(current, name) != getattr(fresh, name)}
+    for name in USER_STATS_FIELDS + ('reconciled_at',):
+        setattr(current, name, getattr(fresh, name))
+    return drift
+
+@background_job(interval_seconds=3600)
+def reconcile_user_stats():
+    """Create missing stats rows and recount stale ones, correcting drift"""
+    stale_before = datetime.utcnow() - timedelta(days=USER_STATS_RECONCILE_DAYS)
+    user_ids = [uid for (uid,) in db.session.query(User.id).outerjoin(UserStats, UserStats.user_id == User.id).filter(
+        or_(UserStats.user_id.is_(None), UserStats.reconciled_at < stale_before)
+    ).order_by(UserStats.reconciled_at.is_not(None), UserStats.reconciled_at).limit(USER_STATS_RECONCILE_USERS_PER_RUN)]
+    
+    for user_id in user_ids:
+        try:
+            drift = refresh_user_stats(user_id)
+            if drift:
+                log_event('user_stats.drift', level='warning', user_id=user_id,
+                          fields={name: {'stored': str(old), 'actual': str(new)} for name, (old, new) in drift.items()})
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            log_event('user_stats.reconcile_failed', level='error', user_id=user_id, error=e)
+    if user_ids:
+        log_event('user_stats.reconciled', users=len(user_ids))
+
+# ===== MEDIA PRE-SCREENING =====
+# Uploads are checked on a small grayscale copy before Gemini sees them:
+#   blank   - intensity histogram entropy below MEDIA_MIN_ENTROPY bits
+#   dark    - mean intensity below MEDIA_DARK_MEAN
+#   blurry  - variance of the Laplacian below MEDIA_BLUR_THRESHOLD
+# Those are rejected with a message the chat shows. Images that pass get a
+# 64-bit DCT perceptual hash; if the user sent a near-identical image (within
+# MEDIA_DUPLICATE_DISTANCE bits) with the same message recently, its stored
+# analysis is reused instead of calling Gemini again. For videos, frames at
+# VIDEO_FRAME_POSITIONS are tried in turn until one passes.
+MEDIA_SCREEN_SIZE = 256
+MEDIA_MIN_ENTROPY = float(os.environ.get('MEDIA_MIN_ENTROPY', 1.0))
+MEDIA_DARK_MEAN = float(os.environ.get('MEDIA_DARK_MEAN', 12))
+MEDIA_BLUR_THRESHOLD = float(os.environ.get('MEDIA_BLUR_THRESHOLD', 15.0))
+MEDIA_DUPLICATE_DISTANCE = int(os.environ.get('MEDIA_DUPLICATE_DISTANCE', 4))
+MEDIA_DUPLICATE_LOOKBACK = 50
+MEDIA_DUPLICATE_DAYS = 30
+VIDEO_FRAME_POSITIONS = (0.3, 0.5, 0.7)
+MEDIA_REJECT_MESSAGES = {
+    'blank': "That looks like a blank image, so there's nothing for me to see. Could you try another one?",
+    'dark': "That came out almost completely dark. Could you try one with a bit more light?",
+    'blurry': "That's too blurry for me to make out. Could you try a sharper one?",
+}
+
+def downscale_gray(rgb):
+    """RGB array -> grayscale uint8 array no larger than MEDIA_SCREEN_SIZE on either side"""
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    scale = MEDIA_SCREEN_SIZE / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+def load_screen_image(path):
+    """Decode an image straight to a small grayscale array (JPEGs decode at reduced scale)"""
+    with Image.open(path) as img:
+        img.draft('L', (MEDIA_SCREEN_SIZE, MEDIA_SCREEN_SIZE))
+        img = img.convert('L')
+        img.thumbnail((MEDIA_SCREEN_SIZE, MEDIA_SCREEN_SIZE))
+        return np.asarray(img, dtype=np.uint8)
+
+def perceptual_hash(gray):
+    """64-bit pHash: signs of the low-frequency 8x8 DCT block against its median"""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    block = cv2.dct(small)[:8, :8].ravel()
+    bits = block > np.median(block[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+def screen_media(gray):
+    """Measure a downscaled grayscale image; returns its verdict, measurements and hash"""
+    histogram = np.bincount(gray.ravel(), minlength=256) / gray.size
+    nonzero = histogram[histogram > 0]
+    result = {
+        'mean': float(gray.mean()),
+        'entropy': float(-(nonzero * np.log2(nonzero)).sum()),
+        'sharpness': float(cv2.Laplacian(gray, cv2.CV_64F).var()),
+    }
+    if result['entropy'] < MEDIA_MIN_ENTROPY:
+        result['verdict'] = 'blank'
+    elif result['mean'] < MEDIA_DARK_MEAN:
+        result['verdict'] = 'dark'
+    elif result['sharpness'] < MEDIA_BLUR_THRESHOLD:
+        result['verdict'] = 'blurry'
+    else:
+        result['verdict'] = 'ok'
+        result['phash'] = perceptual_hash(gray)
+    return result
+
+def media_prompt_key(prompt):
+    return hashlib.sha256(' '.join((prompt or '').lower().split()).encode('utf-8')).hexdigest()[:16]
+
+def _signed64(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def find_duplicate_analysis(user_id, phash, prompt):
+    """Analysis of the closest recent upload within MEDIA_DUPLICATE_DISTANCE bits, if any"""
+    rows = db.session.execute(
+        select(MediaFingerprint.phash, MediaFingerprint.analysis).where(
+            MediaFingerprint.user_id == user_id,
+            MediaFingerprint.prompt_key == media_prompt_key(prompt),
+            MediaFingerprint.created_at >= datetime.utcnow() - timedelta(days=MEDIA_DUPLICATE_DAYS),
+        ).order_by(MediaFingerprint.created_at.desc()).limit(MEDIA_DUPLICATE_LOOKBACK)
+    ).all()
+    if not rows:
+        return None
+    hashes = np.array([row.phash for row in rows], dtype=np.int64).view(np.uint64)
+    distances = np.bitwise_count(hashes ^ np.array(_signed64(phash), dtype=np.int64).view(np.uint64))
+    best = int(distances.argmin())
+    return rows[best].analysis if distances[best] <= MEDIA_DUPLICATE_DISTANCE else None
+
+def remember_media_analysis(user_id, phash, prompt, media_type, analysis):
+    db.session.add(MediaFingerprint(user_id=user_id, phash=_signed64(phash), prompt_key=media_prompt_key(prompt),
+                                    media_type=media_type, analysis=analysis))
+    db.session.commit()
+
+@background_job(interval_seconds=86400)
+def expire_media_fingerprints():
+    cutoff = datetime.utcnow() - timedelta(days=MEDIA_DUPLICATE_DAYS)
+    MediaFingerprint.query.filter(MediaFingerprint.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+
+# ===== DATA EXPORT & IMPORT =====
+# /api/export streams a zip with one NDJSON member per collection plus a
+# manifest. Rows come from yield_per queries (server-side cursors on
+# Postgres) and archive blocks one at a time, and the zip is written to a
+# sink that is drained into the response every EXPORT_CHUNK_BYTES, so memory
+# stays flat however much history a user has. /api/import takes the same zip
+# and appends its rows to the current account with multi-row INSERTs of
+# IMPORT_BATCH_ROWS, then brings the counters derived from them up to date.
+EXPORT_FORMAT = 'homie-export'
+EXPORT_VERSION = 1
+EXPORT_BATCH_ROWS = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_BATCH_ROWS = 1000
+IMPORT_MAX_UNCOMPRESSED_BYTES = int(os.environ.get('IMPORT_MAX_UNCOMPRESSED_BYTES', 1024 * 1024 * 1024))
+
+# Collection name -> (model, exported columns, collection version to bump on import)
+EXPORT_COLLECTIONS = {
+    'conversations': (Conversation, HISTORY_COLUMNS, 'history'),
+    'journal_entries': (JournalEntry, (JournalEntry.title, JournalEntry.content, JournalEntry.mood,
+                                       JournalEntry.timestamp), 'journal'),
+    'reminders': (Reminder, (Reminder.title, Reminder.date, Reminder.time, Reminder.repeat, Reminder.is_active,
+                             Reminder.created_at), 'reminders'),
+    'memories': (UserMemory, (UserMemory.memory_type, UserMemory.content, UserMemory.importance_score,
+                              UserMemory.last_referenced, UserMemory.created_at), 'memories'),
+    'summaries': (ConversationSummary, (ConversationSummary.summary, ConversationSummary.key_topics,
+                                        ConversationSummary.emotional_tone, ConversationSummary.date_range,
+                                        ConversationSummary.created_at), None),
+}
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, non-seekable buffer the zip writer fills and the response drains"""
+    def __init__(self):
+        self._chunks = []
+        self.pending = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self.pending = 0
+        return data
+
+def _stream_rows(columns, *criteria, order_by=()):
+    keys = [column.key for column in columns]
+    result = db.session.execute(select(*columns).where(*criteria).order_by(*order_by)
+                                .execution_options(yield_per=EXPORT_BATCH_ROWS))
+    for partition in result.partitions():
+        for row in partition:
+            yield dict(zip(keys, row))
+
+def export_rows(user_id, collection):
+    """Rows of one collection for the export, oldest first, without ids"""
+    model, columns, _ = EXPORT_COLLECTIONS[collection]
+    if collection == 'conversations':
+        # Archive blocks first (they hold the oldest rows), one block in memory at a time
+        block_ids = [row[0] for row in db.session.execute(
+            select(ConversationArchive.id).where(*visible_archive_blocks(user_id))
+            .order_by(ConversationArchive.first_timestamp, ConversationArchive.min_id))]
+        for block_id in block_ids:
+            codec, data = db.session.execute(select(ConversationArchive.codec, ConversationArchive.data)
+                                             .where(ConversationArchive.id == block_id)).one()
+            for row in unpack_archive_block(codec, data):
+                row.pop('id', None)
+                yield row
+        yield from _stream_rows(columns, *visible_conversations(user_id), order_by=(Conversation.id,))
+    else:
+        yield from _stream_rows(columns, model.user_id == user_id, order_by=(model.id,))
+
+def export_user_zip(user_id, username):
+    """Generate the export zip for a user in chunks"""
+    sink = _ZipSink()
+    counts = {}
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        for collection in EXPORT_COLLECTIONS:
+            counts[collection] = 0
+            with archive.open(f"{collection}.ndjson", 'w', force_zip64=True) as member:
+                for row in export_rows(user_id, collection):
+                    member.write(dumps_json(row) + b"\n")
+                    counts[collection] += 1
+                    if sink.pending >= EXPORT_CHUNK_BYTES:
+                        yield sink.drain()
+        archive.writestr('manifest.json', json.dumps({
+            'format': EXPORT_FORMAT,
+            'version': EXPORT_VERSION,
+            'exported_at': datetime.now(timezone.utc).isoformat(),
+            'username': username,
+            'counts': counts,
+        }, indent=2))
+    yield sink.drain()
+    log_event('export.finished', user_id=user_id, counts=counts)
+
+def _import_converter(column):
+    """Function coercing an NDJSON value to the column's type (raising ValueError/TypeError if it can't)"""
+    column = column.property.columns[0]
+    if isinstance(column.type, db.DateTime):
+        def convert(value):
+            parsed = datetime.fromisoformat(value)
+            return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+    elif isinstance(column.type, db.Boolean):
+        convert = bool
+    elif isinstance(column.type, db.Integer):
+        convert = int
+    else:
+        length = getattr(column.type, 'length', None)
+        def convert(value):
+            value = value if isinstance(value, str) else json.dumps(value)
+            return value[:length] if length else value
+    
+    default = column.default
+    def convert_or_default(value):
+        if value is not None:
+            return convert(value)
+        if default is not None:
+            return default.arg(None) if default.is_callable else default.arg
+        if column.nullable is False:
+            raise ValueError(f"{column.key} is required")
+        return None
+    return convert_or_default
+
+def import_user_zip(user_id, archive):
+    """Append an export zip's rows to a user's account; caller commits. Returns (imported, skipped) counts"""
+    imported, skipped = {}, {}
+    mood_counts_by_key = {}
+    
+    for collection, (model, columns, _) in EXPORT_COLLECTIONS.items():
+        imported[collection] = skipped[collection] = 0
+        name = f"{collection}.ndjson"
+        if name not in archive.namelist():
+            continue
+        
+        converters = [(column.key, _import_converter(column)) for column in columns]
+        batch = []
+        def flush():
+            if batch:
+                db.session.execute(db.insert(model), batch)
+                imported[collection] += len(batch)
+                batch.clear()
+        
+        with archive.open(name) as member:
+            for line in io.TextIOWrapper(member, encoding='utf-8'):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                    row = {key: convert(data.get(key)) for key, convert in converters}
+                except (ValueError, TypeError, AttributeError):
+                    skipped[collection] += 1
+                    continue
+                row['user_id'] = user_id
+                batch.append(row)
+                
+                mood, when = row.get('detected_mood') or row.get('mood'), row.get('timestamp')
+                if mood and when and collection in ('conversations', 'journal_entries'):
+                    key = (when.date(), 'chat' if collection == 'conversations' else 'journal', mood)
+                    mood_counts_by_key[key] = mood_counts_by_key.get(key, 0) + 1
+                
+                if len(batch) >= IMPORT_BATCH_ROWS:
+                    flush()
+        flush()
+    
+    for collection, (_, _, version) in EXPORT_COLLECTIONS.items():
+        if version and imported[collection]:
+            bump_collection_version(user_id, version)
+    # Users still waiting for the mood backfill get these rows counted by it
+    if mood_counts_by_key and mood_rollups_ready(user_id):
+        for (day, source, mood), n in mood_counts_by_key.items():
+            _add_mood_count(user_id, day, source, mood, n)
+        bump_collection_version(user_id, 'moods')
+    refresh_user_stats(user_id)
+    return imported, skipped
+
+# ===== MEMORY CONSOLIDATION =====
+# Keeps each user's UserMemory rows bounded. A pass over one user:
+#   1. decays importance by one point per MEMORY_DECAY_DAYS since last_referenced
+#      (only the steps that elapsed since the previous pass, so it never compounds),
+#   2. merges near-duplicate memories of the same type into the strongest one,
+#   3. drops the weakest memories above MEMORY_CAP_PER_USER.
+# Only users whose 'memories' version moved since their last pass are picked up,
+# plus a slow sweep so unchanged memories still decay.
+MEMORY_DECAY_DAYS = int(os.environ.get('MEMORY_DECAY_DAYS', 30))
+MEMORY_CAP_PER_USER = int(os.environ.get('MEMORY_CAP_PER_USER', 100))
+MEMORY_MERGE_THRESHOLD = float(os.environ.get('MEMORY_MERGE_THRESHOLD', 0.7))
+MEMORY_SWEEP_DAYS = 7
+MEMORY_USERS_PER_RUN = 50
+
+def _utc_naive(value):
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _memory_tokens(content):
+    return set(re.findall(r"[a-z0-9']+", content.lower()))
+
+def memory_similarity(a, b):
+    """Jaccard similarity of the two memories' word sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def _decay_steps(last_referenced, previous_pass, now):
+    step = timedelta(days=MEMORY_DECAY_DAYS)
+    steps_now = (now - last_referenced) // step
+    if previous_pass is None or previous_pass <= last_referenced:
+        return steps_now
+    return steps_now - (previous_pass - last_referenced) // step
+
+def consolidate_user_memories(user_id, now=None):
+    """Run one consolidation pass; returns counts of decayed, merged and capped memories"""
+    now = now or datetime.utcnow()
+    state = db.session.get(MemoryConsolidationState, user_id)
+    previous_pass = state.consolidated_at if state else None
+    memories = UserMemory.query.filter_by(user_id=user_id).all()
+    stats = {'decayed': 0, 'merged': 0, 'capped': 0}
+    
+    for memory in memories:
+        memory.last_referenced = _utc_naive(memory.last_referenced) or _utc_naive(memory.created_at) or now
+        steps = _decay_steps(memory.last_referenced, previous_pass, now)
+        if steps > 0 and memory.importance_score > 1:
+            memory.importance_score = max(1, memory.importance_score - steps)
+            stats['decayed'] += 1
+    
+    # Strongest first, so each cluster keeps its most important, most recent memory
+    memories.sort(key=lambda m: (m.importance_score, m.last_referenced), reverse=True)
+    kept = []
+    clusters = {}
+    for memory in memories:
+        tokens = _memory_tokens(memory.content)
+        target = next((keeper for keeper, keeper_tokens in clusters.get(memory.memory_type, [])
+                       if memory_similarity(tokens, keeper_tokens) >= MEMORY_MERGE_THRESHOLD), None)
+        if target is None:
+            clusters.setdefault(memory.memory_type, []).append((memory, tokens))
+            kept.append(memory)
+            continue
+        target.importance_score = min(10, max(target.importance_score, memory.importance_score))
+        target.last_referenced = max(target.last_referenced, memory.last_referenced)
+        target.created_at = min(filter(None, (target.created_at, memory.created_at)), default=target.created_at)
+        db.session.delete(memory)
+        stats['merged'] += 1
+    
+    for memory in kept[MEMORY_CAP_PER_USER:]:
+        db.session.delete(memory)
+        stats['capped'] += 1
+    
+    if any(stats.values()):
+        bump_collection_version(user_id, 'memories')
+        bump_user_stats(user_id, memory_count=-(stats['merged'] + stats['capped']))
+    db.session.flush()
+    version = db.session.query(CollectionVersion.version).filter_by(user_id=user_id, collection='memories').scalar() or 0
+    if state is None:
+        db.session.add(MemoryConsolidationState(user_id=user_id, memory_version=version, consolidated_at=now))
+    else:
+        state.memory_version = version
+        state.consolidated_at = now
+    db.session.commit()
+    return stats
+
+@background_job(interval_seconds=600)
+def consolidate_memories():
+    sweep_before = datetime.utcnow() - timedelta(days=MEMORY_SWEEP_DAYS)
+    dirty = db.session.query(UserMemory.user_id).outerjoin(
+        MemoryConsolidationState, MemoryConsolidationState.user_id == UserMemory.user_id
+    ).outerjoin(
+        CollectionVersion, and_(CollectionVersion.user_id == UserMemory.user_id, CollectionVersion.collection == 'memories')
+    ).filter(or_(
+        MemoryConsolidationState.user_id.is_(None),
+        CollectionVersion.version > MemoryConsolidationState.memory_version,
+        MemoryConsolidationState.consolidated_at < sweep_before
+    )).distinct().limit(MEMORY_USERS_PER_RUN)
+    
+    for user_id in [row[0] for row in dirty]:
+        try:
+            stats = consolidate_user_memories(user_id)
+            if any(stats.values()):
+                log_event('memory.consolidated', user_id=user_id, **stats)
+        except Exception as e:
+            db.session.rollback()
+            log_event('memory.consolidation_failed', level='warning', user_id=user_id, error=e)
+
+# ===== ADMISSION CONTROL =====
+# LLM-backed endpoints are guarded twice before any work happens:
+#   - a token bucket per user and endpoint (429 + Retry-After when empty),
+#   - a global cap on in-flight calls per provider (503 + Retry-After when
+#     no slot frees up within ADMISSION_WAIT_SECONDS).
+# State lives in LIMITER_BACKEND:
+#   redis    - Lua scripts on REDIS_URL, shared by every worker (default with REDIS_URL)
+#   memory   - per-process (default otherwise), so each worker applies the limits on its own
+#   database - conditional UPDATE/INSERT on the app database, shared without Redis;
+#              only when asked for, since it adds writes to every guarded request
+# If the backend errors we fail open rather than take the app down with it.
+def _parse_rate(spec):
+    """'20/60' -> (rate per second, burst): 20 requests per 60 s, bursts of 20"""
+    count, _, seconds = spec.partition('/')
+    return float(count) / float(seconds or 1), float(count)
+
+RATE_LIMITS = {
+    'chat': _parse_rate(os.environ.get('RATE_LIMIT_CHAT', '20/60')),
+    'upload_media': _parse_rate(os.environ.get('RATE_LIMIT_UPLOAD', '6/60')),
+    'export': _parse_rate(os.environ.get('RATE_LIMIT_EXPORT', '3/3600')),
+    'import': _parse_rate(os.environ.get('RATE_LIMIT_IMPORT', '3/3600')),
+}
+PROVIDER_CONCURRENCY = {
+    'groq': int(os.environ.get('GROQ_MAX_CONCURRENCY', 3)),
+    'gemini': int(os.environ.get('GEMINI_MAX_CONCURRENCY', 2)),
+}
+ADMISSION_WAIT_SECONDS = float(os.environ.get('ADMISSION_WAIT_SECONDS', 1.0))
+PROVIDER_RETRY_AFTER = 2
+# Slightly longer than the gunicorn timeout, so a killed worker's leases expire
+PROVIDER_LEASE_TTL = 130
+
+class MemoryLimiterBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._leases = {}
+    
+    def take(self, key, rate, burst, cost=1.0):
+        """Spend tokens; returns 0 when admitted, else seconds until enough have refilled"""
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+    
+    def acquire(self, name, limit, token):
+        now = time.time()
+        with self._lock:
+            leases = {t: exp for t, exp in self._leases.get(name, {}).items() if exp > now}
+            admitted = len(leases) < limit
+            if admitted:
+                leases[token] = now + PROVIDER_LEASE_TTL
+            self._leases[name] = leases
+            return admitted
+    
+    def release(self, name, token):
+        with self._lock:
+            self._leases.get(name, {}).pop(token, None)
+
+class DatabaseLimiterBackend:
+    """Limiter state in the app database; each call is its own short transaction"""
+    
+    def take(self, key, rate, burst, cost=1.0):
+        now = time.time()
+        refilled = RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate
+        available = db.case((refilled > burst, burst), else_=refilled)
+        with db.engine.begin() as conn:
+            spent = conn.execute(db.update(RateLimitBucket).where(
+                RateLimitBucket.key == key, available >= cost
+            ).values(tokens=available - cost, updated_at=now)).rowcount
+            if spent:
+                return 0
+            row = conn.execute(select(RateLimitBucket.tokens, RateLimitBucket.updated_at)
+                               .where(RateLimitBucket.key == key)).first()
+            if row is None:
+                conn.execute(db.insert(RateLimitBucket).values(key=key, tokens=burst - cost, updated_at=now))
+                return 0
+        tokens = min(burst, row.tokens + (now - row.updated_at) * rate)
+        return max(0.0, (cost - tokens) / rate)
+    
+    def acquire(self, name, limit, token):
+        now = time.time()
+        active = select(func.count()).select_from(ProviderLease).where(
+            ProviderLease.name == name, ProviderLease.expires_at > now).scalar_subquery()
+        with db.engine.begin() as conn:
+            if conn.dialect.name == 'postgresql':
+                # Under READ COMMITTED concurrent callers would all see the same
+                # count and all insert; queue them per name until commit instead.
+                # SQLite already serializes writers.
+                conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:lock))"), {'lock': f"provider_lease:{name}"})
+            conn.execute(delete(ProviderLease).where(ProviderLease.name == name, ProviderLease.expires_at <= now))
+            inserted = conn.execute(db.insert(ProviderLease).from_select(
+                ['name', 'token', 'expires_at'],
+                select(db.literal(name), db.literal(token), db.literal(now + PROVIDER_LEASE_TTL)).where(active < limit)
+            )).rowcount
+        return bool(inserted)
+    
+    def release(self, name, token):
+        with db.engine.begin() as conn:
+            conn.execute(delete(ProviderLease).where(ProviderLease.token == token))
+
+class RedisLimiterBackend:
+    TAKE_SCRIPT = """
+    local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local retry = 0
+    if tokens >= cost then tokens = tokens - cost else retry = (cost - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return tostring(retry)
+    """
+    ACQUIRE_SCRIPT = """
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+    if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+        redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+        redis.call('EXPIRE', KEYS[1], ARGV[5])
+        return 1
+    end
+    return 0
+    """
+    
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+        self._acquire = self.client.register_script(self.ACQUIRE_SCRIPT)
+    
+    def take(self, key, rate, burst, cost=1.0):
+        return float(self._take(keys=[f"homie:bucket:{key}"], args=[rate, burst, cost, time.time()]))
+    
+    def acquire(self, name, limit, token):
+        now = time.time()
+        return bool(self._acquire(keys=[f"homie:leases:{name}"],
+                                  args=[now, limit, now + PROVIDER_LEASE_TTL, token, PROVIDER_LEASE_TTL]))
+    
+    def release(self, name, token):
+        self.client.zrem(f"homie:leases:{name}", token)
+
+limiter_backend = _select_backend('LIMITER_BACKEND', {
+    'redis': RedisLimiterBackend, 'database': DatabaseLimiterBackend, 'memory': MemoryLimiterBackend,
+})
+
+def _limiter_call(method, *args, default):
+    try:
+        return getattr(limiter_backend, method)(*args)
+    except Exception as e:
+        log_event('admission.backend_error', level='warning', backend=type(limiter_backend).__name__, error=e)
+        return default
+
+def acquire_provider_slot(provider, priority=False):
+    """
+    Lease one of the provider's global slots, waiting at most ADMISSION_WAIT_SECONDS.
+    Priority callers may also use the SAFE_SPACE_RESERVED_SLOTS held back from
+    everyone else, and wait a little longer for one.
+    """
+    token = uuid.uuid4().hex
+    limit = PROVIDER_CONCURRENCY[provider] + (SAFE_SPACE_RESERVED_SLOTS if priority else 0)
+    deadline = time.monotonic() + (SAFE_SPACE_ADMISSION_WAIT_SECONDS if priority else ADMISSION_WAIT_SECONDS)
+    delay = 0.05
+    while True:
+        if _limiter_call('acquire', provider, limit, token, default=True):
+            return token
+        if time.monotonic() + delay > deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.4)
+
+def shed_response(status, retry_after, message, reason):
+    metrics.inc('homie_admission_rejected_total', {'endpoint': current_endpoint(), 'reason': reason})
+    log_event('admission.rejected', status=status, reason=reason, retry_after=retry_after)
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admission_control(limit_name, provider=None, priority=None):
+    """
+    Rate limit the view per user and hold a provider slot while it runs.
+    When priority() is true for the request it is never rate limited and may
+    use the reserved provider slots.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if 'user_id' not in session:
+                return view(*args, **kwargs)
+            
+            with timed_phase('admission'):
+                urgent = bool(priority and priority())
+                rate, burst = RATE_LIMITS[limit_name]
+                wait = _limiter_call('take', f"{limit_name}:{session['user_id']}", rate, burst, default=0)
+                if wait > 0 and not urgent:
+                    return shed_response(429, max(1, math.ceil(wait)),
+                                         "You're sending messages a little fast. Give me a moment and try again.",
+                                         'rate_limited')
+                token = acquire_provider_slot(provider, priority=urgent) if provider else None
+                if provider and token is None:
+                    return shed_response(503, PROVIDER_RETRY_AFTER,
+                                         "I'm talking to a lot of people right now. Please try again in a few seconds.",
+                                         'provider_busy')
+            if not token:
+                return view(*args, **kwargs)
+            def release():
+                with app.app_context():
+                    _limiter_call('release', provider, token, default=None)
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except Exception:
+                release()
+                raise
+            # A streamed turn keeps calling the provider until the body is sent
+            if response.is_streamed:
+                response.call_on_close(release)
+            else:
+                release()
+            return response
+        return wrapped
+    return decorator
+
+# ===== SAFE SPACE FAST PATH =====
+# A turn that trips is_distress_detected() skips everything that isn't the
+# reply itself: the safe-space prompt doesn't use the profile so it isn't
+# built, memory extraction runs after the response has been sent, the summary
+# refresh is skipped, and the completion sees a short history with a small
+# token cap. Admission control lets these turns through the rate limit and
+# into SAFE_SPACE_RESERVED_SLOTS provider slots that normal turns can't take.
+SAFE_SPACE_HISTORY_ROWS = int(os.environ.get('SAFE_SPACE_HISTORY_ROWS', 8))
+SAFE_SPACE_MAX_TOKENS = int(os.environ.get('SAFE_SPACE_MAX_TOKENS', 300))
+SAFE_SPACE_RESERVED_SLOTS = int(os.environ.get('SAFE_SPACE_RESERVED_SLOTS', 1))
+SAFE_SPACE_ADMISSION_WAIT_SECONDS = float(os.environ.get('SAFE_SPACE_ADMISSION_WAIT_SECONDS', 5.0))
+# Time from request start to the complete reply (or first token when streamed)
+SAFE_SPACE_SLO_SECONDS = float(os.environ.get('SAFE_SPACE_SLO_SECONDS', 2.5))
+
+def is_safe_space_request():
+    """Whether the current chat request's message is a distress message (cached on g)"""
+    if 'safe_space' not in g:
+        data = request.get_json(silent=True) or {}
+        message = data.get('message') or ''
+        g.safe_space = bool(message) and is_distress_detected(message, detect_mood(message))
+    return g.safe_space
+
+def record_safe_space_latency(kind, slo):
+    """Observe a safe-space turn's latency; kind is 'reply' or 'first_token'"""
+    start = g.get('request_start')
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    metrics.observe('homie_safe_space_seconds', elapsed, {'kind': kind})
+    if slo:
+        within = elapsed <= SAFE_SPACE_SLO_SECONDS
+        metrics.inc('homie_safe_space_turns_total', {'slo': 'met' if within else 'missed'})
+        if not within:
+            log_event('safe_space.slo_missed', level='warning', kind=kind,
+                      elapsed_ms=round(elapsed * 1000, 1), slo_ms=SAFE_SPACE_SLO_SECONDS * 1000)
+
+def defer_until_sent(fn, *args):
+    """Run fn(*args) in an app context once the current response has been sent"""
+    g.setdefault('deferred_tasks', []).append((fn, args))
+
+@app.after_request
+def schedule_deferred_tasks(response):
+    # A streamed body is generated after this hook, so its tasks are
+    # collected from the request's g once the stream closes
+    request_g = g._get_current_object()
+    if response.is_streamed or request_g.get('deferred_tasks'):
+        def run():
+            tasks = request_g.pop('deferred_tasks', None)
+            if not tasks:
+                return
+            with app.app_context():
+                for fn, args in tasks:
+                    try:
+                        fn(*args)
+                    except Exception as e:
+                        db.session.rollback()
+                        log_event('deferred_task.failed', level='error', task=fn.__name__, error=e)
+        response.call_on_close(run)
+    return response
+
+# ===== CONTEXT PREWARMING =====
+# Most of a turn's prep doesn't depend on the message: the profile build and
+# the recent-history load. chat.js calls /api/chat/prewarm shortly after the
+# user starts typing; it assembles both and caches them for
+# PREWARM_TTL_SECONDS, stamped with the user's history/memories/moods
+# versions. chat_turn uses the cached context only if those versions are
+# unchanged, and appends the new message to it. The system prompt depends on
+# the message's mood, so it is still rendered per turn; that part is cheap.
+# Prewarming is best effort and sheds itself first: it has its own per-user
+# rate limit, skips the build while the cached context is still valid, and
+# gives up when PREWARM_CONCURRENCY builds are running or the primary's
+# connection pool is exhausted. Neither the rate limit nor (without Redis)
+# the cache touch the database, so prewarm traffic adds no primary writes;
+# with several workers that means a per-worker limit and an occasional miss
+# when the turn lands on another worker.
+PREWARM_ENABLED = os.environ.get('PREWARM_ENABLED', '1') != '0'
+PREWARM_TTL_SECONDS = int(os.environ.get('PREWARM_TTL_SECONDS', 60))
+PREWARM_CONCURRENCY = int(os.environ.get('PREWARM_CONCURRENCY', 2))
+CONTEXT_HISTORY_ROWS = 30
+CONTEXT_COLLECTIONS = ('history', 'memories', 'moods')
+RATE_LIMITS['prewarm'] = _parse_rate(os.environ.get('RATE_LIMIT_PREWARM', '6/60'))
+
+prewarm_slots = threading.BoundedSemaphore(PREWARM_CONCURRENCY)
+prewarm_limiter = MemoryLimiterBackend()
+
+def format_history_messages(rows):
+    """Conversation rows as chat messages, with media context inlined for user turns"""
+    messages = []
+    for conv in rows:
+        if not conv.content or not conv.content.strip():
+            continue
+        if conv.media_analysis and conv.media_type and conv.role == 'user':
+            formatted_content = f"[MEDIA CONTEXT: User shared a {conv.media_type}. Analysis: {conv.media_analysis}]\n\nUser's message: {conv.content}"
+            messages.append({"role": conv.role, "content": formatted_content})
+        else:
+            messages.append({"role": conv.role, "content": conv.content})
+    return messages
+
+def context_versions(user_id):
+    rows = db.session.query(CollectionVersion.collection, CollectionVersion.version).filter(
+        CollectionVersion.user_id == user_id, CollectionVersion.collection.in_(CONTEXT_COLLECTIONS)).all()
+    versions = dict(rows)
+    return ':'.join(str(versions.get(collection, 0)) for collection in CONTEXT_COLLECTIONS)
+
+def build_chat_context(user_id):
+    """Profile and recent history for the user's next turn, leaving room for the new message"""
+    history = Conversation.query.filter(*visible_conversations(user_id)).order_by(
+        Conversation.timestamp.desc()).limit(CONTEXT_HISTORY_ROWS - 1).all()
+    history.reverse()
+    return {
+        'profile': generate_comprehensive_user_profile(user_id),
+        'history': format_history_messages(history),
+    }
+
+class MemoryContextCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+    
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry is None or entry[2] <= time.time():
+            return None
+        return entry[0], entry[1]
+    
+    def put(self, user_id, versions, data):
+        with self._lock:
+            self._entries[user_id] = (versions, data, time.time() + PREWARM_TTL_SECONDS)
+    
+    def expire(self):
+        now = time.time()
+        with self._lock:
+            for user_id in [u for u, entry in self._entries.items() if entry[2] <= now]:
+                del self._entries[user_id]
+
+class DatabaseContextCache:
+    def get(self, user_id):
+        with db.engine.connect() as conn:
+            row = conn.execute(select(PrewarmedContext.versions, PrewarmedContext.data).where(
+                PrewarmedContext.user_id == user_id, PrewarmedContext.expires_at > time.time())).first()
+        return (row.versions, row.data) if row else None
+    
+    def put(self, user_id, versions, data):
+        values = {'versions': versions, 'data': data, 'expires_at': time.time() + PREWARM_TTL_SECONDS}
+        with db.engine.begin() as conn:
+            updated = conn.execute(db.update(PrewarmedContext).where(
+                PrewarmedContext.user_id == user_id).values(**values)).rowcount
+            if not updated:
+                conn.execute(db.insert(PrewarmedContext).values(user_id=user_id, **values))
+    
+    def expire(self):
+        with db.engine.begin() as conn:
+            conn.execute(delete(PrewarmedContext).where(PrewarmedContext.expires_at <= time.time()))
+
+class RedisContextCache:
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    
+    def get(self, user_id):
+        raw = self.client.get(f"homie:context:{user_id}")
+        if raw is None:
+            return None
+        versions, _, data = raw.decode('utf-8').partition('|')
+        return versions, data
+    
+    def put(self, user_id, versions, data):
+        self.client.setex(f"homie:context:{user_id}", PREWARM_TTL_SECONDS, f"{versions}|{data}")
+    
+    def expire(self):
+        pass  # keys expire on their own
+
+context_cache = _select_backend('CONTEXT_CACHE_BACKEND', {
+    'redis': RedisContextCache, 'database': DatabaseContextCache, 'memory': MemoryContextCache,
+})
+
+def _context_cache_call(method, *args):
+    try:
+        return getattr(context_cache, method)(*args)
+    except Exception as e:
+        log_event('prewarm.cache_error', level='warning', backend=type(context_cache).__name__, error=e)
+        return None
+
+def database_saturated():
+    """True when every pooled connection to the primary is checked out"""
+    pool = db.engine.pool
+    try:
+        return pool.checkedout() >= pool.size()
+    except (AttributeError, TypeError):
+        return False
+
+def prewarm_context(user_id):
+    """Build and cache the user's next-turn context; returns the outcome"""
+    if not PREWARM_ENABLED:
+        return 'disabled'
+    rate, burst = RATE_LIMITS['prewarm']
+    if prewarm_limiter.take(f"prewarm:{user_id}", rate, burst) > 0:
+        return 'rate_limited'
+    
+    # Versions are read before the build, so a write racing it makes the entry stale rather than wrong
+    versions = context_versions(user_id)
+    cached = _context_cache_call('get', user_id)
+    if cached and cached[0] == versions:
+        return 'fresh'
+    
+    if database_saturated() or not prewarm_slots.acquire(blocking=False):
+        return 'busy'
+    try:
+        with timed_phase('prewarm'):
+            data = dumps_json(build_chat_context(user_id)).decode('utf-8')
+    finally:
+        prewarm_slots.release()
+    _context_cache_call('put', user_id, versions, data)
+    return 'warmed'
+
+def take_prewarmed_context(user_id):
+    """The cached context if it's still current for this user, else None"""
+    if not PREWARM_ENABLED:
+        return None
+    cached = _context_cache_call('get', user_id)
+    if cached is None:
+        result = 'miss'
+    elif cached[0] != context_versions(user_id):
+        result = 'stale'
+    else:
+        result = 'hit'
+    metrics.inc('homie_prewarm_lookups_total', {'result': result})
+    return json.loads(cached[1]) if result == 'hit' else None
+
+@background_job(interval_seconds=600)
+def expire_prewarmed_contexts():
+    context_cache.expire()
+
+# ===== IDEMPOTENCY =====
+# Clients send an Idempotency-Key header with chat submissions and reuse it
+# when retrying. The first request with a key claims an in_flight record and
+# does the work; a duplicate that arrives meanwhile waits for that record to
+# finish and replays its response, and later duplicates get the stored
+# response straight away. Transient failures (429, 5xx) are not stored, so a
+# retry after them runs again. Records live in the database so duplicates
+# landing on another gunicorn worker are coalesced too.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 900))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 60))
+# An in_flight record older than this belongs to a request that died (gunicorn timeout)
+IDEMPOTENCY_STALE_SECONDS = 130
+IDEMPOTENCY_POLL_SECONDS = 0.25
+
+def _record_filter(user_id, key):
+    return (IdempotencyRecord.user_id == user_id, IdempotencyRecord.key == key)
+
+def _claim_idempotency_key(user_id, key, endpoint, fingerprint):
+    """Returns None if this request now owns the key, else the existing record row"""
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(IdempotencyRecord).values(
+                user_id=user_id, key=key, endpoint=endpoint, fingerprint=fingerprint, status='in_flight', created_at=now))
+        return None
+    except IntegrityError:
+        pass
+    
+    with db.engine.begin() as conn:
+        # Take over keys whose owner died mid-request or whose result has expired
+        taken = conn.execute(db.update(IdempotencyRecord).where(
+            *_record_filter(user_id, key),
+            IdempotencyRecord.fingerprint == fingerprint,
+            or_(
+                and_(IdempotencyRecord.status == 'in_flight',
+                     IdempotencyRecord.created_at < now - timedelta(seconds=IDEMPOTENCY_STALE_SECONDS)),
+                IdempotencyRecord.created_at < now - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+            )
+        ).values(status='in_flight', status_code=None, body=None, created_at=now)).rowcount
+        if taken:
+            return None
+        return conn.execute(select(IdempotencyRecord).where(*_record_filter(user_id, key))).first()
+
+def _wait_for_idempotent_result(user_id, key):
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(IDEMPOTENCY_POLL_SECONDS)
+        with db.engine.connect() as conn:
+            record = conn.execute(select(IdempotencyRecord).where(*_record_filter(user_id, key))).first()
+        if record is None or record.status == 'done':
+            return record
+    return None
+
+def _replay(record):
+    response = Response(record.body, status=record.status_code, mimetype=record.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _replay_stream_as_json(record):
+    """A turn answered over /api/chat/stream, replayed for the JSON fallback"""
+    # Only completed streams are stored, so the last event is done or error
+    last_event = record.body.decode('utf-8').strip().rsplit('\n\n', 1)[-1]
+    payload = json.loads(last_event.split('data: ', 1)[1])
+    status_code = payload.pop('status', record.status_code)
+    response = Response(dumps_json(payload), status=status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(endpoint, replays=None):
+    """Deduplicate submissions that carry the same Idempotency-Key header
+
+    replays maps other endpoints whose records this one may answer with to
+    the function that turns such a record into a response.
+    """
+    replays = replays or {}
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key', '').strip()
+            if not key or 'user_id' not in session:
+                return view(*args, **kwargs)
+            if len(key) > 64:
+                return jsonify({'error': 'Idempotency-Key must be at most 64 characters'}), 400
+            
+            user_id = session['user_id']
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            record = _claim_idempotency_key(user_id, key, endpoint, fingerprint)
+            
+            if record is not None:
+                if record.fingerprint != fingerprint or (record.endpoint != endpoint and record.endpoint not in replays):
+                    return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+                metrics.inc('homie_idempotent_replays_total', {'endpoint': endpoint, 'state': record.status})
+                if record.status == 'in_flight':
+                    with timed_phase('idempotency_wait'):
+                        record = _wait_for_idempotent_result(user_id, key)
+                    if record is None:
+                        response = jsonify({'error': 'The original request is still being processed'})
+                        response.status_code = 409
+                        response.headers['Retry-After'] = '2'
+                        return response
+                log_event('idempotency.replayed', user_id=user_id, endpoint=endpoint, recorded_by=record.endpoint)
+                return replays.get(record.endpoint, _replay)(record)
+            
+            def finish(response, body):
+                # Also runs from call_on_close, after the app context is gone
+                with app.app_context(), db.engine.begin() as conn:
+                    if response is not None and body is not None and response.status_code < 500 and response.status_code != 429:
+                        conn.execute(db.update(IdempotencyRecord).where(*_record_filter(user_id, key)).values(
+                            status='done', status_code=response.status_code,
+                            mimetype=response.mimetype, body=body))
+                    else:
+                        conn.execute(delete(IdempotencyRecord).where(*_record_filter(user_id, key)))
+            
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except Exception:
+                finish(None, None)
+                raise
+            if not response.is_streamed:
+                finish(response, response.get_data())
+                return response
+            
+            # Record a streamed body as it is sent; a stream cut short is not stored
+            chunks = []
+            completed = []
+            def tee(iterable):
+                for chunk in iterable:
+                    chunk = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                    chunks.append(chunk)
+                    yield chunk
+                completed.append(True)
+            response.response = tee(response.response)
+            response.call_on_close(lambda: finish(response, b''.join(chunks) if completed else None))
+            return response
+        return wrapped
+    return decorator
+
+@background_job(interval_seconds=600)
+def expire_idempotency_records():
+    cutoff = datetime.utcnow() - timedelta(seconds=max(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_STALE_SECONDS))
+    deleted = IdempotencyRecord.query.filter(IdempotencyRecord.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        log_event('idempotency.expired', rows=deleted)
+
+# ===== REALTIME EVENTS =====
+# Each open page keeps one server-sent events stream (/api/events) that
+# carries server-initiated events: collection changes (history, memories,
+# journal, reminders, moods) announced after commit, and reminders falling
+# due. Chat turns stream their tokens over /api/chat/stream in the same
+# format. Under gunicorn's gthread worker each open stream holds a thread, so
+# EVENT_STREAM_LIMIT caps them per process (gunicorn.conf.py sets it to half
+# the threads); past it /api/events answers 429 and the page falls back to
+# refetching. The opt-in gevent worker spends a greenlet per stream instead.
+# Events reach streams held by other workers through EVENT_BACKEND:
+#   redis    - pub/sub on REDIS_URL (needs the redis package; default when set)
+#   database - ServerEvent outbox polled every EVENT_POLL_SECONDS; costs an
+#              INSERT per change and a poll per worker while streams are open
+#   memory   - this process only (default without Redis); a page whose
+#              stream another worker holds sees changes on its next fetch
+EVENT_HEARTBEAT_SECONDS = 20
+EVENT_STREAM_MAX_SECONDS = int(os.environ.get('EVENT_STREAM_MAX_SECONDS', 1800))
+EVENT_POLL_SECONDS = float(os.environ.get('EVENT_POLL_SECONDS', 1.0))
+EVENT_RETENTION_SECONDS = 300
+EVENT_QUEUE_SIZE = 100
+MAX_STREAMS_PER_USER = 5
+EVENT_STREAM_LIMIT = int(os.environ.get('EVENT_STREAM_LIMIT', 0))  # per process; 0 = no limit
+REMINDER_DUE_WINDOW = timedelta(minutes=2)
+
+def sse_message(event_type, data):
+    return f"event: {event_type}\ndata: {dumps_json(data).decode('utf-8')}\n\n"
+
+def sse_response(body):
+    response = Response(body, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+class EventSubscriber:
+    def __init__(self, user_id, tz_offset):
+        self.user_id = user_id
+        self.tz_offset = tz_offset  # minutes, as reported by Date.getTimezoneOffset()
+        self.queue = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+
+class EventHub:
+    """Event streams connected to this process, by user"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+    
+    def subscribe(self, user_id, tz_offset=0):
+        """A new subscriber, or None when the user or this process is at its stream limit"""
+        with self._lock:
+            if EVENT_STREAM_LIMIT and sum(map(len, self._subscribers.values())) >= EVENT_STREAM_LIMIT:
+                return None
+            streams = self._subscribers.setdefault(user_id, set())
+            if len(streams) >= MAX_STREAMS_PER_USER:
+                return None
+            subscriber = EventSubscriber(user_id, tz_offset)
+            streams.add(subscriber)
+            return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            streams = self._subscribers.get(subscriber.user_id)
+            if streams is not None:
+                streams.discard(subscriber)
+                if not streams:
+                    del self._subscribers[subscriber.user_id]
+    
+    def connected_users(self):
+        """user_id -> timezone offset of one of that user's streams"""
+        with self._lock:
+            return {user_id: next(iter(streams)).tz_offset for user_id, streams in self._subscribers.items()}
+    
+    def deliver_local(self, user_id, event):
+        with self._lock:
+            streams = list(self._subscribers.get(user_id, ()))
+        for subscriber in streams:
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                pass  # a stalled client misses events; it refetches on reconnect
+
+event_hub = EventHub()
+
+class MemoryEventBackend:
+    def publish(self, user_id, event):
+        event_hub.deliver_local(user_id, event)
+    
+    def start(self):
+        pass
+
+class DatabaseEventBackend:
+    def __init__(self):
+        self._started_pid = None
+        self._lock = threading.Lock()
+    
+    def publish(self, user_id, event):
+        with db.engine.begin() as conn:
+            conn.execute(db.insert(ServerEvent).values(
+                user_id=user_id, type=event['type'], payload=dumps_json(event['data']).decode('utf-8')))
+    
+    def start(self):
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            threading.Thread(target=self._poll, name='event-poller', daemon=True).start()
+    
+    def _poll(self):
+        with app.app_context():
+            last_id = db.session.query(func.max(ServerEvent.id)).scalar() or 0
+            db.session.remove()
+            while True:
+                time.sleep(EVENT_POLL_SECONDS)
+                users = list(event_hub.connected_users())
+                if not users:
+                    continue
+                try:
+                    with db.engine.connect() as conn:
+                        rows = conn.execute(
+                            select(ServerEvent.id, ServerEvent.user_id, ServerEvent.type, ServerEvent.payload)
+                            .where(ServerEvent.id > last_id, ServerEvent.user_id.in_(users))
+                            .order_by(ServerEvent.id).limit(500)).all()
+                except Exception as e:
+                    log_event('events.poll_failed', level='warning', error=e)
+                    continue
+                for row in rows:
+                    event_hub.deliver_local(row.user_id, {'type': row.type, 'data': json.loads(row.payload)})
+                    last_id = max(last_id, row.id)
+
+class RedisEventBackend:
+    CHANNEL = 'homie:events'
+    
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+        self._started_pid = None
+        self._lock = threading.Lock()
+    
+    def publish(self, user_id, event):
+        self.client.publish(self.CHANNEL, dumps_json({'user_id': user_id, 'event': event}))
+    
+    def start(self):
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            threading.Thread(target=self._listen, name='event-listener', daemon=True).start()
+    
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    envelope = json.loads(message['data'])
+                    event_hub.deliver_local(envelope['user_id'], envelope['event'])
+            except Exception as e:
+                log_event('events.listener_failed', level='warning', error=e)
+                time.sleep(1)
+
+event_backend = _select_backend('EVENT_BACKEND', {
+    'redis': RedisEventBackend, 'database': DatabaseEventBackend, 'memory': MemoryEventBackend,
+})
+
+def publish_event(user_id, event_type, **data):
+    """Send an event to every open stream of the user, in any worker"""
+    try:
+        event_backend.publish(user_id, {'type': event_type, 'data': data})
+    except Exception as e:
+        log_event('events.publish_failed', level='warning', event_type=event_type, error=e)
+
+@event.listens_for(db.session, 'after_commit')
+def announce_changed_collections(session):
+    changed = session.info.pop('changed_collections', None)
+    for user_id, collection in sorted(changed or ()):
+        publish_event(user_id, 'collection.changed', collection=collection)
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_changed_collections(session):
+    session.info.pop('changed_collections', None)
+
+def _reminder_due(reminder, local_now):
+    if not (local_now - REMINDER_DUE_WINDOW).strftime('%H:%M') < reminder.time <= local_now.strftime('%H:%M'):
+        return False
+    today = local_now.strftime('%Y-%m-%d')
+    if reminder.repeat == 'once':
+        return reminder.date == today
+    if reminder.date > today:
+        return False
+    if reminder.repeat == 'weekdays':
+        return local_now.weekday() < 5
+    if reminder.repeat == 'weekly':
+        return date.fromisoformat(reminder.date).weekday() == local_now.weekday()
+    return reminder.repeat == 'daily'
+
+_fired_reminders = {}
+
+@background_job(interval_seconds=30)
+def push_due_reminders():
+    """Fire reminders for users with a stream on this worker (each worker only serves its own)"""
+    users = event_hub.connected_users()
+    if not users:
+        return
+    utc_now = datetime.utcnow()
+    for key, fired_at in list(_fired_reminders.items()):
+        if utc_now - fired_at > timedelta(days=1):
+            del _fired_reminders[key]
+    
+    for reminder in Reminder.query.filter(Reminder.user_id.in_(list(users)), Reminder.is_active.is_(True)):
+        local_now = utc_now - timedelta(minutes=users[reminder.user_id])
+        fire_key = (reminder.id, local_now.strftime('%Y-%m-%d'))
+        if fire_key in _fired_reminders or not _reminder_due(reminder, local_now):
+            continue
+        _fired_reminders[fire_key] = utc_now
+        event_hub.deliver_local(reminder.user_id, {'type': 'reminder.due', 'data': reminder.to_dict()})
+
+@background_job(interval_seconds=120)
+def expire_server_events():
+    cutoff = datetime.utcnow() - timedelta(seconds=EVENT_RETENTION_SECONDS)
+    ServerEvent.query.filter(ServerEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+
+# ===== API ROUTES =====
+
+@app.route('/api/debug')
+def debug_info():
+    """Debug endpoint to check all configurations"""
+    info = {
+        'database_url': app.config['SQLALCHEMY_DATABASE_URI'][:100] + '...' if app.config['SQLALCHEMY_DATABASE_URI'] else 'None',
+        'database_connected': check_database_connection(),
+        'environment_vars': {
+            'DATABASE_URL_set': bool(os.environ.get('DATABASE_URL')),
+            'PGHOST_set': bool(os.environ.get('PGHOST')),
+            'PGUSER_set': bool(os.environ.get('PGUSER')),
+            'PGPASSWORD_set': bool(os.environ.get('PGPASSWORD')),
+        },
+        'tables': {name: total for name, total in user_stats_totals().items()
+                   if name in ('users', 'conversations')}
+    }
+    return jsonify(info)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint for this worker"""
+    try:
+        gauges = db_pool_gauges()
+    except Exception:
+        gauges = []
+    return Response(metrics.render(gauges + memory_gauges()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/profile/stacks')
+@require_profiling_token
+def profile_stacks():
+    """
+    Collapsed stacks from this worker's sampler. With ?seconds=N samples for
+    that long (starting the sampler if it is off) and returns only those
+    samples; ?reset=1 clears the running totals after reading them.
+    """
+    seconds = min(request.args.get('seconds', 0, type=float), 60)
+    if seconds > 0:
+        was_running = stack_sampler.running
+        stack_sampler.start()
+        before = stack_sampler.snapshot()
+        time.sleep(seconds)
+        after = stack_sampler.snapshot()
+        if not was_running:
+            stack_sampler.stop()
+        counts = {stack: count - before.get(stack, 0) for stack, count in after.items() if count > before.get(stack, 0)}
+    else:
+        counts = stack_sampler.snapshot()
+    if request.args.get('reset') == '1':
+        stack_sampler.reset()
+    return Response(collapsed_stacks(counts), mimetype='text/plain', headers={
+        'X-Sampler-Mode': stack_sampler.mode or 'off',
+        'X-Sampler-Samples': str(sum(counts.values())),
+        'X-Worker-Pid': str(os.getpid()),
+    })
+
+@app.route('/api/admin/profile/requests')
+@require_profiling_token
+def profile_requests():
+    """Recent cProfile captures held by this worker, newest first"""
+    fields = ('id', 'request_id', 'endpoint', 'method', 'path', 'status', 'trigger', 'duration_ms', 'captured_at')
+    return jsonify({
+        'pid': os.getpid(),
+        'captures': [{name: capture.get(name) for name in fields} for capture in reversed(profile_captures)]
+    })
+
+@app.route('/api/admin/profile/requests/<capture_id>')
+@require_profiling_token
+def profile_request(capture_id):
+    """One capture as a pstats report, or ?format=pstats for snakeviz/gprof2dot"""
+    capture = next((c for c in profile_captures if c['id'] == capture_id), None)
+    if capture is None:
+        return jsonify({'error': 'Profile not found in this worker'}), 404
+    if request.args.get('format') == 'pstats':
+        return Response(marshal.dumps(pstats.Stats(capture['profiler']).stats), mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename="{capture_id}.pstats"'})
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in pstats.Stats.sort_arg_dict_default:
+        return jsonify({'error': f"Unknown sort key '{sort}'"}), 400
+    out = io.StringIO()
+    stats = pstats.Stats(capture['profiler'], stream=out).strip_dirs()
+    stats.sort_stats(sort).print_stats(request.args.get('limit', 60, type=int))
+    return Response(out.getvalue(), mimetype='text/plain')
+
+@app.route('/api/admin/memory')
+@require_profiling_token
+def memory_telemetry():
+    """
+    This worker's memory: RSS/PSS/USS, GC state and, when TRACEMALLOC is set,
+    the top allocation sites (?top=N&key=lineno|filename|traceback)
+    """
+    key_type = request.args.get('key', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        return jsonify({'error': f"Unknown key '{key_type}'"}), 400
+    
+    report = {
+        'pid': os.getpid(),
+        'preloaded': _loaded_pid != os.getpid(),
+        'threads': threading.active_count(),
+        'memory_bytes': process_memory(),
+        'gc': {
+            'enabled': gc.isenabled(),
+            'frozen_objects': gc.get_freeze_count(),
+            'pending': gc.get_count(),
+            'collections': [generation['collections'] for generation in gc.get_stats()],
+        },
+        'tracemalloc': {'tracing': tracemalloc.is_tracing()},
+    }
+    if tracemalloc.is_tracing():
+        traced, peak = tracemalloc.get_traced_memory()
+        report['tracemalloc'].update(
+            frames=tracemalloc.get_traceback_limit(),
+            traced_bytes=traced,
+            peak_bytes=peak,
+            overhead_bytes=tracemalloc.get_tracemalloc_memory(),
+            top=tracemalloc_top(min(request.args.get('top', 15, type=int), 100), key_type),
+        )
+    return jsonify(report)
+
+@app.route('/api/database-health')
+def database_health():
+    """Check database health and connection"""
     try:
         db.session.execute(text('SELECT 1'))
         
-        tables = {
-            'users': User.query.count(),
-            'conversations': Conversation.query.count(),
-            'memories': UserMemory.query.count(),
-            'journal_entries': JournalEntry.query.count(),
-            'reminders': Reminder.query.count()
-        }
+        tables = dict(user_stats_totals(), reminders=Reminder.query.count())
         
         is_postgresql = 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI']
         
@@ -819,24 +3839,64 @@ def database_health():
             'timestamp': datetime.now(timezone.utc).isoformat()
         }), 500
 
-@app.route('/api/chat', methods=['POST'])
-def chat_api():
-    if 'user_id' not in session:
-        return jsonify({'error': 'Unauthorized'}), 401
+class ChatUnitOfWork:
+    """
+    A chat turn's writes, held in memory while the turn waits on the model and
+    applied in one transaction by commit(). Steps are the "caller commits"
+    helpers, so the turn's messages, memories, mood rollups, stats and version
+    bumps are saved together or not at all.
+    """
     
-    if not check_database_connection():
-        return jsonify({'error': 'Database connection issue'}), 500
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.messages = []
+        self.steps = []
     
-    data = request.get_json()
+    def add_message(self, conv):
+        self.messages.append(conv)
+    
+    def add(self, fn, *args):
+        self.steps.append((fn, args))
+    
+    def commit(self):
+        with timed_phase('db_write'):
+            try:
+                for conv in self.messages:
+                    db.session.add(conv)
+                    record_message_stats(conv)
+                    if conv.role == 'user':
+                        record_mood(self.user_id, 'chat', conv.detected_mood, when=conv.timestamp)
+                for fn, args in self.steps:
+                    fn(*args)
+                if self.messages:
+                    bump_collection_version(self.user_id, 'history')
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+def chat_turn(user_id, user_avatar, data, stream=False):
+    """
+    Run one chat turn as a generator of ('token', text) events followed by a
+    final ('result', (payload, status)). Tokens are only produced when
+    stream=True; /api/chat just waits for the result.
+    
+    The turn reads everything it needs (profile, history, prewarmed context)
+    first and releases its connection before the model calls. Nothing is
+    written until the reply exists: the user's message, the reply and any
+    extracted memories are committed together at the end. If the
+    model call fails, or a stream is abandoned, the turn leaves no trace and
+    the client is asked to send the message again. The weekly summary and
+    safe-space memory extraction run after the response, in their own
+    transactions.
+    """
     user_message = data.get('message')
     media_analysis = data.get('media_analysis')
     media_type = data.get('media_type')
     
     if not user_message and not media_analysis:
-        return jsonify({'error': 'No message provided'}), 400
-    
-    user_id = session['user_id']
-    user_avatar = session.get('avatar', 'girl')
+        yield 'result', ({'error': 'No message provided'}, 400)
+        return
     
     db_content = user_message or "What do you think about this?"
     mood = detect_mood(db_content)
@@ -845,92 +3905,225 @@ def chat_api():
     first_convo_keywords = ['first convo', 'first message', 'first conversation', 'first ever', 'when we first', 'our first']
     is_asking_first_convo = any(keyword in user_message.lower() for keyword in first_convo_keywords) if user_message else False
     
+    user_conv = Conversation(
+        user_id=user_id, 
+        role='user', 
+        content=db_content,
+        detected_mood=mood,
+        media_type=media_type,
+        media_analysis=media_analysis,
+        timestamp=datetime.utcnow()
+    )
+    
     try:
-        user_conv = Conversation(
-            user_id=user_id, 
-            role='user', 
-            content=db_content,
-            detected_mood=mood,
-            media_type=media_type,
-            media_analysis=media_analysis
-        )
-        db.session.add(user_conv)
-        db.session.commit()
+        prewarmed = None
+        if not is_asking_first_convo:
+            with timed_phase('prewarm_lookup'):
+                prewarmed = take_prewarmed_context(user_id)
         
         if is_asking_first_convo:
-            convo_summary = get_conversation_summary(user_id, limit=10)
+            convo_summary = get_conversation_summary(user_id)
             ai_response = f"Bro, from what I remember, {convo_summary} We've been having some great chats since then! What specifically were you curious about from those early days?"
             
-            ai_conv = Conversation(user_id=user_id, role='assistant', content=ai_response)
-            db.session.add(ai_conv)
-            db.session.commit()
+            turn = ChatUnitOfWork(user_id)
+            turn.add_message(user_conv)
+            turn.add_message(Conversation(user_id=user_id, role='assistant', content=ai_response))
+            turn.commit()
             
-            return jsonify({
+            yield 'result', ({
                 'response': ai_response,
                 'mood': mood,
                 'safe_space_mode': False,
                 'memory_used': True
-            })
-        
-        user_profile = generate_comprehensive_user_profile(user_id)
+            }, 200)
+            return
         
-        try:
+        if safe_space_mode:
+            # The safe-space prompt doesn't use the profile, and memories can wait
+            user_profile = ""
             if user_message and len(user_message.strip()) > 10:
-                extract_memories_from_conversation(user_message, "", user_id, mood)
-        except Exception as e:
-            print(f"Memory extraction in chat failed: {e}")
+                defer_until_sent(extract_memories_from_conversation, user_message, "", user_id, mood)
+        elif prewarmed:
+            user_profile = prewarmed['profile']
+        else:
+            with timed_phase('profile'):
+                user_profile = generate_comprehensive_user_profile(user_id)
         
-        messages = [{"role": "system", "content": get_system_prompt(user_profile, mood, safe_space_mode, user_avatar)}]
+        with timed_phase('history'):
+            history_rows = SAFE_SPACE_HISTORY_ROWS if safe_space_mode else CONTEXT_HISTORY_ROWS
+            if prewarmed:
+                history_messages = prewarmed['history']
+            else:
+                history = Conversation.query.filter(*visible_conversations(user_id)).order_by(Conversation.timestamp.desc()).limit(history_rows - 1).all()
+                history.reverse()
+                history_messages = format_history_messages(history)
+            history_messages = history_messages + format_history_messages([user_conv])
         
-        history = Conversation.query.filter_by(user_id=user_id).order_by(Conversation.timestamp.desc()).limit(30).all()
-        history.reverse()
+        with timed_phase('prompt'):
+            messages = [{"role": "system", "content": get_system_prompt(user_profile, mood, safe_space_mode, user_avatar)}]
+            messages.extend(history_messages[-history_rows:])
         
-        for conv in history:
-            if not conv.content or not conv.content.strip():
-                continue
-                
-            if conv.media_analysis and conv.media_type and conv.role == 'user':
-                formatted_content = f"[MEDIA CONTEXT: User shared a {conv.media_type}. Analysis: {conv.media_analysis}]\n\nUser's message: {conv.content}"
-                messages.append({"role": conv.role, "content": formatted_content})
-            else:
-                messages.append({"role": conv.role, "content": conv.content})
+        # The context is assembled, so hand the connection back while the models work
+        db.session.close()
         
-        chat_completion = groq_client.chat.completions.create(
-            messages=messages,
-            model="llama-3.1-8b-instant",
-            temperature=0.8 if not safe_space_mode else 0.6,
-            max_tokens=1024,
-            top_p=0.9,
-        )
+        memories = None
+        if not safe_space_mode and user_message and len(user_message.strip()) > 10:
+            try:
+                with timed_phase('memory_extraction'):
+                    memories = find_memories(user_message, user_id, mood)
+            except Exception as e:
+                log_event('chat.memory_extraction_failed', level='error', user_id=user_id, error=e)
         
-        ai_response = chat_completion.choices[0].message.content
+        try:
+            ai_response = yield from complete_chat(messages, safe_space_mode, stream)
+        except Exception as e:
+            log_event('chat.provider_failed', level='error', user_id=user_id, error=e)
+            yield 'result', ({'error': "I couldn't come up with a reply just now, so your message wasn't saved. Please send it again."}, 502)
+            return
         
         message_segments = segment_response(ai_response)
         
-        ai_conv = Conversation(user_id=user_id, role='assistant', content=ai_response)
-        db.session.add(ai_conv)
-        db.session.commit()
+        turn = ChatUnitOfWork(user_id)
+        turn.add_message(user_conv)
+        if memories:
+            turn.add(save_memories, user_id, memories)
+        turn.add_message(Conversation(user_id=user_id, role='assistant', content=ai_response))
+        turn.commit()
         
-        if random.random() < 0.1:
-            try:
-                update_conversation_summary(user_id)
-            except Exception as e:
-                print(f"Summary update failed: {e}")
+        if safe_space_mode:
+            record_safe_space_latency('reply', slo=not stream)
+        elif random.random() < 0.1:
+            defer_until_sent(update_conversation_summary, user_id)
         
-        return jsonify({
+        yield 'result', ({
             'response': ai_response,
             'segments': message_segments,
             'mood': mood,
             'safe_space_mode': safe_space_mode,
             'memory_used': len(user_profile) > 100
-        })
+        }, 200)
+    
+    except OperationalError as e:
+        db.session.rollback()
+        log_event('db.connection_error', level='error', error=e)
+        yield 'result', ({'error': 'Database connection issue'}, 500)
+    except Exception as e:
+        db.session.rollback()
+        log_event('chat.failed', level='error', user_id=user_id, error=e)
+        yield 'result', ({'error': 'Internal server error'}, 500)
+
+def complete_chat(messages, safe_space_mode, stream):
+    """Generator yielding ('token', text) events when streaming; returns the full reply"""
+    with timed_phase('llm'):
+        chat_completion = groq_client.chat.completions.create(
+            messages=messages,
+            model="llama-3.1-8b-instant",
+            temperature=0.8 if not safe_space_mode else 0.6,
+            max_tokens=SAFE_SPACE_MAX_TOKENS if safe_space_mode else 1024,
+            top_p=0.9,
+            stream=stream,
+        )
+        if stream:
+            parts = []
+            usage = None
+            for chunk in chat_completion:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if safe_space_mode and not parts:
+                        record_safe_space_latency('first_token', slo=True)
+                    parts.append(delta)
+                    yield 'token', delta
+                # Groq reports usage on the final chunk under x_groq
+                usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None) or getattr(chunk, 'usage', None) or usage
+            ai_response = ''.join(parts)
+            record_llm_usage(SimpleNamespace(usage=usage), 'chat', "llama-3.1-8b-instant")
+        else:
+            record_llm_usage(chat_completion, 'chat', "llama-3.1-8b-instant")
+            ai_response = chat_completion.choices[0].message.content
+    return ai_response
+
+@app.route('/api/chat', methods=['POST'])
+# The page falls back here with the key of a stream that failed mid-way
+@idempotent('chat', replays={'chat_stream': _replay_stream_as_json})
+@admission_control('chat', provider='groq', priority=is_safe_space_request)
+def chat_api():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    for kind, value in chat_turn(session['user_id'], session.get('avatar', 'girl'), request.get_json()):
+        if kind == 'result':
+            payload, status = value
+            return jsonify(payload), status
+
+@app.route('/api/chat/stream', methods=['POST'])
+@idempotent('chat_stream')
+@admission_control('chat', provider='groq', priority=is_safe_space_request)
+def chat_stream_api():
+    """Same turn as /api/chat, answered as server-sent events: token* then done|error"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    turn = chat_turn(session['user_id'], session.get('avatar', 'girl'), request.get_json(), stream=True)
+    
+    def generate():
+        for kind, value in turn:
+            if kind == 'token':
+                yield sse_message('token', {'text': value})
+            else:
+                payload, status = value
+                yield sse_message('done' if status == 200 else 'error', dict(payload, status=status))
+    
+    return sse_response(stream_with_context(generate()))
+
+@app.route('/api/chat/prewarm', methods=['POST'])
+def prewarm_chat():
+    """Assemble the next turn's context while the user types (best effort, never an error)"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
+    try:
+        outcome = prewarm_context(session['user_id'])
     except Exception as e:
         db.session.rollback()
-        print(f"Chat API error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        log_event('prewarm.failed', level='warning', user_id=session['user_id'], error=e)
+        outcome = 'failed'
+    metrics.inc('homie_prewarm_total', {'outcome': outcome})
+    return jsonify({'status': outcome, 'ttl': PREWARM_TTL_SECONDS})
+
+@app.route('/api/events')
+def events_stream():
+    """Server-sent events for this session (?tz= is the browser's getTimezoneOffset())"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        tz_offset = max(-900, min(900, int(request.args.get('tz', 0))))
+    except ValueError:
+        tz_offset = 0
+    
+    subscriber = event_hub.subscribe(session['user_id'], tz_offset)
+    if subscriber is None:
+        return jsonify({'error': 'Too many open event streams'}), 429
+    event_backend.start()
+    
+    def generate():
+        try:
+            yield f"retry: 3000\n{sse_message('ready', {'heartbeat': EVENT_HEARTBEAT_SECONDS})}"
+            deadline = time.monotonic() + EVENT_STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    event = subscriber.queue.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield sse_message(event['type'], event['data'])
+        finally:
+            event_hub.unsubscribe(subscriber)
+    
+    return sse_response(generate())
 
 @app.route('/api/history')
+@replica_reads
 def get_history():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -941,12 +4134,13 @@ def get_history():
         return jsonify({'error': 'Database connection issue'}), 500
     
     try:
-        conversations = Conversation.query.filter_by(user_id=user_id).order_by(Conversation.timestamp.asc()).all()
-        print(f"📨 Loaded {len(conversations)} conversations for user {user_id}")
-        return jsonify([c.to_dict() for c in conversations])
+        def load():
+            with timed_phase('history'):
+                return load_history(user_id)
+        return conditional_json(collection_etag(user_id, 'history'), load)
     
     except Exception as e:
-        print(f"History loading error: {e}")
+        log_event('history.failed', level='error', user_id=user_id, error=e)
         return jsonify({'error': 'Failed to load history'}), 500
 
 @app.route('/')
@@ -973,6 +4167,10 @@ def signup():
         user = User(username=username, email=email, avatar=avatar)
         user.set_password(password)
         db.session.add(user)
+        db.session.flush()
+        # New accounts have nothing to backfill; their moods are rolled up from the start
+        db.session.add(MoodRollupState(user_id=user.id))
+        db.session.add(UserStats(user_id=user.id))
         db.session.commit()
         
         session['user_id'] = user.id
@@ -1013,6 +4211,7 @@ def chat():
                          avatar=session.get('avatar', 'girl'))
 
 @app.route('/api/upload-media', methods=['POST'])
+@admission_control('upload_media', provider='gemini')
 def upload_media():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -1044,30 +4243,60 @@ def upload_media():
         
         media_analysis = None
         media_type = 'image' if is_image else 'video'
+        screen = None
+        reused = False
         
         if is_image:
-            media_analysis = analyze_image_with_gemini(filepath, user_message)
+            analysis_path, analysis_prompt = filepath, user_message
+            try:
+                with timed_phase('media_screen'):
+                    screen = screen_media(load_screen_image(filepath))
+            except Exception as e:
+                log_event('media.screen_failed', level='warning', error=e)
         elif is_video:
-            frame_base64 = extract_video_frame(filepath)
-            if frame_base64:
+            analysis_path = None
+            analysis_prompt = f"{user_message}\n\nNote: This is a frame from a video." if user_message else "This is a frame from a video. Please describe what you see in detail."
+            # Fall through to later positions when a frame is a fade, a black screen or motion blur
+            for position in VIDEO_FRAME_POSITIONS:
+                with timed_phase('frame_extract'):
+                    frame = read_video_frame(filepath, position)
+                if frame is None:
+                    continue
+                with timed_phase('media_screen'):
+                    frame_screen = screen_media(downscale_gray(frame))
+                if screen is None or frame_screen['verdict'] == 'ok':
+                    screen, analysis_frame = frame_screen, frame
+                if frame_screen['verdict'] == 'ok':
+                    break
+            if screen is not None:
                 frame_path = filepath + "_frame.jpg"
-                frame_data = base64.b64decode(frame_base64)
-                with open(frame_path, 'wb') as f:
-                    f.write(frame_data)
-                
-                analysis_prompt = f"{user_message}\n\nNote: This is a frame from a video." if user_message else "This is a frame from a video. Please describe what you see in detail."
-                media_analysis = analyze_image_with_gemini(frame_path, analysis_prompt)
-                
-                try:
-                    os.remove(frame_path)
-                except:
-                    pass
+                Image.fromarray(analysis_frame).save(frame_path, format='JPEG')
+                analysis_path = frame_path
         
-        try:
-            if filepath and os.path.exists(filepath):
-                os.remove(filepath)
-        except PermissionError:
-            pass
+        verdict = screen['verdict'] if screen else 'ok'
+        if verdict in MEDIA_REJECT_MESSAGES:
+            metrics.inc('homie_media_screen_total', {'verdict': verdict})
+            log_event('media.rejected', verdict=verdict, media_type=media_type,
+                      **{key: round(screen[key], 2) for key in ('mean', 'entropy', 'sharpness')})
+        elif analysis_path:
+            if screen:
+                media_analysis = find_duplicate_analysis(session['user_id'], screen['phash'], analysis_prompt)
+                reused = media_analysis is not None
+            metrics.inc('homie_media_screen_total', {'verdict': 'duplicate' if reused else 'ok'})
+            if not reused:
+                media_analysis = analyze_image_with_gemini(analysis_path, analysis_prompt)
+                if media_analysis and screen:
+                    remember_media_analysis(session['user_id'], screen['phash'], analysis_prompt, media_type, media_analysis)
+        
+        for path in (frame_path, filepath):
+            try:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            except PermissionError:
+                pass
+        
+        if verdict in MEDIA_REJECT_MESSAGES:
+            return jsonify({'error': MEDIA_REJECT_MESSAGES[verdict], 'reason': verdict}), 422
         
         if not media_analysis:
             return jsonify({'error': 'Failed to analyze media'}), 500
@@ -1075,7 +4304,8 @@ def upload_media():
         return jsonify({
             'success': True,
             'analysis': media_analysis,
-            'media_type': media_type
+            'media_type': media_type,
+            'reused': reused
         })
         
     except Exception as e:
@@ -1089,16 +4319,13 @@ def upload_media():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/memories')
+@replica_reads
 def get_user_memories():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    memories = UserMemory.query.filter_by(user_id=session['user_id']).order_by(
-        UserMemory.importance_score.desc(),
-        UserMemory.last_referenced.desc()
-    ).all()
-    
-    return jsonify([m.to_dict() for m in memories])
+    user_id = session['user_id']
+    return conditional_json(collection_etag(user_id, 'memories'), lambda: load_memories(user_id))
 
 @app.route('/api/memories/<int:memory_id>', methods=['DELETE'])
 def delete_memory(memory_id):
@@ -1110,11 +4337,14 @@ def delete_memory(memory_id):
         return jsonify({'error': 'Memory not found'}), 404
     
     db.session.delete(memory)
+    bump_collection_version(session['user_id'], 'memories')
+    bump_user_stats(session['user_id'], memory_count=-1)
     db.session.commit()
     
     return jsonify({'success': True})
 
 @app.route('/api/user-profile')
+@replica_reads
 def get_user_profile():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -1122,18 +4352,130 @@ def get_user_profile():
     profile = generate_comprehensive_user_profile(session['user_id'])
     return jsonify({'profile': profile})
 
+@app.route('/api/analytics/moods')
+@replica_reads
+def mood_analytics():
+    """Mood trends from the daily rollups: ?start=&end= (YYYY-MM-DD), bucket=day|week|month, source=chat|journal"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    bucket = request.args.get('bucket', 'day')
+    source = request.args.get('source') or None
+    if bucket not in ('day', 'week', 'month'):
+        return jsonify({'error': 'bucket must be day, week or month'}), 400
+    if source not in (None, 'all', 'chat', 'journal'):
+        return jsonify({'error': 'source must be chat, journal or all'}), 400
+    source = None if source == 'all' else source
+    
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+    if (end - start).days > MOOD_ANALYTICS_MAX_DAYS:
+        return jsonify({'error': f'Range is limited to {MOOD_ANALYTICS_MAX_DAYS} days'}), 400
+    
+    etag = f"{collection_etag(user_id, 'moods')}-{start}-{end}-{bucket}-{source or 'all'}"
+    return conditional_json(etag, lambda: load_mood_trends(user_id, start, end, bucket, source))
+
 @app.route('/api/clear-history', methods=['POST'])
 def clear_history():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
     user_id = session['user_id']
-    Conversation.query.filter_by(user_id=user_id).delete()
+    
+    # Hide everything up to the newest row now; the purger deletes it in batches
+    max_id = max(
+        db.session.query(func.max(Conversation.id)).filter(Conversation.user_id == user_id).scalar() or 0,
+        db.session.query(func.max(ConversationArchive.max_id)).filter(ConversationArchive.user_id == user_id).scalar() or 0
+    )
+    if max_id:
+        db.session.add(PurgeJob(user_id=user_id, kind='conversations', max_id=max_id))
+        bump_collection_version(user_id, 'history')
+        # Every chat row counted so far is being cleared, so its rollups go too
+        MoodDaily.query.filter_by(user_id=user_id, source='chat').delete(synchronize_session=False)
+        bump_collection_version(user_id, 'moods')
+        reset_message_stats(user_id)
+        db.session.commit()
+    
+    return jsonify({'success': True})
+
+@app.route('/api/export')
+@admission_control('export')
+@replica_reads
+def export_data():
+    """Download everything in the account as a zip of NDJSON files"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    filename = f"homie-export-{session['username']}-{date.today().isoformat()}.zip"
+    response = Response(stream_with_context(export_user_zip(session['user_id'], session['username'])),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(filename)}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/import', methods=['POST'])
+@admission_control('import')
+def import_data():
+    """Append the contents of an /api/export zip (multipart field 'archive') to this account"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    upload = request.files.get('archive')
+    if upload is None or upload.filename == '':
+        return jsonify({'error': 'No archive provided'}), 400
+    
+    try:
+        archive = zipfile.ZipFile(upload.stream)
+        manifest = json.loads(archive.read('manifest.json'))
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        return jsonify({'error': 'Not a Homie export archive'}), 400
+    if manifest.get('format') != EXPORT_FORMAT or manifest.get('version', 0) > EXPORT_VERSION:
+        return jsonify({'error': 'Unsupported export format or version'}), 400
+    if sum(info.file_size for info in archive.infolist()) > IMPORT_MAX_UNCOMPRESSED_BYTES:
+        return jsonify({'error': 'Archive is too large to import'}), 413
+    
+    user_id = session['user_id']
+    try:
+        with timed_phase('import'):
+            imported, skipped = import_user_zip(user_id, archive)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log_event('import.failed', level='error', user_id=user_id, error=e)
+        return jsonify({'error': 'Import failed; nothing was imported'}), 500
+    
+    log_event('import.finished', user_id=user_id, imported=imported, skipped=skipped)
+    return jsonify({'success': True, 'imported': imported, 'skipped': skipped})
+
+@app.route('/api/account', methods=['DELETE'])
+def delete_account():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user = db.session.get(User, session['user_id'])
+    if not user:
+        session.clear()
+        return jsonify({'error': 'User not found'}), 404
+    
+    # Tombstone the account immediately (no more logins, username/email freed);
+    # the purger removes its data and finally the user row
+    user.username = f"deleted-{user.id}"
+    user.email = f"deleted-{user.id}@deleted.invalid"
+    user.password_hash = '!'
+    db.session.add(PurgeJob(user_id=user.id, kind='account'))
     db.session.commit()
+    session.clear()
     
     return jsonify({'success': True})
 
 @app.route('/api/journal', methods=['GET', 'POST'])
+@replica_reads
 def journal():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -1156,12 +4498,14 @@ def journal():
             mood=mood
         )
         db.session.add(entry)
+        bump_collection_version(user_id, 'journal')
+        record_mood(user_id, 'journal', mood)
+        bump_user_stats(user_id, journal_count=1)
         db.session.commit()
         
         return jsonify({'success': True, 'entry': entry.to_dict()})
     
-    entries = JournalEntry.query.filter_by(user_id=user_id).order_by(JournalEntry.timestamp.desc()).all()
-    return jsonify([e.to_dict() for e in entries])
+    return conditional_json(collection_etag(user_id, 'journal'), lambda: load_journal_entries(user_id))
 
 @app.route('/api/journal/<int:entry_id>', methods=['DELETE'])
 def delete_journal(entry_id):
@@ -1173,11 +4517,15 @@ def delete_journal(entry_id):
         return jsonify({'error': 'Entry not found'}), 404
     
     db.session.delete(entry)
+    bump_collection_version(session['user_id'], 'journal')
+    record_mood(session['user_id'], 'journal', entry.mood, when=entry.timestamp, delta=-1)
+    bump_user_stats(session['user_id'], journal_count=-1)
     db.session.commit()
     
     return jsonify({'success': True})
 
 @app.route('/api/reminders', methods=['GET', 'POST'])
+@replica_reads
 def reminders():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -1196,12 +4544,12 @@ def reminders():
         
         reminder = Reminder(user_id=user_id, title=title, date=date, time=time, repeat=repeat)
         db.session.add(reminder)
+        bump_collection_version(user_id, 'reminders')
         db.session.commit()
         
         return jsonify({'success': True, 'reminder': reminder.to_dict()})
     
-    reminders_list = Reminder.query.filter_by(user_id=user_id, is_active=True).order_by(Reminder.date, Reminder.time).all()
-    return jsonify([r.to_dict() for r in reminders_list])
+    return conditional_json(collection_etag(user_id, 'reminders'), lambda: load_active_reminders(user_id))
 
 @app.route('/api/reminders/<int:reminder_id>', methods=['DELETE'])
 def delete_reminder(reminder_id):
@@ -1213,6 +4561,7 @@ def delete_reminder(reminder_id):
         return jsonify({'error': 'Reminder not found'}), 404
     
     db.session.delete(reminder)
+    bump_collection_version(session['user_id'], 'reminders')
     db.session.commit()
     
     return jsonify({'success': True})
@@ -1222,42 +4571,7 @@ def get_greeting():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    hour = datetime.now().hour
-    username = session.get('username', 'friend')
-    avatar = session.get('avatar', 'girl')
-    
-    if avatar == 'girl':
-        if 5 <= hour < 12:
-            greeting = f"Good morning, {username}! 🌸"
-            message = "Hope you slept well, sweetie! Ready to tackle the day?"
-        elif 12 <= hour < 17:
-            greeting = f"Hey {username}! 💖"
-            message = "How's your day going so far, love?"
-        elif 17 <= hour < 21:
-            greeting = f"Good evening, {username}! 🌙"
-            message = "Winding down or still grinding, girl?"
-        else:
-            greeting = f"Hey night owl {username}! ✨"
-            message = "Still up? I'm here if you need to chat, sweetie."
-    else:
-        if 5 <= hour < 12:
-            greeting = f"Good morning, {username}! 💪"
-            message = "Hope you slept well, bro! Ready to tackle the day?"
-        elif 12 <= hour < 17:
-            greeting = f"Hey {username}! 🔥"
-            message = "How's your day going so far, man?"
-        elif 17 <= hour < 21:
-            greeting = f"Good evening, {username}! 🌆"
-            message = "Winding down or still grinding, dude?"
-        else:
-            greeting = f"Hey night owl {username}! 🦉"
-            message = "Still up? I'm here if you need to chat, bro."
-    
-    return jsonify({
-        'greeting': greeting,
-        'message': message,
-        'hour': hour
-    })
+    return jsonify(build_greeting(session.get('username', 'friend'), session.get('avatar', 'girl')))
 
 @app.route('/api/session-status')
 def session_status():
@@ -1265,16 +4579,11 @@ def session_status():
         return jsonify({'logged_in': True, 'username': session.get('username')})
     return jsonify({'logged_in': False})
 
+MUSIC_LIST_ETAG = hashlib.sha256(json.dumps(MUSIC_LIST, sort_keys=True).encode()).hexdigest()[:16]
+
 @app.route('/api/music-list')
 def get_music_list():
-    music_list = [
-        {'id': 1, 'name': 'Lofi Beats 1', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_1_x131mw.mp3'},
-        {'id': 2, 'name': 'Lofi Beats 2', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_2_ta1t9m.mp3'},
-        {'id': 3, 'name': 'Lofi Beats 3', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_3_lsq9ek.mp3'},
-        {'id': 4, 'name': 'Lofi Beats 4', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_4_qejsjt.mp3'},
-        {'id': 5, 'name': 'Lofi Beats 5', 'url': 'https://res.cloudinary.com/dbiamsdnr/video/upload/Chill_Lofi_Beats_By_Art_Is_Sound_5_lmbywm.mp3'}
-    ]
-    return jsonify(music_list)
+    return conditional_json(MUSIC_LIST_ETAG, lambda: MUSIC_LIST)
 
 @app.route('/api/user-music-preference', methods=['GET', 'POST'])
 def user_music_preference():
@@ -1293,10 +4602,42 @@ def user_music_preference():
         
         return jsonify({'success': True})
     
-    return jsonify({
-        'music_enabled': session.get('music_enabled', True),
-        'current_track': session.get('current_track', 2),
-        'volume': session.get('music_volume', 0.5)
+    return jsonify(music_preferences())
+
+@app.route('/api/bootstrap')
+@replica_reads
+def bootstrap():
+    """Everything the chat page needs at startup, in one round-trip"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    loaders = {
+        'history': lambda: load_history(user_id),
+        'journal': lambda: load_journal_entries(user_id),
+        'reminders': lambda: load_active_reminders(user_id),
+    }
+    
+    try:
+        # Clients pass the ETag they hold for each part (?history=...); parts
+        # that haven't changed come back as null and are listed in not_modified
+        etags = {name: collection_etag(user_id, name) for name in loaders}
+        not_modified = [name for name, etag in etags.items() if request.args.get(name) == etag]
+        with timed_phase('reads'):
+            reads = run_reads({name: fn for name, fn in loaders.items() if name not in not_modified})
+    except Exception as e:
+        log_event('bootstrap.failed', level='error', user_id=user_id, error=e)
+        return jsonify({'error': 'Failed to load page data'}), 500
+    
+    return json_response({
+        'greeting': build_greeting(session.get('username', 'friend'), session.get('avatar', 'girl')),
+        'history': reads.get('history'),
+        'music_list': MUSIC_LIST,
+        'music_preferences': music_preferences(),
+        'journal': reads.get('journal'),
+        'reminders': reads.get('reminders'),
+        'etags': etags,
+        'not_modified': not_modified,
     })
 
 # ===== DATABASE INITIALIZATION =====
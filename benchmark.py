@@ -0,0 +1,499 @@
+"""
+Offline load test and benchmark for Homie AI
+Boots the app against local Groq/Gemini stand-ins (fake_providers.py) and a
+throwaway SQLite database (or a local Postgres via --database-url), replays
+realistic user sessions and reports latency percentiles and requests/sec
+per endpoint.
+
+Usage:
+    python benchmark.py                          # default run, results in bench_results/
+    python benchmark.py --users 16 --chat-turns 8
+    python benchmark.py --database-url postgresql://localhost/homie_bench
+    python benchmark.py --compare bench_results/abc1234.json
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+
+import requests
+
+from fake_providers import start_fake_providers
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHAT_MESSAGES = [
+    "hey! how's it going today?",
+    "work has been so stressful this week, my manager keeps piling stuff on",
+    "I finally got my side project deployed, feeling pretty good about it",
+    "honestly I'm kinda tired, didn't sleep much last night",
+    "do you remember what we talked about yesterday?",
+    "I've been thinking about learning guitar again, what do you think?",
+    "my sister is visiting this weekend and I'm excited to see her",
+    "idk, I feel a bit lost about what to do next with my career",
+]
+
+JOURNAL_ENTRIES = [
+    "Today I'm grateful for: a long walk after work and a good coffee",
+    "Today's win: finished the presentation a day early",
+    "A challenge I faced today: staying focused in the afternoon",
+]
+
+
+SERVER_TIMING_COMPRESS = re.compile(r'compress;dur=([0-9.]+)')
+
+
+# ===== RESULT COLLECTION =====
+class Recorder:
+    """Thread-safe collector of (endpoint, status, latency) samples"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.compression = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, elapsed, response=None):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(elapsed)
+            if status is None or status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            if response is not None and response.headers.get('Content-Encoding'):
+                self._record_compression(endpoint, response)
+
+    def _record_compression(self, endpoint, response):
+        """Body size before/after compression and the server's compress time (Server-Timing)
+
+        The wire size is what urllib3 read off the socket (response.raw.tell(),
+        which chunked bodies don't advance) or else Content-Length. Responses
+        with neither are counted but left out of the size totals and ratio.
+        """
+        stats = self.compression.setdefault(endpoint, {'responses': 0, 'unmeasured': 0, 'raw_bytes': 0,
+                                                       'wire_bytes': 0, 'compress_ms': 0.0})
+        stats['responses'] += 1
+        wire = response.raw.tell() if response.raw is not None else 0
+        wire = wire or int(response.headers.get('Content-Length') or 0)
+        if wire:
+            stats['raw_bytes'] += len(response.content)
+            stats['wire_bytes'] += wire
+        else:
+            stats['unmeasured'] += 1
+        match = SERVER_TIMING_COMPRESS.search(response.headers.get('Server-Timing', ''))
+        if match:
+            stats['compress_ms'] += float(match.group(1))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(recorder, wall_seconds):
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.samples.items()):
+        endpoints[endpoint] = {
+            'count': len(latencies),
+            'errors': recorder.errors.get(endpoint, 0),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'rps': round(len(latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        }
+
+    for endpoint, stats in recorder.compression.items():
+        endpoints[endpoint]['compression'] = {
+            'responses': stats['responses'],
+            'unmeasured': stats['unmeasured'],
+            'raw_bytes': stats['raw_bytes'],
+            'wire_bytes': stats['wire_bytes'],
+            'ratio': round(stats['raw_bytes'] / stats['wire_bytes'], 2) if stats['wire_bytes'] else None,
+            'compress_ms_mean': round(stats['compress_ms'] / stats['responses'], 3),
+        }
+
+    all_latencies = [l for latencies in recorder.samples.values() for l in latencies]
+    total = {
+        'count': len(all_latencies),
+        'errors': sum(recorder.errors.values()),
+        'wall_seconds': round(wall_seconds, 3),
+        'rps': round(len(all_latencies) / wall_seconds, 2) if wall_seconds else 0.0,
+        'p50_ms': round(percentile(all_latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(all_latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(all_latencies, 99) * 1000, 2),
+    }
+    return endpoints, total
+
+
+# ===== SESSION REPLAY =====
+class VirtualUser:
+    """Replays one user's journey through the app with a persistent cookie jar"""
+
+    def __init__(self, base_url, recorder, rng, think_time=0.0, accept_encoding='br, gzip'):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.think_time = think_time
+        self.http = requests.Session()
+        self.http.headers['Accept-Encoding'] = accept_encoding
+        suffix = uuid.UUID(int=rng.getrandbits(128)).hex[:12]
+        self.username = f"bench_{suffix}"
+        self.email = f"{self.username}@bench.local"
+        self.password = 'bench-password'
+        self.photos = []
+
+    def call(self, method, path, label=None, classify=None, **kwargs):
+        """classify(response) may return a suffix so one endpoint's paths are reported apart"""
+        label = label or f"{method} {path}"
+        start = time.perf_counter()
+        status = None
+        try:
+            response = None
+            response = self.http.request(method, self.base_url + path, timeout=180, allow_redirects=False, **kwargs)
+            status = response.status_code
+            response.content
+            if classify:
+                label = f"{label} ({classify(response)})"
+            return response
+        except requests.RequestException:
+            return None
+        finally:
+            self.recorder.record(label, status, time.perf_counter() - start, response if status else None)
+            if self.think_time:
+                time.sleep(self.rng.uniform(0, self.think_time))
+
+    def signup(self):
+        self.call('POST', '/signup', json={
+            'username': self.username,
+            'email': self.email,
+            'password': self.password,
+            'avatar': self.rng.choice(['girl', 'boy']),
+        })
+
+    def login(self):
+        self.call('POST', '/login', json={'email': self.email, 'password': self.password})
+
+    def page_load(self):
+        self.call('GET', '/chat')
+        self.call('GET', '/api/database-health')
+        self.call('GET', '/api/bootstrap')
+
+    def chat(self, turns):
+        for _ in range(turns):
+            self.call('POST', '/api/chat', json={'message': self.rng.choice(CHAT_MESSAGES)})
+
+    def share_media(self, duplicate_rate):
+        """Upload a new photo, or now and then re-send an earlier one to hit the duplicate path"""
+        if self.photos and self.rng.random() < duplicate_rate:
+            image_bytes = self.rng.choice(self.photos)
+        else:
+            image_bytes = make_test_image(self.rng.getrandbits(32))
+            self.photos.append(image_bytes)
+        response = self.call('POST', '/api/upload-media', classify=upload_path,
+                             files={'media': ('photo.jpg', image_bytes, 'image/jpeg')},
+                             data={'message': 'look at my setup!'})
+        if response is not None and response.status_code == 200:
+            data = response.json()
+            self.call('POST', '/api/chat', json={
+                'message': 'look at my setup!',
+                'media_analysis': data.get('analysis'),
+                'media_type': data.get('media_type'),
+            })
+
+    def journal(self):
+        self.call('POST', '/api/journal', json={
+            'content': self.rng.choice(JOURNAL_ENTRIES),
+            'mood': self.rng.choice(['good', 'okay', 'tired']),
+        })
+        self.call('GET', '/api/journal')
+
+    def reminders(self):
+        self.call('POST', '/api/reminders', json={
+            'title': 'Drink a glass of water 💧',
+            'date': date.today().isoformat(),
+            'time': f"{self.rng.randint(8, 21):02d}:00",
+            'repeat': 'daily',
+        })
+        self.call('GET', '/api/reminders')
+
+    def memories(self):
+        self.call('GET', '/api/memories')
+
+    def logout(self):
+        self.call('GET', '/logout')
+
+
+def make_test_image(seed):
+    """Small JPEG, different for every seed: coarse colour blocks (so perceptual
+    hashes differ) under noise (so it passes the sharpness check)"""
+    from PIL import Image
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(30, 225, size=(6, 8, 3)).repeat(80, axis=0).repeat(80, axis=1)
+    pixels = np.clip(blocks + rng.integers(-30, 30, size=blocks.shape), 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=80)
+    return buffer.getvalue()
+
+
+def upload_path(response):
+    """Which way the server handled an upload: screened and analyzed, answered from a duplicate, or rejected"""
+    if response.status_code == 422:
+        return 'rejected'
+    if response.status_code != 200:
+        return 'failed'
+    return 'duplicate' if response.json().get('reused') else 'analyzed'
+
+
+def run_user(base_url, recorder, seed, args):
+    rng = random.Random(seed)
+    user = VirtualUser(base_url, recorder, rng, think_time=args.think_time, accept_encoding=args.accept_encoding)
+    user.signup()
+    for session_number in range(args.sessions):
+        if session_number > 0:
+            user.login()
+        user.page_load()
+        user.chat(args.chat_turns)
+        if args.media:
+            user.share_media(args.duplicate_rate)
+        user.journal()
+        user.reminders()
+        user.memories()
+        user.logout()
+
+
+# ===== APP SERVER MANAGEMENT =====
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, provider_url, workdir):
+    port = free_port()
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': database_url,
+        'SECRET_KEY': 'bench-secret',
+        'GROQ_API_KEY': 'bench-groq-key',
+        'GROQ_BASE_URL': provider_url,
+        'GOOGLE_API_KEY': 'bench-google-key',
+        'GOOGLE_API_ENDPOINT': provider_url,
+        'PYTHONPATH': REPO_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+
+    if args.server == 'gunicorn':
+        # Same settings as production (preload, gc freeze, stream limit). Options
+        # given on our command line go through the environment variables
+        # gunicorn.conf.py reads, since it derives other settings from them.
+        command = [
+            sys.executable, '-m', 'gunicorn', 'app:app',
+            '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+            '--bind', f'127.0.0.1:{port}',
+        ]
+        for name, value in (('WEB_CONCURRENCY', args.workers), ('GUNICORN_WORKER_CLASS', args.worker_class),
+                            ('GUNICORN_THREADS', args.threads)):
+            if value is not None:
+                env[name] = str(value)
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                   '--host', '127.0.0.1', '--port', str(port), '--with-threads']
+
+    log_file = open(os.path.join(workdir, 'app.log'), 'w')
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            requests.get(base_url + '/api/session-status', timeout=2)
+            return process, base_url, database_url
+        except requests.RequestException:
+            time.sleep(0.25)
+
+    process.kill()
+    log_file.close()
+    with open(os.path.join(workdir, 'app.log')) as f:
+        print(f.read()[-4000:])
+    raise RuntimeError("App server did not become ready")
+
+
+def git_revision():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                             cwd=REPO_DIR, text=True).strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+# ===== REPORTING =====
+def print_report(result):
+    print("\n" + "=" * 96)
+    print(f"📊 HOMIE AI BENCHMARK — commit {result['commit']}{' (dirty)' if result['dirty'] else ''}")
+    print("=" * 96)
+    print(f"{'endpoint':<34}{'count':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'req/s':>9}")
+    print("-" * 96)
+    for endpoint, stats in result['endpoints'].items():
+        print(f"{endpoint:<34}{stats['count']:>7}{stats['errors']:>5}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['mean_ms']:>10.1f}{stats['rps']:>9.2f}")
+    total = result['total']
+    print("-" * 96)
+    print(f"{'TOTAL':<34}{total['count']:>7}{total['errors']:>5}{total['p50_ms']:>10.1f}"
+          f"{total['p95_ms']:>10.1f}{total['p99_ms']:>10.1f}{'':>10}{total['rps']:>9.2f}")
+    print(f"\n⏱️  Wall time: {total['wall_seconds']:.1f}s")
+
+    compressed = [(endpoint, stats['compression']) for endpoint, stats in result['endpoints'].items() if 'compression' in stats]
+    if compressed:
+        print(f"\n{'compressed responses':<34}{'count':>7}{'raw KB':>10}{'wire KB':>10}{'ratio':>8}{'cpu ms':>10}")
+        print("-" * 79)
+        for endpoint, stats in compressed:
+            ratio = f"{stats['ratio']:.1f}x" if stats['ratio'] else 'n/a'
+            print(f"{endpoint:<34}{stats['responses']:>7}{stats['raw_bytes'] / 1024:>10.1f}{stats['wire_bytes'] / 1024:>10.1f}"
+                  f"{ratio:>8}{stats['compress_ms_mean']:>10.2f}")
+
+
+def print_comparison(result, baseline):
+    print("\n" + "=" * 96)
+    print(f"🔍 COMPARISON vs commit {baseline.get('commit', '?')}")
+    print("=" * 96)
+    if baseline.get('config') != result.get('config'):
+        print("⚠️ Configs differ, numbers are not directly comparable")
+    print(f"{'endpoint':<34}{'p50 Δ%':>12}{'p95 Δ%':>12}{'p99 Δ%':>12}{'req/s Δ%':>12}")
+    print("-" * 96)
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}" if old else "n/a"
+
+    rows = list(result['endpoints'].items()) + [('TOTAL', result['total'])]
+    for endpoint, stats in rows:
+        old = baseline['total'] if endpoint == 'TOTAL' else baseline.get('endpoints', {}).get(endpoint)
+        if not old:
+            print(f"{endpoint:<34}{'(new)':>12}")
+            continue
+        print(f"{endpoint:<34}{delta(stats['p50_ms'], old['p50_ms']):>12}{delta(stats['p95_ms'], old['p95_ms']):>12}"
+              f"{delta(stats['p99_ms'], old['p99_ms']):>12}{delta(stats['rps'], old['rps']):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test for Homie AI')
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--sessions', type=int, default=2, help='sessions (page loads) per user')
+    parser.add_argument('--chat-turns', type=int, default=4, help='chat messages per session')
+    parser.add_argument('--no-media', dest='media', action='store_false', help='skip media uploads')
+    parser.add_argument('--duplicate-rate', type=float, default=0.25,
+                        help="chance a media upload re-sends one of the user's earlier photos")
+    parser.add_argument('--think-time', type=float, default=0.0, help='max random pause between requests (s)')
+    parser.add_argument('--groq-latency', default='lognormal:400,0.3')
+    parser.add_argument('--gemini-latency', default='lognormal:900,0.3')
+    parser.add_argument('--database-url', default=None, help='defaults to a temporary SQLite file')
+    parser.add_argument('--server', choices=['gunicorn', 'werkzeug'], default='gunicorn')
+    parser.add_argument('--workers', type=int, default=None, help='gunicorn workers (default from gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, default=None, help='gunicorn threads (default from gunicorn.conf.py)')
+    parser.add_argument('--accept-encoding', default='br, gzip', help="sent by every virtual user ('identity' disables compression)")
+    parser.add_argument('--worker-class', default=None,
+                        help="gunicorn worker class (default from gunicorn.conf.py; 'gevent' to try greenlets)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help='results JSON path (default bench_results/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='previous results JSON to diff against')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix='homie_bench_')
+    providers = start_fake_providers(groq_latency=args.groq_latency, gemini_latency=args.gemini_latency,
+                                     seed=args.seed)
+    print(f"🧪 Fake providers on {providers.base_url}")
+
+    process = None
+    try:
+        process, base_url, database_url = start_app(args, providers.base_url, workdir)
+        print(f"🚀 App ({args.server}) on {base_url}, database {database_url.split('@')[-1]}")
+
+        recorder = Recorder()
+        print(f"🏃 Replaying {args.users} users × {args.sessions} sessions × {args.chat_turns} chat turns...")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            futures = [pool.submit(run_user, base_url, recorder, args.seed * 1000 + i, args)
+                       for i in range(args.users)]
+            for future in futures:
+                future.result()
+        wall_seconds = time.perf_counter() - start
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        providers.shutdown()
+
+    endpoints, total = summarize(recorder, wall_seconds)
+    commit, dirty = git_revision()
+    result = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': {
+            'users': args.users,
+            'sessions': args.sessions,
+            'chat_turns': args.chat_turns,
+            'media': args.media,
+            'duplicate_rate': args.duplicate_rate,
+            'think_time': args.think_time,
+            'groq_latency': args.groq_latency,
+            'gemini_latency': args.gemini_latency,
+            'database': 'sqlite' if not args.database_url else args.database_url.split(':', 1)[0],
+            'server': args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': args.worker_class,
+            'accept_encoding': args.accept_encoding,
+            'seed': args.seed,
+        },
+        'provider_calls': dict(providers.stats),
+        'endpoints': endpoints,
+        'total': total,
+    }
+
+    print_report(result)
+
+    output = args.output or os.path.join(REPO_DIR, 'bench_results', f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"💾 Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if total['errors'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Serialization micro-benchmark for the /api/history read path
+Seeds a throwaway SQLite database with one user's conversation history and
+compares the old ORM + to_dict() + jsonify path against the Core column
+select serialized with the stdlib encoder and with orjson.
+
+Usage:
+    python benchmark_history.py                  # 1k, 10k and 100k rows
+    python benchmark_history.py --rows 5000 --repeat 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp(prefix='homie_bench_history_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'history.db')}"
+os.environ.setdefault('GROQ_API_KEY', 'bench')
+os.chdir(WORKDIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as homie  # noqa: E402
+
+
+def seed(user_id, rows):
+    """Insert `rows` conversation rows for one user with a multi-row INSERT"""
+    homie.Conversation.query.filter_by(user_id=user_id).delete()
+    start = datetime(2025, 1, 1)
+    batch = []
+    for i in range(rows):
+        role = 'user' if i % 2 == 0 else 'assistant'
+        batch.append({
+            'user_id': user_id,
+            'role': role,
+            'content': f"Message {i}: honestly it's been a long week but I'm getting there, thanks for listening ✨",
+            'detected_mood': 'tired' if role == 'user' else None,
+            'media_type': 'image' if i % 50 == 0 else None,
+            'media_analysis': 'A cozy desk with a laptop and fairy lights.' if i % 50 == 0 else None,
+            'timestamp': start + timedelta(seconds=30 * i),
+        })
+        if len(batch) == 5000:
+            homie.db.session.execute(homie.Conversation.__table__.insert(), batch)
+            batch = []
+    if batch:
+        homie.db.session.execute(homie.Conversation.__table__.insert(), batch)
+    homie.db.session.commit()
+
+
+def orm_path(user_id):
+    conversations = homie.Conversation.query.filter_by(user_id=user_id).order_by(
+        homie.Conversation.timestamp.asc()).all()
+    body = homie.jsonify([c.to_dict() for c in conversations]).get_data()
+    homie.db.session.expunge_all()
+    return body
+
+
+def core_stdlib_path(user_id):
+    saved, homie.orjson = homie.orjson, None
+    try:
+        return homie.dumps_json(homie.load_history(user_id))
+    finally:
+        homie.orjson = saved
+
+
+def core_orjson_path(user_id):
+    return homie.dumps_json(homie.load_history(user_id))
+
+
+def measure(fn, user_id, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = len(fn(user_id))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='History serialization benchmark')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='write results as JSON')
+    args = parser.parse_args()
+
+    paths = [('orm+jsonify', orm_path), ('core+json', core_stdlib_path)]
+    if homie.orjson is not None:
+        paths.append(('core+orjson', core_orjson_path))
+    else:
+        print("⚠️ orjson not installed, skipping the orjson path")
+
+    results = []
+    with homie.app.test_request_context():
+        user = homie.User(username='bench', email='bench@bench.local', avatar='girl')
+        user.set_password('bench')
+        homie.db.session.add(user)
+        homie.db.session.commit()
+
+        print(f"\n{'rows':>8}  " + "".join(f"{name:>16}" for name, _ in paths) + f"{'speedup':>10}{'bytes':>12}")
+        print("-" * (20 + 16 * len(paths) + 12))
+        for rows in args.rows:
+            seed(user.id, rows)
+            row_result = {'rows': rows, 'median_ms': {}}
+            for name, fn in paths:
+                fn(user.id)  # warm-up
+                elapsed, size = measure(fn, user.id, args.repeat)
+                row_result['median_ms'][name] = round(elapsed * 1000, 2)
+                row_result['bytes'] = size
+            baseline = row_result['median_ms']['orm+jsonify']
+            fastest = min(row_result['median_ms'].values())
+            row_result['speedup'] = round(baseline / fastest, 2) if fastest else None
+            results.append(row_result)
+            print(f"{rows:>8}  " + "".join(f"{row_result['median_ms'][name]:>13.1f} ms" for name, _ in paths)
+                  + f"{row_result['speedup']:>9.1f}x{row_result['bytes']:>12}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
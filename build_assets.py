@@ -0,0 +1,203 @@
+"""
+Static asset pipeline for Homie AI
+Runs during deployment (after pip install) and writes to static/dist/:
+  - content-hashed copies of every CSS/JS/image file (chat.3f9a1c2b7e.css)
+  - gzip and brotli precompressed variants of text assets
+  - WebP (and AVIF, when the Pillow plugin is installed) variants of the
+    background images
+  - manifest.json mapping logical paths to their built files
+
+The app reads the manifest at startup; templates reference assets through
+asset_url() so they pick up the hashed names automatically.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import sys
+
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# pillow-avif-plugin has no API to call: importing it registers an AVIF
+# encoder with Pillow, so check the registry rather than the import
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pillow_avif = None
+AVIF_SUPPORTED = 'AVIF' in Image.SAVE
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+TEXT_EXTENSIONS = {'.css', '.js', '.svg', '.json'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+# Large full-screen backgrounds get modern-format variants
+BACKGROUND_IMAGES = {'background.jpg', 'girl-avatar-bg.jpg', 'boy-avatar-bg.jpg'}
+COMPRESS_MIN_BYTES = 512
+
+CSS_URL_PATTERN = re.compile(r"url\((['\"]?)/static/([^'\")]+)\1\)")
+CSS_BACKGROUND_PATTERN = re.compile(r"^(\s*)background(?:-image)?:\s*url\((['\"]?)/static/([^'\")]+)\2\)")
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def hashed_name(logical_path, data):
+    root, ext = os.path.splitext(logical_path)
+    return f"{root}.{content_hash(data)}{ext}"
+
+
+def write_file(relative_path, data):
+    path = os.path.join(DIST_DIR, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def write_precompressed(relative_path, data):
+    """Write .gz/.br siblings when they actually save bytes"""
+    encodings = []
+    if len(data) < COMPRESS_MIN_BYTES:
+        return encodings
+
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        write_file(relative_path + '.gz', gz)
+        encodings.append('gzip')
+
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            write_file(relative_path + '.br', br)
+            encodings.append('br')
+    return encodings
+
+
+def image_variants(logical_path, source_path):
+    """Encode modern-format variants of a background image"""
+    variants = {}
+    formats = [('webp', 'WEBP', {'quality': 80, 'method': 6})]
+    if AVIF_SUPPORTED:
+        formats.append(('avif', 'AVIF', {'quality': 60}))
+
+    with Image.open(source_path) as img:
+        img = img.convert('RGB')
+        for ext, pil_format, options in formats:
+            buffer = io.BytesIO()
+            img.save(buffer, format=pil_format, **options)
+            data = buffer.getvalue()
+            root = os.path.splitext(logical_path)[0]
+            built = hashed_name(f"{root}.{ext}", data)
+            write_file(built, data)
+            variants[ext] = built
+    return variants
+
+
+def collect_sources():
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != DIST_DIR]
+        for filename in filenames:
+            ext = os.path.splitext(filename)[1].lower()
+            if ext in TEXT_EXTENSIONS or ext in IMAGE_EXTENSIONS:
+                full = os.path.join(dirpath, filename)
+                sources.append(os.path.relpath(full, STATIC_DIR).replace(os.sep, '/'))
+    return sorted(sources)
+
+
+def rewrite_css(css, manifest):
+    """Point url(/static/...) at hashed files and add image-set() for variants"""
+    def dist_url(logical):
+        entry = manifest.get(logical)
+        return f"/static/dist/{entry['file']}" if entry else f"/static/{logical}"
+
+    lines = []
+    for line in css.splitlines():
+        background = CSS_BACKGROUND_PATTERN.match(line)
+        rewritten = CSS_URL_PATTERN.sub(lambda m: f"url({m.group(1)}{dist_url(m.group(2))}{m.group(1)})", line)
+        lines.append(rewritten)
+
+        if background:
+            indent, logical = background.group(1), background.group(3)
+            entry = manifest.get(logical)
+            if entry and entry.get('variants'):
+                lines.append(f"{indent}background-image: {image_set(entry)};")
+    return "\n".join(lines) + ("\n" if css.endswith("\n") else "")
+
+
+def image_set(entry):
+    """CSS image-set() listing modern variants first and the original last"""
+    mimetypes = {'avif': 'image/avif', 'webp': 'image/webp'}
+    options = [f"url('/static/dist/{path}') type('{mimetypes[ext]}')"
+               for ext, path in sorted(entry['variants'].items())]
+    original_type = 'image/png' if entry['file'].endswith('.png') else 'image/jpeg'
+    options.append(f"url('/static/dist/{entry['file']}') type('{original_type}')")
+    return f"image-set({', '.join(options)})"
+
+
+def build():
+    print("=" * 60)
+    print("🎨 BUILDING STATIC ASSETS FOR HOMIE AI")
+    print("=" * 60)
+
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    if brotli is None:
+        print("⚠️ brotli not installed, skipping .br variants")
+    if not AVIF_SUPPORTED:
+        print("⚠️ pillow-avif-plugin not installed, skipping AVIF variants")
+
+    sources = collect_sources()
+    manifest = {}
+
+    # Images first so stylesheets can reference their hashed names
+    for logical in sources:
+        if os.path.splitext(logical)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        source_path = os.path.join(STATIC_DIR, logical)
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        built = hashed_name(logical, data)
+        write_file(built, data)
+        entry = {'file': built, 'encodings': []}
+        if logical in BACKGROUND_IMAGES:
+            entry['variants'] = image_variants(logical, source_path)
+        manifest[logical] = entry
+        print(f"   🖼️  {logical} -> {built}" + (f" (+{', '.join(entry.get('variants', {}))})" if entry.get('variants') else ""))
+
+    for logical in sources:
+        ext = os.path.splitext(logical)[1].lower()
+        if ext not in TEXT_EXTENSIONS:
+            continue
+        with open(os.path.join(STATIC_DIR, logical), 'rb') as f:
+            data = f.read()
+        if ext == '.css':
+            data = rewrite_css(data.decode('utf-8'), manifest).encode('utf-8')
+        built = hashed_name(logical, data)
+        write_file(built, data)
+        manifest[logical] = {'file': built, 'encodings': write_precompressed(built, data)}
+        print(f"   📄 {logical} -> {built} ({', '.join(manifest[logical]['encodings']) or 'uncompressed'})")
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print(f"\n✅ {len(manifest)} assets written to {os.path.relpath(DIST_DIR)}")
+    return True
+
+
+if __name__ == '__main__':
+    sys.exit(0 if build() else 1)
@@ -1,16 +1,46 @@
 """
-Database table creation script for Homie AI
-This runs during deployment to create all necessary tables
+Database table creation and maintenance CLI for Homie AI
+With no arguments it runs during deployment to create all necessary tables
 WITH RETRY LOGIC FOR PRODUCTION DEPLOYMENT
+
+Maintenance commands walk their table in keyset-paginated chunks, spread the
+chunks over a process pool, report progress and checkpoint after every chunk
+so an interrupted run resumes where it stopped:
+
+    python create_tables.py remood                 # recompute detected_mood, archive blocks included
+    python create_tables.py rebuild rollups        # recount every user's mood rollups
+    python create_tables.py rebuild indexes        # rebuild the performance indexes
+    python create_tables.py reconcile-stats        # recount every user's user_stats row
+
+Throttle them for production with --workers, --sleep (pause after each
+chunk, per worker) and --max-rows-per-sec. --restart ignores the checkpoint.
 """
 
 from app import app, db
-from sqlalchemy import inspect
+from sqlalchemy import inspect, select, func
+import argparse
+import json
+import multiprocessing
+import os
 import time
 import sys
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 # Force import all models to ensure they're registered
-from app import User, Conversation, JournalEntry, Reminder, UserMemory, ConversationSummary
+from app import User, Conversation, JournalEntry, Reminder, UserMemory, ConversationSummary, CollectionVersion, PurgeJob, ConversationArchive, MoodDaily, MoodRollupState, MemoryConsolidationState, RateLimitBucket, ProviderLease, IdempotencyRecord, ServerEvent, PrewarmedContext, UserStats, MediaFingerprint
+
+# Performance indexes (PostgreSQL only): name -> table and columns
+POSTGRES_INDEXES = {
+    # Conversation queries (most frequent)
+    'idx_conversation_user_timestamp': 'conversation(user_id, timestamp DESC)',
+    'idx_user_memory_user_importance': 'user_memory(user_id, importance_score DESC)',
+    'idx_journal_entry_user_timestamp': 'journal_entry(user_id, timestamp DESC)',
+    # Reading a user's archive blocks in order
+    'idx_conversation_archive_user_time': 'conversation_archive(user_id, first_timestamp)',
+    'idx_reminder_user_date': 'reminder(user_id, date, time)',
+}
 
 def wait_for_database(max_retries=10, wait_seconds=2):
     """Wait for database to be ready with retry logic"""
@@ -33,6 +63,44 @@ def wait_for_database(max_retries=10, wait_seconds=2):
                 return False
     return False
 
+# Tables keyed by user_id whose rows go when the user is deleted
+USER_FK_TABLES = ['conversation', 'journal_entry', 'reminder', 'user_memory',
+                  'conversation_summary', 'collection_version', 'conversation_archive',
+                  'mood_daily', 'mood_rollup_state', 'memory_consolidation_state',
+                  'idempotency_record', 'prewarmed_context', 'user_stats',
+                  'media_fingerprint']
+
+def ensure_cascading_foreign_keys():
+    """
+    Make every USER_FK_TABLES foreign key ON DELETE CASCADE (PostgreSQL only).
+    Keys that already cascade are left alone, so a normal deploy takes no
+    locks. Others are re-added NOT VALID (a brief lock, no scan) and then
+    validated in their own transaction, which scans without blocking writes.
+    """
+    from sqlalchemy import text
+    existing = text("""
+        SELECT conname, confdeltype, convalidated FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = to_regclass(:table) AND confrelid = '"user"'::regclass
+    """)
+    for table in USER_FK_TABLES:
+        with db.engine.begin() as conn:
+            constraint = conn.execute(existing, {'table': table}).first()
+        if constraint is not None and constraint.confdeltype == 'c' and constraint.convalidated:
+            continue
+        
+        name = constraint.conname if constraint is not None else f"{table}_user_id_fkey"
+        if constraint is None or constraint.confdeltype != 'c':
+            with db.engine.begin() as conn:
+                conn.execute(text(f"""
+                    ALTER TABLE {table}
+                    DROP CONSTRAINT IF EXISTS {name},
+                    ADD CONSTRAINT {name}
+                        FOREIGN KEY (user_id) REFERENCES "user"(id) ON DELETE CASCADE NOT VALID
+                """))
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"))
+        print(f"   ✓ {table}.{name} now cascades")
+
 def create_tables():
     """Create all database tables with retry logic"""
     with app.app_context():
@@ -87,34 +155,21 @@ def create_tables():
                 try:
                     from sqlalchemy import text
                     with db.engine.connect() as conn:
-                        # Index for conversation queries (most frequent)
-                        conn.execute(text("""
-                            CREATE INDEX IF NOT EXISTS idx_conversation_user_timestamp 
-                            ON conversation(user_id, timestamp DESC);
-                        """))
-                        
-                        # Index for memory queries
-                        conn.execute(text("""
-                            CREATE INDEX IF NOT EXISTS idx_user_memory_user_importance 
-                            ON user_memory(user_id, importance_score DESC);
-                        """))
-                        
-                        # Index for journal queries
-                        conn.execute(text("""
-                            CREATE INDEX IF NOT EXISTS idx_journal_entry_user_timestamp 
-                            ON journal_entry(user_id, timestamp DESC);
-                        """))
-                        
-                        # Index for reminder queries
-                        conn.execute(text("""
-                            CREATE INDEX IF NOT EXISTS idx_reminder_user_date 
-                            ON reminder(user_id, date, time);
-                        """))
-                        
+                        for name, target in POSTGRES_INDEXES.items():
+                            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {target};"))
                         conn.commit()
                     print("✅ Database indexes created successfully")
                 except Exception as e:
                     print(f"⚠️ Index creation warning (non-critical): {e}")
+
+                # Tables created before ON DELETE CASCADE was added keep their old
+                # foreign keys; recreate them so deleting a user cascades in the DB
+                print("\n🔧 Ensuring ON DELETE CASCADE foreign keys...")
+                try:
+                    ensure_cascading_foreign_keys()
+                    print("✅ Foreign keys cascade on delete")
+                except Exception as e:
+                    print(f"⚠️ Foreign key upgrade warning (non-critical): {e}")
             
             print("\n" + "=" * 60)
             print("🎉 DATABASE INITIALIZATION COMPLETE!")
@@ -129,6 +184,287 @@ def create_tables():
             traceback.print_exc()
             return False
 
+# ===== MAINTENANCE COMMANDS =====
+# Each chunk function runs in a pool worker on the rows with
+# after_id < id <= last_id, commits its own work and returns counters.
+
+def _init_worker():
+    # Connections inherited from the parent must not be shared with it
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def _apply_remood(changes):
+    """Move the MoodDaily counts of (user_id, timestamp, old mood, new mood) changes and bump the versions"""
+    from app import mood_rollups_ready, _add_mood_count, bump_collection_version
+    users = {user_id for user_id, _, _, _ in changes}
+    ready = {user_id for user_id in users if mood_rollups_ready(user_id)}
+    deltas = {}
+    for user_id, timestamp, old, new in changes:
+        if user_id in ready and timestamp:
+            for key, delta in (((user_id, timestamp.date(), old), -1), ((user_id, timestamp.date(), new), 1)):
+                if key[2]:
+                    deltas[key] = deltas.get(key, 0) + delta
+    for (user_id, day, mood), delta in deltas.items():
+        if delta:
+            _add_mood_count(user_id, day, 'chat', mood, delta)
+    for user_id in users:
+        bump_collection_version(user_id, 'history', *(['moods'] if user_id in ready else []))
+
+def remood_chunk(after_id, last_id, sleep):
+    """Re-run detect_mood on user messages, keeping the mood rollups in step"""
+    from app import detect_mood
+    with app.app_context():
+        rows = db.session.execute(select(
+            Conversation.id, Conversation.user_id, Conversation.content, Conversation.detected_mood, Conversation.timestamp
+        ).where(Conversation.id > after_id, Conversation.id <= last_id, Conversation.role == 'user')).all()
+        
+        changes = [(row, detect_mood(row.content)) for row in rows]
+        changes = [(row, mood) for row, mood in changes if mood != row.detected_mood]
+        if changes:
+            db.session.execute(db.update(Conversation), [{'id': row.id, 'detected_mood': mood} for row, mood in changes])
+            _apply_remood([(row.user_id, row.timestamp, row.detected_mood, mood) for row, mood in changes])
+            db.session.commit()
+        db.session.remove()
+    time.sleep(sleep)
+    return {'rows': len(rows), 'changed': len(changes)}
+
+def remood_archive_chunk(after_id, last_id, sleep):
+    """remood_chunk for archive blocks: decode each one, re-run detect_mood and re-encode it if anything changed"""
+    from app import detect_mood, pack_archive_rows, unpack_archive_block, visible_archive_blocks
+    messages = 0
+    changes = []
+    with app.app_context():
+        blocks = db.session.execute(select(
+            ConversationArchive.id, ConversationArchive.user_id, ConversationArchive.codec, ConversationArchive.data
+        ).where(ConversationArchive.id > after_id, ConversationArchive.id <= last_id)).all()
+        
+        for block in blocks:
+            rows = unpack_archive_block(block.codec, block.data)
+            block_changes = []
+            for row in rows:
+                if row['role'] != 'user':
+                    continue
+                messages += 1
+                mood = detect_mood(row['content'])
+                if mood != row['detected_mood']:
+                    timestamp = datetime.fromisoformat(row['timestamp']) if row['timestamp'] else None
+                    block_changes.append((block.user_id, timestamp, row['detected_mood'], mood))
+                    row['detected_mood'] = mood
+            if not block_changes:
+                continue
+            codec, data = pack_archive_rows(rows)
+            # A block queued for purge has already left the rollups; leave it be
+            updated = db.session.execute(db.update(ConversationArchive).where(
+                ConversationArchive.id == block.id, *visible_archive_blocks(block.user_id)
+            ).values(codec=codec, data=data)).rowcount
+            if updated:
+                changes += block_changes
+        if changes:
+            _apply_remood(changes)
+        db.session.commit()
+        db.session.remove()
+    time.sleep(sleep)
+    return {'rows': messages, 'blocks': len(blocks), 'changed': len(changes)}
+
+def rollups_chunk(after_id, last_id, sleep):
+    """Throw away and recount each user's MoodDaily rows"""
+    from app import backfill_user_moods
+    counted = 0
+    with app.app_context():
+        user_ids = db.session.execute(select(User.id).where(User.id > after_id, User.id <= last_id)).scalars().all()
+        for user_id in user_ids:
+            MoodDaily.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+            MoodRollupState.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+            counted += backfill_user_moods(user_id)  # commits the delete and the recount together
+        db.session.remove()
+    time.sleep(sleep)
+    return {'rows': len(user_ids), 'moods_counted': counted}
+
+def stats_chunk(after_id, last_id, sleep):
+    """Recount each user's user_stats row"""
+    from app import refresh_user_stats
+    drifted = 0
+    with app.app_context():
+        user_ids = db.session.execute(select(User.id).where(User.id > after_id, User.id <= last_id)).scalars().all()
+        for user_id in user_ids:
+            if refresh_user_stats(user_id):
+                drifted += 1
+            db.session.commit()
+        db.session.remove()
+    time.sleep(sleep)
+    return {'rows': len(user_ids), 'drifted': drifted}
+
+def keyset_chunks(column, after_id, chunk_size):
+    """Yield (after_id, last_id) bounds of successive chunk_size runs of ids"""
+    while True:
+        with db.engine.connect() as conn:
+            ids = select(column.label('id')).where(column > after_id).order_by(column).limit(chunk_size).subquery()
+            last_id = conn.execute(select(func.max(ids.c.id))).scalar()
+        if last_id is None:
+            return
+        yield after_id, last_id
+        after_id = last_id
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_checkpoint(path, checkpoint):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp, path)
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m" if seconds >= 3600 else f"{seconds // 60}m{seconds % 60:02d}s"
+
+def run_chunked(name, column, chunk_fn, args):
+    """Walk column in keyset chunks over a process pool with progress, checkpoints and throttling"""
+    checkpoint_path = os.path.join(args.checkpoint_dir, f"{name}.json")
+    checkpoint = None if args.restart else _load_checkpoint(checkpoint_path)
+    if checkpoint:
+        print(f"↩️  Resuming {name} after id {checkpoint['last_id']} (--restart to start over)")
+    else:
+        checkpoint = {'command': name, 'last_id': 0, 'totals': {}, 'started_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    
+    with app.app_context():
+        with db.engine.connect() as conn:
+            min_id, max_id = conn.execute(select(func.min(column), func.max(column))).one()
+        if max_id is None or checkpoint['last_id'] >= max_id:
+            print(f"✅ {name}: nothing to do")
+            return True
+        span = max(1, max_id - (min_id or 1) + 1)
+        print(f"🔄 {name}: ids {checkpoint['last_id'] + 1}..{max_id}, chunks of {args.chunk_size}, "
+              f"{args.workers} worker(s)")
+        
+        totals = checkpoint['totals']
+        pending = deque()  # [last_id, done] in submission order; the checkpoint is the newest unbroken done prefix
+        in_flight = {}
+        started = time.monotonic()
+        resumed_from = checkpoint['last_id']
+        rows_since_start = 0
+        chunks_submitted = 0
+        last_report = 0
+        
+        def collect(done):
+            nonlocal rows_since_start
+            for future in done:
+                entry = in_flight.pop(future)
+                result = future.result()
+                entry[1] = True
+                rows_since_start += result.get('rows', 0)
+                for key, value in result.items():
+                    totals[key] = totals.get(key, 0) + value
+            while pending and pending[0][1]:
+                checkpoint['last_id'] = pending.popleft()[0]
+            checkpoint['totals'] = totals
+            _save_checkpoint(checkpoint_path, checkpoint)
+            report()
+        
+        def report():
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report < args.progress_every:
+                return
+            last_report = now
+            elapsed = now - started
+            done_fraction = (checkpoint['last_id'] - (min_id or 1) + 1) / span
+            rate = rows_since_start / elapsed if elapsed else 0
+            covered = checkpoint['last_id'] - resumed_from
+            eta = elapsed * (max_id - checkpoint['last_id']) / covered if covered else 0
+            print(f"   {name}: {done_fraction * 100:5.1f}% (id {checkpoint['last_id']}/{max_id}) "
+                  f"{rate:,.0f} rows/s, ETA {_format_duration(eta)} {totals}", flush=True)
+        
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker) as pool:
+            for after_id, last_id in keyset_chunks(column, checkpoint['last_id'], args.chunk_size):
+                while len(in_flight) >= args.workers * 2:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                if args.max_rows_per_sec:
+                    # Chunks hold at most chunk_size rows; pace submissions to stay under the limit
+                    ahead = chunks_submitted * args.chunk_size / args.max_rows_per_sec - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+                chunks_submitted += 1
+                
+                entry = [last_id, False]
+                pending.append(entry)
+                in_flight[pool.submit(chunk_fn, after_id, last_id, args.sleep)] = entry
+            
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+    
+    elapsed = time.monotonic() - started
+    checkpoint['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    _save_checkpoint(checkpoint_path, checkpoint)
+    print(f"✅ {name} finished in {_format_duration(elapsed)}: {totals}")
+    # A finished run starts from the beginning next time
+    os.replace(checkpoint_path, checkpoint_path + '.done')
+    return True
+
+def rebuild_indexes():
+    """Rebuild the performance indexes without blocking writes where the database allows it"""
+    from sqlalchemy import text
+    with app.app_context():
+        is_postgresql = 'postgresql' in app.config['SQLALCHEMY_DATABASE_URI']
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            if not is_postgresql:
+                print("🔧 REINDEX (SQLite)")
+                conn.execute(text("REINDEX"))
+                return True
+            for name, target in POSTGRES_INDEXES.items():
+                started = time.monotonic()
+                exists = conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar()
+                if exists:
+                    conn.execute(text(f"REINDEX INDEX CONCURRENTLY {name}"))
+                else:
+                    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}"))
+                print(f"   ✓ {name} ({'rebuilt' if exists else 'created'} in {time.monotonic() - started:.1f}s)")
+    print("✅ Indexes rebuilt")
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Homie AI database setup and maintenance')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('create', help='create tables, indexes and foreign keys (the default)')
+    
+    def chunked_command(name, help):
+        command = commands.add_parser(name, help=help)
+        command.add_argument('--chunk-size', type=int, default=1000, help='rows (users, archive blocks) per chunk')
+        command.add_argument('--workers', type=int, default=2, help='worker processes')
+        command.add_argument('--sleep', type=float, default=0.1, help='seconds each worker pauses after a chunk')
+        command.add_argument('--max-rows-per-sec', type=float, default=0, help='overall rate limit (0 = none)')
+        command.add_argument('--progress-every', type=float, default=5, help='seconds between progress lines')
+        command.add_argument('--checkpoint-dir', default='.maintenance', help='where resumable checkpoints live')
+        command.add_argument('--restart', action='store_true', help='ignore any checkpoint and start over')
+        return command
+    
+    chunked_command('remood', 'recompute detected_mood for user messages, hot and archived (and their mood rollups)')
+    chunked_command('rebuild', 'rebuild derived data').add_argument('target', choices=['rollups', 'indexes'])
+    chunked_command('reconcile-stats', 'recount every user_stats row')
+    args = parser.parse_args(argv)
+    
+    if args.command in (None, 'create'):
+        return create_tables()
+    if not wait_for_database():
+        return False
+    if args.command == 'remood':
+        return (run_chunked('remood', Conversation.id, remood_chunk, args)
+                and run_chunked('remood-archive', ConversationArchive.id, remood_archive_chunk, args))
+    if args.command == 'rebuild' and args.target == 'rollups':
+        return run_chunked('rebuild-rollups', User.id, rollups_chunk, args)
+    if args.command == 'rebuild':
+        return rebuild_indexes()
+    return run_chunked('reconcile-stats', User.id, stats_chunk, args)
+
 if __name__ == '__main__':
-    success = create_tables()
+    success = main()
     sys.exit(0 if success else 1)
@@ -0,0 +1,260 @@
+"""
+Local stand-ins for the Groq and Gemini APIs used by Homie AI
+Serves an OpenAI-compatible Groq endpoint and the Gemini REST endpoint
+from one HTTP server, with configurable latency distributions.
+
+Point the app at it with:
+    GROQ_BASE_URL=http://127.0.0.1:8099
+    GOOGLE_API_ENDPOINT=http://127.0.0.1:8099
+
+Run standalone:
+    python fake_providers.py --port 8099 --groq-latency lognormal:600,0.4
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHAT_REPLIES = [
+    "Honestly that sounds like a lot to carry. I'm really glad you told me about it. "
+    "What part of it has been sitting with you the most today? We can take it one step at a time.",
+    "Oh I love that! You've been working towards this for a while now. "
+    "How did it feel when it finally came together? Tell me everything.",
+    "That makes total sense. Anyone would feel a bit drained after a week like that. "
+    "Have you had any time to just switch off? Even a short walk can help reset things.",
+    "Hey, I remember you mentioned something like this before. "
+    "It sounds like it keeps coming back around. Do you want to talk through what's been different this time?",
+]
+
+MEMORY_REPLY = {
+    "memories": [
+        {"type": "preference", "content": "Enjoys late night coding sessions with lofi music", "importance": 6},
+        {"type": "goal", "content": "Wants to ship a side project before the end of the month", "importance": 7},
+    ]
+}
+
+SUMMARY_REPLY = {
+    "summary": "This week we talked about work stress, side projects and winding down in the evenings.",
+    "key_topics": ["work", "side project", "rest"],
+    "emotional_tone": "hopeful",
+}
+
+GEMINI_REPLY = (
+    "The image shows a young person sitting cross-legged on a bed wearing over-ear headphones "
+    "and a beige hoodie. A laptop is open in front of them and warm fairy lights hang on the wall. "
+    "The mood is calm and cozy."
+)
+
+
+# ===== LATENCY DISTRIBUTIONS =====
+class LatencyDistribution:
+    """
+    Samples a delay in seconds from a spec string:
+        fixed:300          always 300 ms
+        uniform:200,800    uniform between 200 and 800 ms
+        normal:400,100     gaussian, mean 400 ms, stddev 100 ms
+        lognormal:400,0.5  lognormal with median 400 ms and sigma 0.5
+        exp:300            exponential with mean 300 ms
+    """
+
+    KINDS = ('fixed', 'uniform', 'normal', 'lognormal', 'exp')
+
+    def __init__(self, spec, seed=None):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution '{kind}' (expected one of {', '.join(self.KINDS)})")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(',') if p.strip()] or [0.0]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        p = self.params
+        with self._lock:
+            if self.kind == 'fixed':
+                ms = p[0]
+            elif self.kind == 'uniform':
+                ms = self._rng.uniform(p[0], p[1] if len(p) > 1 else p[0])
+            elif self.kind == 'normal':
+                ms = self._rng.gauss(p[0], p[1] if len(p) > 1 else 0.0)
+            elif self.kind == 'lognormal':
+                ms = self._rng.lognormvariate(0.0, p[1] if len(p) > 1 else 0.5) * p[0]
+            else:
+                ms = self._rng.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, ms) / 1000.0
+
+    def __repr__(self):
+        return f"LatencyDistribution({self.spec!r})"
+
+
+# ===== REQUEST HANDLER =====
+def _count_tokens(text):
+    """Rough whitespace token count, good enough for usage numbers"""
+    return max(1, len(text.split()))
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'HomieFakeProviders/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        try:
+            return json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        payload = self._read_json()
+
+        if path.endswith('/chat/completions'):
+            time.sleep(self.server.groq_latency.sample())
+            if payload.get('stream'):
+                self._stream_completion(self._groq_completion(payload))
+            else:
+                self._send_json(200, self._groq_completion(payload))
+        elif re.search(r'/models/[^/]+:generateContent$', path):
+            time.sleep(self.server.gemini_latency.sample())
+            self._send_json(200, self._gemini_response())
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {path}'}})
+
+        with self.server.stats_lock:
+            self.server.stats[path] = self.server.stats.get(path, 0) + 1
+
+    def _stream_completion(self, completion):
+        """Replay a completion as OpenAI-style SSE chunks, one word per chunk"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(data):
+            body = f"data: {data}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(body):x}\r\n".encode('ascii') + body + b"\r\n")
+            self.wfile.flush()
+
+        base = {key: completion[key] for key in ('id', 'created', 'model')}
+        base['object'] = 'chat.completion.chunk'
+        words = re.findall(r'\S+\s*', completion['choices'][0]['message']['content'])
+        for i, word in enumerate(words):
+            delta = {'role': 'assistant', 'content': word} if i == 0 else {'content': word}
+            send(json.dumps(dict(base, choices=[{'index': 0, 'delta': delta, 'finish_reason': None}])))
+            time.sleep(self.server.token_interval)
+        send(json.dumps(dict(base, choices=[{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                             x_groq={'id': completion['id'], 'usage': completion['usage']})))
+        send('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _groq_completion(self, payload):
+        messages = payload.get('messages') or []
+        prompt = messages[-1].get('content', '') if messages else ''
+
+        if '"memories"' in prompt:
+            content = json.dumps(MEMORY_REPLY)
+        elif '"key_topics"' in prompt:
+            content = json.dumps(SUMMARY_REPLY)
+        else:
+            content = random.choice(CHAT_REPLIES)
+
+        prompt_tokens = sum(_count_tokens(m.get('content', '')) for m in messages)
+        completion_tokens = _count_tokens(content)
+        return {
+            'id': f'chatcmpl-fake-{random.getrandbits(48):x}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'llama-3.1-8b-instant'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+                'logprobs': None,
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _gemini_response(self):
+        return {
+            'candidates': [{
+                'content': {'parts': [{'text': GEMINI_REPLY}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+            'usageMetadata': {
+                'promptTokenCount': 258,
+                'candidatesTokenCount': _count_tokens(GEMINI_REPLY),
+                'totalTokenCount': 258 + _count_tokens(GEMINI_REPLY),
+            },
+        }
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, groq_latency, gemini_latency):
+        super().__init__(address, FakeProviderHandler)
+        self.groq_latency = groq_latency
+        self.gemini_latency = gemini_latency
+        self.token_interval = 0.01
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_providers(host='127.0.0.1', port=0, groq_latency='fixed:0',
+                         gemini_latency='fixed:0', seed=None):
+    """Start the fake provider server on a background thread and return it"""
+    server = FakeProviderServer(
+        (host, port),
+        LatencyDistribution(groq_latency, seed=seed),
+        LatencyDistribution(gemini_latency, seed=None if seed is None else seed + 1),
+    )
+    thread = threading.Thread(target=server.serve_forever, name='fake-providers', daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Groq/Gemini servers for local load testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--groq-latency', default='lognormal:600,0.4')
+    parser.add_argument('--gemini-latency', default='lognormal:1500,0.3')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = start_fake_providers(args.host, args.port, args.groq_latency, args.gemini_latency, args.seed)
+    print(f"🧪 Fake providers listening on {server.base_url}")
+    print(f"   Groq latency:   {args.groq_latency}")
+    print(f"   Gemini latency: {args.gemini_latency}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
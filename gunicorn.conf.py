@@ -0,0 +1,69 @@
+"""
+Gunicorn settings for Homie AI
+Loaded automatically by `gunicorn app:app` from the project root.
+
+With GUNICORN_PRELOAD=1 (the default) the app, OpenCV, NumPy, PIL, the
+provider SDKs and the SQLAlchemy metadata are imported once in the master
+and shared copy-on-write by every worker. Following the gc.freeze() recipe,
+the master runs with the cyclic GC off so collections don't leave holes in
+shared pages. Everything is frozen into the permanent generation just before
+each fork, and workers switch the GC back on. app.py reconnects the database
+in each child (os.register_at_fork).
+
+Size --workers/--threads from GET /api/admin/memory: USS is what each extra
+worker really costs, while shared stays with the master.
+
+Workers are gthread by default. Each open /api/events stream holds one of a
+worker's threads, so app.py caps streams at half of them (EVENT_STREAM_LIMIT)
+and pages past the cap fall back to refetching. GUNICORN_WORKER_CLASS=gevent
+opts into greenlets, where streams cost almost nothing, for deployments that
+are mostly idle streams. CPU-bound work (OpenCV/NumPy screening, brotli)
+runs on the event loop there and stalls every greenlet in the worker while
+it does. The gevent worker monkey-patches itself before loading the app, so
+preload is off for it: the app imports after the patch, with gevent-aware
+locks and psycopg2 patched by app.py.
+"""
+
+import gc
+import os
+import tracemalloc
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+gevent_worker = worker_class in ('gevent', 'gunicorn.workers.ggevent.GeventWorker')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Greenlets past the 7 pooled database connections (pool_size + max_overflow
+# in app.py) wait on the pool's checkout, which is gevent-aware once patched,
+# for up to pool_timeout; idle event streams don't hold a connection
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+timeout = 120
+# The gevent worker patches at startup, after a preloaded master would already
+# have created unpatched locks and pools
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1' and not gevent_worker
+
+if not gevent_worker:
+    # Leave half of each worker's threads for ordinary requests
+    os.environ.setdefault('EVENT_STREAM_LIMIT', str(max(1, threads // 2)))
+
+if int(os.environ.get('TRACEMALLOC', 0)):
+    # Started before the app import so import-time allocations are attributed
+    tracemalloc.start(int(os.environ['TRACEMALLOC']))
+
+if preload_app:
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+    if gevent_worker:
+        # Runs before the worker patches. httpcore imports trio when it is
+        # installed, and trio needs select.epoll, which the patch removes.
+        import httpcore  # noqa: F401
+    server.log.info("Worker %s forked (preload=%s, frozen objects=%s)", worker.pid, preload_app, gc.get_freeze_count())
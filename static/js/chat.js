@@ -12,6 +12,10 @@ let musicVolume = 0.5;
 let musicTracks = [];
 let musicInitialized = false;
 
+// Data preloaded by /api/bootstrap, used the first time each modal opens
+let preloadedJournal = null;
+let preloadedReminders = null;
+
 // Media upload variables
 let selectedMedia = null;
 let mediaAnalysis = null;
@@ -20,11 +24,67 @@ let mediaType = null;
 const video = document.getElementById('avatarVideo');
 const videoBackground = document.getElementById('videoBackground');
 const staticBackground = document.getElementById('staticBackground');
-const userAvatar = document.querySelector('.static-background').style.backgroundImage.includes('girl') ? 'girl' : 'boy';
+const userAvatar = staticBackground.dataset.avatar;
 
 video.pause();
 video.currentTime = 0;
 
+// ===== CONDITIONAL REQUESTS =====
+// Remembers the last ETag and body per key (in sessionStorage when it fits)
+// so repeat loads send If-None-Match and reuse the body on a 304.
+const VALIDATOR_PREFIX = 'homie-validator:';
+const validatorCache = {};
+
+function getValidator(key) {
+    if (validatorCache[key]) return validatorCache[key];
+    try {
+        const stored = sessionStorage.getItem(VALIDATOR_PREFIX + key);
+        if (stored) {
+            validatorCache[key] = JSON.parse(stored);
+            return validatorCache[key];
+        }
+    } catch (error) {
+        // Storage unavailable or corrupt entry; fall through to a full load
+    }
+    return null;
+}
+
+function storeValidator(key, etag, data) {
+    if (!etag) return;
+    validatorCache[key] = { etag, data };
+    try {
+        sessionStorage.setItem(VALIDATOR_PREFIX + key, JSON.stringify({ etag, data }));
+    } catch (error) {
+        // Quota exceeded (e.g. very long history); the in-memory copy still works
+    }
+}
+
+function clearValidators() {
+    try {
+        Object.keys(sessionStorage)
+            .filter(key => key.startsWith(VALIDATOR_PREFIX))
+            .forEach(key => sessionStorage.removeItem(key));
+    } catch (error) {
+        // Nothing to clear
+    }
+}
+
+async function fetchJSONWithValidators(url) {
+    const cached = getValidator(url);
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+    
+    const data = await response.json();
+    if (response.ok) {
+        storeValidator(url, response.headers.get('ETag'), data);
+    }
+    return data;
+}
+
 // ===== MEDIA UPLOAD FUNCTIONS =====
 function handleMediaSelect(event) {
     const file = event.target.files[0];
@@ -95,8 +155,7 @@ async function uploadAndAnalyzeMedia(message) {
 // ===== MUSIC FUNCTIONS =====
 async function loadMusicTracks() {
     try {
-        const response = await fetch('/api/music-list');
-        musicTracks = await response.json();
+        musicTracks = await fetchJSONWithValidators('/api/music-list');
         console.log('Music tracks loaded:', musicTracks);
     } catch (error) {
         console.error('Failed to load music tracks:', error);
@@ -114,7 +173,17 @@ async function loadUserMusicPreferences() {
     try {
         const response = await fetch('/api/user-music-preference');
         const preferences = await response.json();
-        
+        applyMusicPreferences(preferences);
+    } catch (error) {
+        console.error('Failed to load music preferences:', error);
+        if (!musicInitialized) {
+            initializeMusic();
+        }
+    }
+}
+
+function applyMusicPreferences(preferences) {
+    try {
         musicEnabled = preferences.music_enabled;
         currentTrack = preferences.current_track || 2;
         musicVolume = preferences.volume;
@@ -128,7 +197,7 @@ async function loadUserMusicPreferences() {
         }
         
     } catch (error) {
-        console.error('Failed to load music preferences:', error);
+        console.error('Failed to apply music preferences:', error);
         if (!musicInitialized) {
             initializeMusic();
         }
@@ -439,6 +508,158 @@ async function displaySegmentedMessages(segments, mood, safeSpaceMode) {
     }
 }
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Retries reuse the caller's Idempotency-Key, so the server answers a retry of
+// a message it already handled (or is still handling) without running it twice
+async function postChatMessage(payload, key, attempts = 3) {
+    const body = JSON.stringify(payload);
+    for (let attempt = 1; ; attempt++) {
+        try {
+            const response = await fetch('/api/chat', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+                body
+            });
+            if (response.status !== 409 || attempt >= attempts) return response;
+            const retryAfter = parseInt(response.headers.get('Retry-After') || '2', 10);
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+        } catch (error) {
+            if (attempt >= attempts) throw error;
+            console.warn(`⚠️ Chat request failed (attempt ${attempt}), retrying...`, error);
+            await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+    }
+}
+
+// ===== CONTEXT PREWARM =====
+// Shortly after the user starts typing, ask the server to assemble the next
+// turn's context so sending only has to add the message. At most one prewarm
+// per server TTL; sending a message makes the cached context stale.
+const PREWARM_DELAY_MS = 400;
+let prewarmTimer = null;
+let prewarmValidUntil = 0;
+
+function schedulePrewarm() {
+    if (prewarmTimer || Date.now() < prewarmValidUntil) return;
+    if (!document.getElementById('messageInput').value.trim()) return;
+    prewarmTimer = setTimeout(async () => {
+        try {
+            const response = await fetch('/api/chat/prewarm', { method: 'POST' });
+            const data = await response.json();
+            // Busy or rate limited counts too: back off either way
+            if (response.ok) prewarmValidUntil = Date.now() + (data.ttl || 60) * 750;
+        } catch (error) {
+            // Best effort; the turn just builds its own context
+        }
+        prewarmTimer = null;
+    }, PREWARM_DELAY_MS);
+}
+
+// ===== STREAMING CHAT =====
+// /api/chat/stream answers with server-sent events: token* then done|error.
+// Returns false when streaming is unavailable before anything was shown, so
+// the caller can fall back to the plain JSON endpoint.
+function parseSSE(buffer, onEvent) {
+    const blocks = buffer.split('\n\n');
+    const rest = blocks.pop();
+    for (const block of blocks) {
+        let type = 'message';
+        const data = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) type = line.slice(6).trim();
+            else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+        }
+        if (data.length) onEvent(type, JSON.parse(data.join('\n')));
+    }
+    return rest;
+}
+
+async function streamChatMessage(payload, key) {
+    if (!window.ReadableStream || !window.TextDecoder) return false;
+
+    let response;
+    try {
+        response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+            body: JSON.stringify(payload)
+        });
+    } catch (error) {
+        console.warn('⚠️ Streaming unavailable, falling back to HTTP', error);
+        return false;
+    }
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!response.ok || !contentType.startsWith('text/event-stream')) {
+        if (response.status === 429 || response.status === 503) {
+            const data = await response.json().catch(() => ({}));
+            hideTyping();
+            addMessage('assistant', data.error || 'I need a moment, please try again shortly.');
+            return true;
+        }
+        return false;
+    }
+
+    let bubble = null;
+    let result = null;
+    const showToken = (text) => {
+        if (!bubble) {
+            hideTyping();
+            addMessage('assistant', text);
+            bubble = document.querySelector('#messagesContainer .message.assistant:last-child .message-content');
+            return;
+        }
+        bubble.textContent += text;
+        const container = document.getElementById('messagesContainer');
+        container.scrollTop = container.scrollHeight;
+    };
+
+    try {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer = parseSSE(buffer + decoder.decode(value, { stream: true }), (type, data) => {
+                if (type === 'token') showToken(data.text);
+                else if (type === 'done' || type === 'error') result = { type, data };
+            });
+        }
+    } catch (error) {
+        console.error('❌ Stream interrupted:', error);
+    }
+
+    hideTyping();
+    if (!result) {
+        if (!bubble) return false;
+        addMessage('assistant', 'Oops, connection issue. Can you try again?');
+        return true;
+    }
+    if (result.type === 'error') {
+        addMessage('assistant', `Sorry, I encountered an error: ${result.data.error || 'Unknown error'}`);
+        return true;
+    }
+    if (!bubble) {
+        // Answered without tokens (e.g. the "first conversation" recap or a replay)
+        addMessage('assistant', result.data.response);
+    } else {
+        bubble.textContent = result.data.response;
+    }
+    if (result.data.mood) updateMoodVisuals(result.data.mood, result.data.safe_space_mode);
+    if (result.data.safe_space_mode) {
+        setTimeout(() => {
+            if (confirm('I sense you might be feeling overwhelmed. Would you like to try a calming breathing exercise?')) {
+                activateCalmMode();
+            }
+        }, 1000);
+    }
+    return true;
+}
+
 async function sendMessage() {
     if (isTyping) return;
 
@@ -448,6 +669,7 @@ async function sendMessage() {
     if (!message && !selectedMedia) return;
 
     isTyping = true;
+    prewarmValidUntil = 0;
     document.getElementById('sendBtn').disabled = true;
     
     let uploadedMediaData = null;
@@ -489,18 +711,26 @@ async function sendMessage() {
 
     const startTime = Date.now();
     const minDelay = 2000; // Reduced since we'll add delays between segments
+    const payload = {
+        message: message || "What do you think about this?",
+        media_analysis: currentMediaAnalysis,
+        media_type: currentMediaType
+    };
+    // One key per message: if the stream request reached the server before
+    // failing, the fallback POST replays that turn instead of running it again
+    const idempotencyKey = newIdempotencyKey();
+
+    if (await streamChatMessage(payload, idempotencyKey)) {
+        videoTimeout = setTimeout(hideVideoBackground, 500);
+        isTyping = false;
+        document.getElementById('sendBtn').disabled = false;
+        input.focus();
+        return;
+    }
 
     try {
         console.log('📤 Sending message to API...');
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ 
-                message: message || "What do you think about this?",
-                media_analysis: currentMediaAnalysis,
-                media_type: currentMediaType
-            })
-        });
+        const response = await postChatMessage(payload, idempotencyKey);
 
         console.log('📥 API response status:', response.status);
         const data = await response.json();
@@ -576,9 +806,15 @@ async function sendMessage() {
 // ===== HISTORY AND SESSION =====
 async function loadHistory() {
     try {
-        const response = await fetch('/api/history');
-        const history = await response.json();
-        
+        const history = await fetchJSONWithValidators('/api/history');
+        renderHistory(history);
+    } catch (error) {
+        console.error('Failed to load history:', error);
+    }
+}
+
+function renderHistory(history) {
+    try {
         const container = document.getElementById('messagesContainer');
         const welcomeMsg = container.querySelector('.welcome-message');
         
@@ -591,7 +827,7 @@ async function loadHistory() {
             addMessage(msg.role, msg.content, hasMedia, msg.media_type);
         });
     } catch (error) {
-        console.error('Failed to load history:', error);
+        console.error('Failed to render history:', error);
     }
 }
 
@@ -599,17 +835,62 @@ async function loadGreeting() {
     try {
         const response = await fetch('/api/greeting');
         const data = await response.json();
-        
-        const welcomeMsg = document.querySelector('.welcome-message');
-        if (welcomeMsg && !document.querySelector('.message')) {
-            welcomeMsg.querySelector('h3').textContent = data.greeting;
-            welcomeMsg.querySelector('p').textContent = data.message;
-        }
+        renderGreeting(data);
     } catch (error) {
         console.log('Could not load greeting');
     }
 }
 
+function renderGreeting(data) {
+    const welcomeMsg = document.querySelector('.welcome-message');
+    if (welcomeMsg && !document.querySelector('.message')) {
+        welcomeMsg.querySelector('h3').textContent = data.greeting;
+        welcomeMsg.querySelector('p').textContent = data.message;
+    }
+}
+
+// Loads greeting, history, music, journal and reminders in one request.
+// Falls back to the individual endpoints if the bootstrap call fails.
+async function loadBootstrap() {
+    try {
+        // Send the ETag we hold for each part; unchanged parts come back null
+        const parts = ['history', 'journal', 'reminders'];
+        const params = new URLSearchParams();
+        parts.forEach(part => {
+            const cached = getValidator(`bootstrap:${part}`);
+            if (cached) params.set(part, cached.etag);
+        });
+        
+        const response = await fetch(`/api/bootstrap?${params}`, { cache: 'no-store' });
+        if (!response.ok) throw new Error(`Bootstrap failed with status ${response.status}`);
+        const data = await response.json();
+        
+        parts.forEach(part => {
+            if (data.not_modified.includes(part)) {
+                data[part] = getValidator(`bootstrap:${part}`).data;
+            } else {
+                storeValidator(`bootstrap:${part}`, data.etags[part], data[part]);
+            }
+        });
+        
+        renderGreeting(data.greeting);
+        renderHistory(data.history);
+        
+        musicTracks = data.music_list;
+        applyMusicPreferences(data.music_preferences);
+        
+        preloadedJournal = data.journal;
+        preloadedReminders = data.reminders;
+    } catch (error) {
+        console.error('Bootstrap failed, loading page data individually:', error);
+        loadGreeting();
+        loadHistory();
+        loadMusicTracks().then(() => {
+            loadUserMusicPreferences();
+        });
+    }
+}
+
 async function clearHistory() {
     if (!confirm('Clear all conversation history? This cannot be undone.')) return;
 
@@ -621,13 +902,49 @@ async function clearHistory() {
     }
 }
 
+// ===== SERVER EVENTS =====
+// One EventSource per page for server-initiated events; the browser
+// reconnects on its own (the server sends retry: 3000).
+let eventSource = null;
+
+function connectEvents() {
+    if (!window.EventSource || eventSource) return;
+    eventSource = new EventSource(`/api/events?tz=${new Date().getTimezoneOffset()}`);
+
+    eventSource.addEventListener('collection.changed', (event) => {
+        const { collection } = JSON.parse(event.data);
+        if (collection === 'journal') {
+            preloadedJournal = null;
+            if (document.getElementById('journalModal').style.display === 'block') loadJournalEntries();
+        } else if (collection === 'reminders') {
+            preloadedReminders = null;
+            if (document.getElementById('remindersModal').style.display === 'block') loadReminders();
+        }
+    });
+
+    eventSource.addEventListener('reminder.due', (event) => {
+        const reminder = JSON.parse(event.data);
+        addMessage('assistant', `⏰ Reminder: ${reminder.title}`);
+        if (window.Notification && Notification.permission === 'granted') {
+            new Notification('Homie reminder', { body: reminder.title });
+        }
+    });
+}
+
 function logout() {
+    if (eventSource) eventSource.close();
+    clearValidators();
     window.location.href = '/logout';
 }
 
 // ===== JOURNAL FUNCTIONS =====
 async function openJournal() {
     document.getElementById('journalModal').style.display = 'block';
+    if (preloadedJournal) {
+        renderJournalEntries(preloadedJournal);
+        preloadedJournal = null;
+        return;
+    }
     await loadJournalEntries();
 }
 
@@ -678,9 +995,15 @@ async function saveJournalEntry() {
 
 async function loadJournalEntries() {
     try {
-        const response = await fetch('/api/journal');
-        const entries = await response.json();
-        
+        const entries = await fetchJSONWithValidators('/api/journal');
+        renderJournalEntries(entries);
+    } catch (error) {
+        console.error('Failed to load journal entries:', error);
+    }
+}
+
+function renderJournalEntries(entries) {
+    try {
         const container = document.getElementById('journalEntriesList');
         container.innerHTML = '<h3 style="color: #f0f0f0; margin-bottom: 15px;">Recent Entries</h3>';
         
@@ -714,13 +1037,19 @@ async function loadJournalEntries() {
             container.appendChild(entryDiv);
         });
     } catch (error) {
-        console.error('Failed to load journal entries:', error);
+        console.error('Failed to render journal entries:', error);
     }
 }
 
 // ===== REMINDER FUNCTIONS =====
 async function openReminders() {
     document.getElementById('remindersModal').style.display = 'block';
+    if (window.Notification && Notification.permission === 'default') Notification.requestPermission();
+    if (preloadedReminders) {
+        renderReminders(preloadedReminders);
+        preloadedReminders = null;
+        return;
+    }
     await loadReminders();
 }
 
@@ -772,9 +1101,15 @@ async function saveReminder() {
 
 async function loadReminders() {
     try {
-        const response = await fetch('/api/reminders');
-        const reminders = await response.json();
-        
+        const reminders = await fetchJSONWithValidators('/api/reminders');
+        renderReminders(reminders);
+    } catch (error) {
+        console.error('Failed to load reminders:', error);
+    }
+}
+
+function renderReminders(reminders) {
+    try {
         const container = document.getElementById('remindersList');
         container.innerHTML = '<h3 style="color: #f0f0f0; margin-bottom: 15px;">Upcoming Reminders</h3>';
         
@@ -819,7 +1154,7 @@ async function loadReminders() {
             container.appendChild(reminderDiv);
         });
     } catch (error) {
-        console.error('Failed to load reminders:', error);
+        console.error('Failed to render reminders:', error);
     }
 }
 
@@ -875,12 +1210,8 @@ document.addEventListener('DOMContentLoaded', async () => {
     // Check database health first
     await checkDatabaseHealth();
     
-    loadGreeting();
-    loadHistory();
-    
-    loadMusicTracks().then(() => {
-        loadUserMusicPreferences();
-    });
+    loadBootstrap();
+    connectEvents();
     
     const today = new Date().toISOString().split('T')[0];
     document.getElementById('reminderDate').value = today;
@@ -0,0 +1,76 @@
+"""
+Shared fixtures: the app runs against a throwaway SQLite database and the
+local Groq/Gemini stand-ins from fake_providers.py, with background jobs off
+so tests call the jobs themselves.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from fake_providers import start_fake_providers
+
+_providers = start_fake_providers()
+_workdir = tempfile.mkdtemp(prefix='homie_tests_')
+os.environ.update({
+    # Point TEST_DATABASE_URL at a scratch PostgreSQL database to test its locking too
+    'DATABASE_URL': os.environ.get('TEST_DATABASE_URL', f"sqlite:///{os.path.join(_workdir, 'test.db')}"),
+    'SECRET_KEY': 'test-secret',
+    'GROQ_API_KEY': 'test-groq-key',
+    'GROQ_BASE_URL': _providers.base_url,
+    'GOOGLE_API_KEY': 'test-google-key',
+    'GOOGLE_API_ENDPOINT': _providers.base_url,
+    'BACKGROUND_JOBS': '0',
+    'LOG_LEVEL': 'warning',
+})
+os.environ.pop('REDIS_URL', None)
+
+import app as homie  # noqa: E402  (configured from the environment above)
+
+
+@pytest.fixture
+def app():
+    return homie.app
+
+
+@pytest.fixture
+def client(app):
+    """A test client signed in as a fresh user; client.user_id is that user's id"""
+    client = app.test_client()
+    name = f"test_{uuid.uuid4().hex[:10]}"
+    response = client.post('/signup', json={'username': name, 'email': f"{name}@test.local", 'password': 'pw'})
+    assert response.status_code == 200, response.data
+    with client.session_transaction() as session:
+        client.user_id = session['user_id']
+    return client
+
+
+@pytest.fixture
+def ctx(app):
+    """An app context whose session is discarded afterwards"""
+    with app.app_context():
+        yield
+        homie.db.session.remove()
+
+
+@pytest.fixture
+def add_messages(app):
+    def add(user_id, count, start=None, step=timedelta(minutes=1), mood='happy'):
+        """Commit count alternating user/assistant rows through ChatUnitOfWork, oldest first"""
+        start = start or datetime.utcnow() - step * count
+        with app.app_context():
+            turn = homie.ChatUnitOfWork(user_id)
+            for i in range(count):
+                turn.add_message(homie.Conversation(
+                    user_id=user_id, role='user' if i % 2 == 0 else 'assistant', content=f"message {i}",
+                    detected_mood=mood if i % 2 == 0 else None, timestamp=start + step * i))
+            turn.commit()
+            homie.db.session.remove()
+    return add
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+import app as homie
+
+
+@pytest.fixture(params=['memory', 'database'])
+def limiter(request, ctx):
+    return {'memory': homie.MemoryLimiterBackend, 'database': homie.DatabaseLimiterBackend}[request.param]()
+
+
+def test_limiter_is_per_worker_without_redis():
+    assert isinstance(homie.limiter_backend, homie.MemoryLimiterBackend)
+
+
+def test_bucket_admits_burst_then_asks_to_wait(limiter, client):
+    key = f"test:{client.user_id}"
+    rate, burst = homie._parse_rate('3/60')
+    assert [limiter.take(key, rate, burst) for _ in range(3)] == [0, 0, 0]
+    wait = limiter.take(key, rate, burst)
+    assert 0 < wait <= 20
+
+
+def test_leases_are_capped_released_and_expire(limiter, monkeypatch):
+    name = f"provider-{id(limiter)}"
+    assert limiter.acquire(name, 2, 'a')
+    assert limiter.acquire(name, 2, 'b')
+    assert not limiter.acquire(name, 2, 'c')
+    limiter.release(name, 'a')
+    assert limiter.acquire(name, 2, 'c')
+
+    # Leases of a worker that died are reclaimed once they expire
+    monkeypatch.setattr(homie, 'PROVIDER_LEASE_TTL', -1)
+    other = f"{name}-expired"
+    assert limiter.acquire(other, 1, 'x')
+    assert limiter.acquire(other, 1, 'y')
+
+
+def test_concurrent_acquires_never_exceed_the_limit(app, limiter):
+    name = f"provider-race-{id(limiter)}"
+    callers = 16
+    start = threading.Barrier(callers)
+    admitted = []
+
+    def acquire(token):
+        with app.app_context():
+            start.wait()
+            if limiter.acquire(name, 3, token):
+                admitted.append(token)
+            homie.db.session.remove()
+
+    threads = [threading.Thread(target=acquire, args=(f"t{i}",)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(admitted) == 3
+
+
+def test_rate_limited_requests_get_429_with_retry_after(client, monkeypatch):
+    monkeypatch.setitem(homie.RATE_LIMITS, 'chat', homie._parse_rate('2/3600'))
+    for _ in range(2):
+        assert client.post('/api/chat', json={'message': 'hey, how are you?'}).status_code == 200
+    response = client.post('/api/chat', json={'message': 'hey, how are you?'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def _message_count(app, user_id):
+    with app.app_context():
+        return homie.Conversation.query.filter_by(user_id=user_id).count()
+
+
+def test_repeated_key_replays_the_first_response(app, client):
+    body = {'message': 'had a really long day at work today'}
+    first = client.post('/api/chat', json=body, headers={'Idempotency-Key': 'turn-1'})
+    second = client.post('/api/chat', json=body, headers={'Idempotency-Key': 'turn-1'})
+    assert first.status_code == second.status_code == 200
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json() == first.get_json()
+    assert _message_count(app, client.user_id) == 2
+
+    reused = client.post('/api/chat', json={'message': 'something else'}, headers={'Idempotency-Key': 'turn-1'})
+    assert reused.status_code == 422
+    assert _message_count(app, client.user_id) == 2
+
+
+def test_json_fallback_replays_a_completed_stream(app, client):
+    body = {'message': 'had a really long day at work today'}
+    stream = client.post('/api/chat/stream', json=body, headers={'Idempotency-Key': 'turn-2'})
+    events = stream.get_data(as_text=True)
+    stream.close()
+    assert 'event: done' in events
+
+    fallback = client.post('/api/chat', json=body, headers={'Idempotency-Key': 'turn-2'})
+    assert fallback.status_code == 200
+    assert fallback.headers['Idempotent-Replayed'] == 'true'
+    assert fallback.get_json()['response']
+    assert 'status' not in fallback.get_json()
+    assert _message_count(app, client.user_id) == 2
@@ -0,0 +1,61 @@
+import pytest
+
+import app as homie
+
+
+def _snapshot(user_id):
+    stats = homie.db.session.get(homie.UserStats, user_id)
+    return {
+        'messages': homie.Conversation.query.filter_by(user_id=user_id).count(),
+        'stats': (stats.user_messages, stats.assistant_messages, stats.last_message_at),
+        'moods': homie.MoodDaily.query.filter_by(user_id=user_id).count(),
+        'history_etag': homie.collection_etag(user_id, 'history'),
+    }
+
+
+def test_unit_of_work_rolls_back_every_step(app, client, add_messages):
+    add_messages(client.user_id, 2)
+    with app.app_context():
+        before = _snapshot(client.user_id)
+
+        def fail():
+            raise RuntimeError("memory save failed")
+
+        turn = homie.ChatUnitOfWork(client.user_id)
+        turn.add_message(homie.Conversation(user_id=client.user_id, role='user', content='hello', detected_mood='happy'))
+        turn.add_message(homie.Conversation(user_id=client.user_id, role='assistant', content='hey!'))
+        turn.add(homie.save_memories, client.user_id, [{'type': 'family', 'content': 'Has a sister', 'importance': 6}])
+        turn.add(fail)
+        with pytest.raises(RuntimeError):
+            turn.commit()
+
+        assert _snapshot(client.user_id) == before
+        assert homie.UserMemory.query.filter_by(user_id=client.user_id).count() == 0
+        assert homie.db.session.get(homie.UserStats, client.user_id).memory_count == 0
+
+
+def test_provider_failure_saves_nothing(app, client, monkeypatch):
+    def unavailable(messages, safe_space_mode, stream):
+        raise RuntimeError("provider unavailable")
+    monkeypatch.setattr(homie, 'complete_chat', unavailable)
+
+    with app.app_context():
+        before = _snapshot(client.user_id)
+    response = client.post('/api/chat', json={'message': 'my sister is visiting this weekend'})
+    assert response.status_code == 502
+    with app.app_context():
+        assert _snapshot(client.user_id) == before
+
+
+def test_model_calls_run_without_a_database_connection(app, client, monkeypatch):
+    checked_out = []
+    find_memories = homie.find_memories
+
+    def watching(*args):
+        checked_out.append(homie.db.engine.pool.checkedout())
+        return find_memories(*args)
+    monkeypatch.setattr(homie, 'find_memories', watching)
+
+    response = client.post('/api/chat', json={'message': 'my sister is visiting this weekend'})
+    assert response.status_code == 200
+    assert checked_out == [0]
@@ -0,0 +1,56 @@
+import io
+import json
+import zipfile
+from datetime import datetime, timedelta
+
+import app as homie
+
+
+def _export(client):
+    response = client.get('/api/export')
+    data = response.get_data()
+    response.close()
+    assert response.status_code == 200
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    contents = {name: archive.read(name) for name in archive.namelist() if name != 'manifest.json'}
+    return data, contents, json.loads(archive.read('manifest.json'))
+
+
+def test_export_then_import_reproduces_the_account(app, client, add_messages, monkeypatch):
+    monkeypatch.setattr(homie, 'ARCHIVE_KEEP_HOT_ROWS', 4)
+    add_messages(client.user_id, 8, start=datetime.utcnow() - timedelta(days=200), mood='sad')
+    add_messages(client.user_id, 4, mood='happy')
+    with app.app_context():
+        assert homie.archive_user_conversations(client.user_id, datetime.utcnow() - timedelta(days=90)) == 8
+    client.post('/api/journal', json={'title': 'Tuesday', 'content': 'a calm evening', 'mood': 'good'})
+    client.post('/api/reminders', json={'title': 'Stretch', 'date': '2026-01-01', 'time': '09:00', 'repeat': 'daily'})
+
+    data, contents, manifest = _export(client)
+    assert manifest['counts']['conversations'] == 12
+
+    other = app.test_client()
+    name = f"importer_{manifest['username']}"
+    other.post('/signup', json={'username': name, 'email': f"{name}@test.local", 'password': 'pw'})
+    response = other.post('/api/import', data={'archive': (io.BytesIO(data), 'export.zip')},
+                          content_type='multipart/form-data')
+    assert response.status_code == 200, response.data
+    assert response.get_json()['imported']['conversations'] == 12
+    assert set(response.get_json()['skipped'].values()) == {0}
+
+    _, reimported, _ = _export(other)
+    assert reimported == contents
+    assert other.get('/api/history').get_json() == client.get('/api/history').get_json()
+
+    with other.session_transaction() as session:
+        other_id = session['user_id']
+    with app.app_context():
+        start = datetime.utcnow().date() - timedelta(days=400)
+        assert homie.mood_counts(other_id, start) == homie.mood_counts(client.user_id, start)
+        stats = homie.db.session.get(homie.UserStats, other_id)
+        assert (stats.user_messages, stats.assistant_messages, stats.journal_count) == (6, 6, 1)
+
+
+def test_import_rejects_archives_that_are_not_exports(client):
+    response = client.post('/api/import', data={'archive': (io.BytesIO(b'not a zip'), 'export.zip')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import app as homie
+
+
+def _history(client):
+    response = client.get('/api/history')
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_archive_round_trip_keeps_history_and_newest_rows_hot(app, client, add_messages):
+    add_messages(client.user_id, 150, start=datetime.utcnow() - timedelta(days=200))
+    before = _history(client)
+
+    with app.app_context():
+        stats_before = homie.compute_user_stats(client.user_id)
+        cutoff = datetime.utcnow() - timedelta(days=homie.CONVERSATION_ARCHIVE_DAYS)
+        assert homie.archive_user_conversations(client.user_id, cutoff) == 150 - homie.ARCHIVE_KEEP_HOT_ROWS
+        hot = homie.Conversation.query.filter_by(user_id=client.user_id).count()
+        stats_after = homie.compute_user_stats(client.user_id)
+
+    assert hot == homie.ARCHIVE_KEEP_HOT_ROWS
+    assert _history(client) == before
+    for name in homie.USER_STATS_FIELDS:
+        assert getattr(stats_after, name) == getattr(stats_before, name), name
+
+
+def test_cleared_history_is_hidden_before_the_purge_runs(app, client, add_messages):
+    add_messages(client.user_id, 150, start=datetime.utcnow() - timedelta(days=200))
+    with app.app_context():
+        homie.archive_user_conversations(client.user_id, datetime.utcnow() - timedelta(days=90))
+
+    assert client.post('/api/clear-history').status_code == 200
+    assert _history(client) == []
+    with app.app_context():
+        # Still in the database, only hidden
+        assert homie.Conversation.query.filter_by(user_id=client.user_id).count() > 0
+
+    add_messages(client.user_id, 2)
+    assert [row['content'] for row in _history(client)] == ['message 0', 'message 1']
+
+    with app.app_context():
+        homie.run_purge_jobs()
+        assert homie.Conversation.query.filter_by(user_id=client.user_id).count() == 2
+        assert homie.ConversationArchive.query.filter_by(user_id=client.user_id).count() == 0
+    assert len(_history(client)) == 2
+
+
+def _user_rows(user_id):
+    return {model.__name__: model.query.filter_by(user_id=user_id).count() for model in homie.USER_DATA_MODELS}
+
+
+def test_deleted_account_is_tombstoned_then_purged(app, client, add_messages, monkeypatch):
+    monkeypatch.setattr(homie, 'PURGE_BATCH_SIZE', 2)
+    monkeypatch.setattr(homie, 'PURGE_BATCH_PAUSE', 0)
+    add_messages(client.user_id, 4)
+    client.post('/api/chat', json={'message': 'my sister is visiting this weekend'},
+                headers={'Idempotency-Key': 'purge-test'})
+    client.post('/api/journal', json={'content': 'a calm evening', 'mood': 'good'})
+    with app.app_context():
+        username = homie.db.session.get(homie.User, client.user_id).username
+        owned = _user_rows(client.user_id)
+        assert all(owned[name] for name in ('Conversation', 'MoodDaily', 'UserStats', 'IdempotencyRecord'))
+
+    assert client.delete('/api/account').status_code == 200
+    assert client.get('/api/history').status_code == 401
+    login = app.test_client().post('/login', json={'email': f"{username}@test.local", 'password': 'pw'})
+    assert login.status_code != 200
+    # The username and email are free again straight away
+    again = app.test_client().post('/signup', json={'username': username, 'email': f"{username}@test.local",
+                                                    'password': 'pw'})
+    assert again.status_code == 200
+
+    with app.app_context():
+        homie.run_purge_jobs()
+        assert homie.db.session.get(homie.User, client.user_id) is None
+        assert set(_user_rows(client.user_id).values()) == {0}
+        # Every row went in a batch; none were left to the cascade on the user row
+        job = homie.PurgeJob.query.filter_by(user_id=client.user_id, kind='account').one()
+        assert job.deleted_rows == sum(owned.values())
+
+
+def test_etag_answers_304_until_the_collection_changes(client, add_messages):
+    first = client.get('/api/history')
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+
+    cached = client.get('/api/history', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    # Other collections don't invalidate the history validator
+    journal = client.get('/api/journal')
+    assert client.post('/api/journal', json={'content': 'a good day', 'mood': 'good'}).status_code == 200
+    assert client.get('/api/history', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/journal', headers={'If-None-Match': journal.headers['ETag']}).status_code == 200
+
+    add_messages(client.user_id, 2)
+    changed = client.get('/api/history', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert len(changed.get_json()) == 2
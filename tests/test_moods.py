@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import app as homie
+
+
+def _rollups(user_id):
+    start = datetime.utcnow().date() - timedelta(days=400)
+    return {source: homie.mood_counts(user_id, start, source=source) for source in ('chat', 'journal')}
+
+
+def test_mood_rollup_deltas_match_a_backfill(app, client, add_messages, monkeypatch):
+    monkeypatch.setattr(homie, 'ARCHIVE_KEEP_HOT_ROWS', 4)
+    add_messages(client.user_id, 6, start=datetime.utcnow() - timedelta(days=200), mood='sad')
+    add_messages(client.user_id, 4, mood='happy')
+    entry = client.post('/api/journal', json={'content': 'a calm evening', 'mood': 'good'}).get_json()['entry']
+    client.post('/api/journal', json={'content': 'another calm evening', 'mood': 'good'})
+    client.post('/api/journal', json={'content': 'long day', 'mood': 'tired'})
+    client.delete(f"/api/journal/{entry['id']}")
+
+    with app.app_context():
+        incremental = _rollups(client.user_id)
+        assert incremental == {'chat': {'sad': 3, 'happy': 2}, 'journal': {'good': 1, 'tired': 1}}
+
+        # Recounting from scratch, archive included, gives the same totals
+        assert homie.archive_user_conversations(client.user_id, datetime.utcnow() - timedelta(days=90)) == 6
+        homie.MoodDaily.query.filter_by(user_id=client.user_id).delete()
+        homie.MoodRollupState.query.filter_by(user_id=client.user_id).delete()
+        homie.db.session.commit()
+        homie.backfill_user_moods(client.user_id)
+        assert _rollups(client.user_id) == incremental
+
+    client.post('/api/clear-history')
+    with app.app_context():
+        assert _rollups(client.user_id) == {'chat': {}, 'journal': {'good': 1, 'tired': 1}}
+
+
+def test_remood_rewrites_archived_messages_and_their_rollups(app, client, add_messages, monkeypatch):
+    from create_tables import remood_archive_chunk, remood_chunk
+
+    monkeypatch.setattr(homie, 'ARCHIVE_KEEP_HOT_ROWS', 4)
+    add_messages(client.user_id, 6, start=datetime.utcnow() - timedelta(days=200), mood='sad')
+    add_messages(client.user_id, 4, mood='happy')
+    with app.app_context():
+        assert homie.archive_user_conversations(client.user_id, datetime.utcnow() - timedelta(days=90)) == 6
+        bounds = {model: homie.db.session.query(homie.func.min(model.id) - 1, homie.func.max(model.id))
+                  .filter(model.user_id == client.user_id).one()
+                  for model in (homie.Conversation, homie.ConversationArchive)}
+        homie.db.session.remove()
+
+    assert remood_chunk(*bounds[homie.Conversation], 0)['changed'] == 2
+    assert remood_archive_chunk(*bounds[homie.ConversationArchive], 0)['changed'] == 3
+
+    with app.app_context():
+        mood = homie.detect_mood('message 0')
+        rows = homie.load_conversation_rows(client.user_id)
+        assert {row['detected_mood'] for row in rows if row['role'] == 'user'} == {mood}
+        remooded = _rollups(client.user_id)
+        assert remooded['chat'] == {mood: 5}
+
+        homie.MoodDaily.query.filter_by(user_id=client.user_id).delete()
+        homie.MoodRollupState.query.filter_by(user_id=client.user_id).delete()
+        homie.db.session.commit()
+        homie.backfill_user_moods(client.user_id)
+        assert _rollups(client.user_id) == remooded
@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+import app as homie
+
+
+def _stats(stats):
+    return {name: getattr(stats, name) for name in homie.USER_STATS_FIELDS}
+
+
+def assert_stats_match_source(app, user_id):
+    with app.app_context():
+        stored = homie.db.session.get(homie.UserStats, user_id)
+        assert stored is not None
+        assert _stats(stored) == _stats(homie.compute_user_stats(user_id))
+
+
+def test_counters_follow_every_write_path(app, client, add_messages, monkeypatch):
+    monkeypatch.setattr(homie, 'ARCHIVE_KEEP_HOT_ROWS', 4)
+    add_messages(client.user_id, 6, start=datetime.utcnow() - timedelta(days=200))
+    assert client.post('/api/chat', json={'message': 'my sister is visiting this weekend'}).status_code == 200
+    assert_stats_match_source(app, client.user_id)
+
+    entry = client.post('/api/journal', json={'content': 'a calm evening', 'mood': 'good'}).get_json()['entry']
+    client.post('/api/journal', json={'content': 'long day', 'mood': 'tired'})
+    assert client.delete(f"/api/journal/{entry['id']}").status_code == 200
+    assert_stats_match_source(app, client.user_id)
+
+    with app.app_context():
+        assert homie.archive_user_conversations(client.user_id, datetime.utcnow() - timedelta(days=90)) == 4
+    assert_stats_match_source(app, client.user_id)
+
+    client.post('/api/clear-history')
+    assert_stats_match_source(app, client.user_id)
+    add_messages(client.user_id, 2)
+    assert_stats_match_source(app, client.user_id)
+
+
+def test_missing_stats_row_is_computed_and_saved(app, client, add_messages):
+    add_messages(client.user_id, 4)
+    with app.app_context():
+        homie.UserStats.query.filter_by(user_id=client.user_id).delete()
+        homie.db.session.commit()
+        stats = homie.get_user_stats(client.user_id)
+        assert stats.user_messages == stats.assistant_messages == 2
+        homie.db.session.remove()
+    assert_stats_match_source(app, client.user_id)